@@ -0,0 +1,313 @@
+
+from accord import exceptions
+from accord import common
+
+
+from concurrent import futures
+import threading
+import hashlib
+import fnmatch
+import json
+import mmap
+import os
+
+
+log = common.define_logging_facility()
+
+
+CHECKSUMS_FILE = 'checksums.json'
+ALGORITHM = 'sha256'
+# Files are hashed in pieces so a large file can be checked on many cores
+PIECE_SIZE = 64 * 1024 * 1024
+# Entries that are not part of the manifest. Chunks are named by their hash
+# and earlier archives have a checksum file of their own.
+EXCLUDES = [
+    CHECKSUMS_FILE,
+    'restore',
+    'chunks',
+    '*.checksums.json',
+    'ae5_backup_*.tar.gz',
+    'repos_db_backup_*.tar.gz'
+]
+
+
+class HashingWriter(object):
+    """
+    File like object that passes the data through to fileobj and hashes it
+    on the way, in pieces of PIECE_SIZE, so the file never has to be read
+    back to get its checksum.
+    """
+    def __init__(self, fileobj, piece_size=PIECE_SIZE):
+        self.fileobj = fileobj
+        self.piece_size = piece_size
+        self.pieces = []
+        self.size = 0
+        self.piece = hashlib.new(ALGORITHM)
+        self.piece_used = 0
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            take = min(len(view), self.piece_size - self.piece_used)
+            self.piece.update(view[:take])
+            self.piece_used += take
+            if self.piece_used == self.piece_size:
+                self.pieces.append(self.piece.hexdigest())
+                self.piece = hashlib.new(ALGORITHM)
+                self.piece_used = 0
+
+            view = view[take:]
+
+        self.fileobj.write(data)
+        self.size += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.size
+
+    def flush(self):
+        self.fileobj.flush()
+
+    def entry(self):
+        pieces = list(self.pieces)
+        if self.piece_used or not pieces:
+            pieces.append(self.piece.hexdigest())
+
+        return {'size': self.size, 'pieces': pieces}
+
+
+class ChecksumRecorder(object):
+    """
+    Collects the checksums of the files the backup stages write, which may
+    run at the same time.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def record(self, path, writer):
+        with self.lock:
+            self.entries[path] = writer.entry()
+
+    def recorded(self):
+        with self.lock:
+            return dict(self.entries)
+
+
+def is_excluded(relative_path, excludes=EXCLUDES):
+    return any(
+        fnmatch.fnmatch(relative_path, pattern) for pattern in excludes
+    )
+
+
+def hash_pieces(path, start=0, count=None, piece_size=PIECE_SIZE):
+    """
+    Hash count pieces of the file starting at piece start. The file is
+    memory mapped and hashlib drops the GIL on large buffers, so threads
+    hashing different pieces run on separate cores.
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return [hashlib.new(ALGORITHM).hexdigest()]
+
+    if count is None:
+        count = -(-size // piece_size)
+
+    pieces = []
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                for index in range(start, start + count):
+                    offset = index * piece_size
+                    pieces.append(
+                        hashlib.new(
+                            ALGORITHM,
+                            view[offset:offset + piece_size]
+                        ).hexdigest()
+                    )
+            finally:
+                view.release()
+
+    return pieces
+
+
+def file_entry(path):
+    return {'size': os.path.getsize(path), 'pieces': hash_pieces(path)}
+
+
+def read_checksums(checksums_path):
+    with open(checksums_path) as f:
+        checksums = json.load(f)
+
+    if checksums.get('algorithm') != ALGORITHM:
+        raise exceptions.ChecksumMismatch(
+            f'Unknown checksum algorithm in {checksums_path}'
+        )
+
+    return checksums
+
+
+def write_checksums(checksums_path, files, piece_size=PIECE_SIZE):
+    temp_path = f'{checksums_path}.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(
+            {
+                'algorithm': ALGORITHM,
+                'piece_size': piece_size,
+                'files': files
+            },
+            f,
+            indent=2,
+            sort_keys=True
+        )
+
+    os.rename(temp_path, checksums_path)
+
+
+def write_manifest(backup_directory, recorded, jobs=None):
+    """
+    Write the checksums of every file in the backup directory. Files that
+    were hashed as they were written are taken from recorded, files that
+    match the previous manifest by size and mtime keep their checksum, and
+    anything else, like the output of gravity or pg_dump, is hashed here.
+    """
+    checksums_path = f'{backup_directory}/{CHECKSUMS_FILE}'
+    previous = {}
+    if os.path.isfile(checksums_path):
+        try:
+            previous = read_checksums(checksums_path)['files']
+        except (ValueError, KeyError, exceptions.ChecksumMismatch):
+            log.warning(f'Ignoring unreadable {checksums_path}')
+
+    files = {}
+    to_hash = []
+    for dirpath, dirnames, filenames in os.walk(backup_directory):
+        relative = os.path.relpath(dirpath, backup_directory)
+        dirnames[:] = sorted(
+            d for d in dirnames
+            if not is_excluded(os.path.normpath(f'{relative}/{d}'))
+        )
+        for name in sorted(filenames):
+            path = os.path.normpath(f'{relative}/{name}')
+            full_path = f'{dirpath}/{name}'
+            if is_excluded(path) or os.path.islink(full_path):
+                continue
+
+            file_stat = os.stat(full_path)
+            old = previous.get(path)
+            if path in recorded:
+                files[path] = dict(
+                    recorded[path],
+                    mtime_ns=file_stat.st_mtime_ns
+                )
+            elif (
+                old is not None and old.get('size') == file_stat.st_size and
+                old.get('mtime_ns') == file_stat.st_mtime_ns
+            ):
+                files[path] = old
+            else:
+                to_hash.append(path)
+
+    with futures.ThreadPoolExecutor(
+        max_workers=jobs or os.cpu_count() or 1
+    ) as pool:
+        for path, entry in zip(to_hash, pool.map(
+            lambda p: file_entry(f'{backup_directory}/{p}'),
+            to_hash
+        )):
+            entry['mtime_ns'] = os.stat(
+                f'{backup_directory}/{path}'
+            ).st_mtime_ns
+            files[path] = entry
+
+    # Recorded files that were streamed elsewhere are still listed
+    for path, entry in recorded.items():
+        files.setdefault(path, dict(entry))
+
+    write_checksums(checksums_path, files)
+    log.info(
+        f'Wrote checksums for {len(files)} files, {len(to_hash)} of them '
+        'hashed after they were written'
+    )
+    return files
+
+
+def verify_files(directory, files, jobs=None, piece_size=PIECE_SIZE):
+    """
+    Check the files against their checksums with every piece of every file
+    handed out to the pool. Returns the paths that are missing or do not
+    match.
+    """
+    failed = set()
+    tasks = []
+    for path, entry in sorted(files.items()):
+        full_path = f'{directory}/{path}'
+        if (
+            not os.path.isfile(full_path) or
+            os.path.getsize(full_path) != entry['size']
+        ):
+            log.error(f'{path} is missing or has the wrong size')
+            failed.add(path)
+            continue
+
+        for index, expected in enumerate(entry['pieces']):
+            tasks.append((path, index, expected))
+
+    def check(task):
+        path, index, expected = task
+        actual = hash_pieces(f'{directory}/{path}', index, 1, piece_size)
+        return actual[0] == expected
+
+    with futures.ThreadPoolExecutor(
+        max_workers=jobs or os.cpu_count() or 1
+    ) as pool:
+        for (path, index, _), matched in zip(tasks, pool.map(check, tasks)):
+            if not matched and path not in failed:
+                log.error(f'{path} does not match at piece {index}')
+                failed.add(path)
+
+    return sorted(failed)
+
+
+def verify_checksums(checksums_path, directory=None, jobs=None):
+    """
+    Verify the files listed in the checksums file, relative to directory
+    or the directory of the checksums file, and raise ChecksumMismatch if
+    any of them do not match.
+    """
+    if not os.path.isfile(checksums_path):
+        raise exceptions.ChecksumMismatch(
+            f'Checksums file {checksums_path} was not found'
+        )
+
+    if directory is None:
+        directory = os.path.dirname(checksums_path) or '.'
+
+    checksums = read_checksums(checksums_path)
+    files = checksums['files']
+    failed = verify_files(
+        directory,
+        files,
+        jobs,
+        checksums.get('piece_size', PIECE_SIZE)
+    )
+    if failed:
+        raise exceptions.ChecksumMismatch(
+            f'{len(failed)} of {len(files)} files failed verification: '
+            f'{", ".join(failed)}'
+        )
+
+    log.info(f'Verified {len(files)} files against {checksums_path}')
+
+
+def archive_checksums_path(archive_path):
+    return f'{archive_path}.checksums.json'
+
+
+def write_archive_checksums(archive_path, writer):
+    write_checksums(
+        archive_checksums_path(archive_path),
+        {os.path.basename(archive_path): writer.entry()},
+        writer.piece_size
+    )
@@ -0,0 +1,321 @@
+
+from concurrent import futures
+import collections
+import hashlib
+import stat
+import gzip
+import json
+import time
+import zlib
+import os
+
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Chunk sizes for the content defined chunking
+MIN_SIZE = 256 * 1024
+AVG_BITS = 20
+MAX_SIZE = 4 * 1024 * 1024
+
+# Use the high bits so a boundary depends on the last 64 bytes of content
+MASK = ((1 << AVG_BITS) - 1) << (64 - AVG_BITS)
+GEAR = [
+    int.from_bytes(hashlib.sha256(bytes([i])).digest()[:8], 'big')
+    for i in range(256)
+]
+# Positions hashed at a time when numpy is available
+SCAN_STEP = 64 * 1024
+
+
+def scan_boundary(data, start, length, mask):
+    """
+    Same as the loop in find_boundary, but the hash is worked out for a block
+    of positions at a time with numpy. The hash at a position only depends on
+    the 64 bytes up to it, so each block rehashes the last 63 bytes of the
+    block before it.
+    """
+    gear = numpy.array(GEAR, dtype=numpy.uint64)
+    mask = numpy.uint64(mask)
+    view = numpy.frombuffer(data, dtype=numpy.uint8)
+    position = start
+    while position < length:
+        end = min(position + SCAN_STEP, length)
+        first = max(start, position - 63)
+        rolling = gear[view[first:end]]
+        # Double the bytes covered by each hash until it covers 64
+        shift = 1
+        while shift < 64:
+            rolling[shift:] += rolling[:-shift] << numpy.uint64(shift)
+            shift *= 2
+
+        found = numpy.flatnonzero((rolling[position - first:] & mask) == 0)
+        if len(found):
+            return position + int(found[0]) + 1
+
+        position = end
+
+    return length
+
+
+def find_boundary(data, min_size=MIN_SIZE, max_size=MAX_SIZE, mask=MASK):
+    """
+    Return the length of the next chunk in data using a gear rolling hash.
+    Bytes before min_size are skipped as a boundary cannot land there.
+    """
+    length = min(len(data), max_size)
+    if length <= min_size:
+        return length
+
+    if numpy is not None:
+        return scan_boundary(data, min_size, length, mask)
+
+    gear = GEAR
+    rolling = 0
+    for i in range(min_size, length):
+        rolling = ((rolling << 1) + gear[data[i]]) & 0xFFFFFFFFFFFFFFFF
+        if not rolling & mask:
+            return i + 1
+
+    return length
+
+
+def split_chunks(fileobj, min_size=MIN_SIZE, max_size=MAX_SIZE, mask=MASK):
+    # Never holds more than two maximum sized chunks in memory
+    buffer = b''
+    eof = False
+    while True:
+        while not eof and len(buffer) < max_size:
+            block = fileobj.read(max_size)
+            if block:
+                buffer += block
+            else:
+                eof = True
+
+        if not buffer:
+            return
+
+        boundary = find_boundary(buffer, min_size, max_size, mask)
+        yield buffer[:boundary]
+        buffer = buffer[boundary:]
+
+
+def unchanged(old, entry):
+    # Indexes from older versions have no inode so their files are read again
+    return old is not None and all(
+        old.get(key) == entry[key] for key in ['size', 'mtime', 'inode']
+    )
+
+
+class ChunkStore(object):
+    """
+    Content addressed store that keeps every unique chunk once under
+    <directory>/chunks and describes each snapshot with a small index under
+    <directory>/snapshots that references the chunks.
+    """
+    def __init__(self, directory, jobs=None):
+        self.directory = directory
+        self.chunk_directory = f'{directory}/chunks'
+        self.snapshot_directory = f'{directory}/snapshots'
+        self.jobs = jobs or os.cpu_count() or 1
+
+    def chunk_path(self, digest):
+        return f'{self.chunk_directory}/{digest[:2]}/{digest}'
+
+    def put_chunk(self, chunk):
+        """
+        Store the chunk if it is not already there. Returns the digest and the
+        number of bytes written to disk.
+        """
+        digest = hashlib.sha256(chunk).hexdigest()
+        chunk_path = self.chunk_path(digest)
+        if os.path.exists(chunk_path):
+            return digest, 0
+
+        os.makedirs(os.path.dirname(chunk_path), exist_ok=True)
+        data = zlib.compress(chunk)
+        # Write under a temporary name so a partial chunk is never visible
+        temp_path = f'{chunk_path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+
+        os.replace(temp_path, chunk_path)
+        return digest, len(data)
+
+    def get_chunk(self, digest):
+        with open(self.chunk_path(digest), 'rb') as f:
+            return zlib.decompress(f.read())
+
+    def store_file(self, path):
+        chunks = []
+        written = 0
+        with open(path, 'rb') as f:
+            for chunk in split_chunks(f):
+                digest, chunk_written = self.put_chunk(chunk)
+                chunks.append(digest)
+                written += chunk_written
+
+        return chunks, written
+
+    def walk(self, source_directory, top, excludes=()):
+        # Yield index entries without chunks in top down order
+        for dirpath, dirnames, filenames in os.walk(
+            f'{source_directory}/{top}'
+        ):
+            relative = os.path.relpath(dirpath, source_directory)
+            dirnames[:] = sorted(
+                d for d in dirnames if f'{relative}/{d}' not in excludes
+            )
+            yield self.entry(dirpath, relative)
+            for name in sorted(filenames + dirnames):
+                path = f'{relative}/{name}'
+                if path in excludes:
+                    continue
+
+                file_stat = os.lstat(f'{dirpath}/{name}')
+                if stat.S_ISDIR(file_stat.st_mode):
+                    continue
+
+                yield self.entry(f'{dirpath}/{name}', path, file_stat)
+
+    def entry(self, full_path, path, file_stat=None):
+        if file_stat is None:
+            file_stat = os.lstat(full_path)
+
+        entry = {
+            'path': path,
+            'mode': stat.S_IMODE(file_stat.st_mode),
+            'uid': file_stat.st_uid,
+            'gid': file_stat.st_gid,
+            'mtime': file_stat.st_mtime_ns,
+            'size': file_stat.st_size,
+            'inode': file_stat.st_ino
+        }
+        if stat.S_ISDIR(file_stat.st_mode):
+            entry['type'] = 'directory'
+        elif stat.S_ISLNK(file_stat.st_mode):
+            entry['type'] = 'symlink'
+            entry['target'] = os.readlink(full_path)
+        elif stat.S_ISREG(file_stat.st_mode):
+            entry['type'] = 'file'
+        else:
+            entry['type'] = 'other'
+
+        return entry
+
+    def read_files(self, index_path):
+        # Map the path of each file in the index to its entry
+        files = {}
+        with gzip.open(index_path, 'rt') as index:
+            for line in index:
+                entry = json.loads(line)
+                if entry['type'] == 'file':
+                    files[entry['path']] = entry
+
+        return files
+
+    def snapshot(self, source_directory, top, prefix, excludes=()):
+        """
+        Chunk every file under source_directory/top into the store and write
+        the index. Files are chunked in a process pool with a bounded number
+        of files in flight. The chunks from the latest snapshot are reused
+        when the size, mtime and inode have not changed so unchanged files
+        are not read. Returns the index path and the run statistics.
+        """
+        os.makedirs(self.snapshot_directory, exist_ok=True)
+        latest = self.latest_snapshot(prefix)
+        previous = {} if latest is None else self.read_files(latest)
+        index_name = f'{prefix}_{time.strftime("%Y%m%d-%H%M%S")}.json.gz'
+        index_path = f'{self.snapshot_directory}/{index_name}'
+        stats = {'files': 0, 'reused': 0, 'bytes_read': 0, 'bytes_written': 0}
+        pending = collections.deque()
+
+        def write_entry(index, entry, future=None):
+            if future is not None:
+                entry['chunks'], written = future.result()
+                stats['bytes_read'] += entry['size']
+                stats['bytes_written'] += written
+
+            if entry['type'] == 'file':
+                stats['files'] += 1
+
+            index.write(json.dumps(entry, separators=(',', ':')) + '\n')
+
+        with futures.ProcessPoolExecutor(max_workers=self.jobs) as pool:
+            with gzip.open(f'{index_path}.tmp', 'wt') as index:
+                for entry in self.walk(source_directory, top, excludes):
+                    if entry['type'] == 'other':
+                        continue
+
+                    future = None
+                    if entry['type'] == 'file':
+                        old = previous.get(entry['path'])
+                        if unchanged(old, entry):
+                            entry['chunks'] = old['chunks']
+                            stats['reused'] += 1
+                        else:
+                            future = pool.submit(
+                                self.store_file,
+                                f'{source_directory}/{entry["path"]}'
+                            )
+
+                    pending.append((entry, future))
+                    while len(pending) > self.jobs * 4:
+                        write_entry(index, *pending.popleft())
+
+                while pending:
+                    write_entry(index, *pending.popleft())
+
+        os.replace(f'{index_path}.tmp', index_path)
+        return index_path, stats
+
+    def latest_snapshot(self, prefix):
+        if not os.path.isdir(self.snapshot_directory):
+            return None
+
+        snapshots = sorted(
+            s for s in os.listdir(self.snapshot_directory)
+            if s.startswith(f'{prefix}_') and s.endswith('.json.gz')
+        )
+        if not snapshots:
+            return None
+
+        return f'{self.snapshot_directory}/{snapshots[-1]}'
+
+    def restore(self, index_path, to_directory):
+        directories = []
+        set_owner = os.geteuid() == 0
+        with gzip.open(index_path, 'rt') as index:
+            for line in index:
+                entry = json.loads(line)
+                path = f'{to_directory}/{entry["path"]}'
+                if entry['type'] == 'directory':
+                    os.makedirs(path, exist_ok=True)
+                    directories.append((path, entry))
+                    continue
+
+                if os.path.lexists(path):
+                    os.remove(path)
+
+                if entry['type'] == 'symlink':
+                    os.symlink(entry['target'], path)
+                else:
+                    with open(path, 'wb') as f:
+                        for digest in entry['chunks']:
+                            f.write(self.get_chunk(digest))
+
+                    os.chmod(path, entry['mode'])
+                    os.utime(path, ns=(entry['mtime'], entry['mtime']))
+
+                if set_owner:
+                    os.lchown(path, entry['uid'], entry['gid'])
+
+        # Directory metadata is set last as creating files changes the mtime
+        for path, entry in reversed(directories):
+            os.chmod(path, entry['mode'])
+            os.utime(path, ns=(entry['mtime'], entry['mtime']))
+            if set_owner:
+                os.lchown(path, entry['uid'], entry['gid'])
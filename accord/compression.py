@@ -0,0 +1,381 @@
+
+from accord import exceptions
+from accord import checksum
+
+
+from concurrent import futures
+import collections
+import tarfile
+import fnmatch
+import gzip
+import zlib
+import os
+
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+COMPRESSION_TYPES = ['gzip', 'pigz-style-parallel', 'zstd', 'none']
+EXTENSIONS = {
+    'gzip': '.tar.gz',
+    'pigz-style-parallel': '.tar.gz',
+    'zstd': '.tar.zst',
+    'none': '.tar'
+}
+
+SUFFIXES = {
+    'gzip': '.gz',
+    'pigz-style-parallel': '.gz',
+    'zstd': '.zst',
+    'none': ''
+}
+
+# Size of the blocks handed to the compression workers
+BLOCK_SIZE = 4 * 1024 * 1024
+
+# Files with these extensions are already compressed and gain nothing more
+COMPRESSED_SUFFIXES = [
+    '.gz', '.tgz', '.zst', '.bz2', '.xz', '.zip', '.lz4', '.7z'
+]
+
+
+def archive_name(base_name, compression):
+    return f'{base_name}{EXTENSIONS[compression]}'
+
+
+def other_archives(base_name, compression):
+    # Archive names for the base name with every other known extension
+    expected = archive_name(base_name, compression)
+    return [
+        f'{base_name}{extension}'
+        for extension in dict.fromkeys(EXTENSIONS.values())
+        if f'{base_name}{extension}' != expected
+    ]
+
+
+def remove_other_archives(directory, base_name, compression):
+    """
+    Remove the archives for the base name that were written with another
+    compression, so a stale one is never restored instead of the new one.
+    """
+    for name in other_archives(base_name, compression):
+        if os.path.isfile(f'{directory}/{name}'):
+            os.remove(f'{directory}/{name}')
+
+
+def find_archive(directory, base_name, compression='gzip'):
+    """
+    Return the name of the archive in the directory for the base name. If
+    there is more than one extension the newest archive is used, with the
+    requested compression preferred when they are the same age.
+    """
+    expected = archive_name(base_name, compression)
+    found = None
+    newest = None
+    for name in [expected] + other_archives(base_name, compression):
+        path = f'{directory}/{name}'
+        if not os.path.isfile(path):
+            continue
+
+        modified = os.path.getmtime(path)
+        if newest is None or modified > newest:
+            found = name
+            newest = modified
+
+    if found is None:
+        return expected
+
+    return found
+
+
+def compressed_name(name, compression):
+    return f'{name}{SUFFIXES[compression]}'
+
+
+def find_compressed(directory, name):
+    # Return the compressed file name for name if there is one
+    for suffix in ['.gz', '.zst']:
+        if os.path.isfile(f'{directory}/{name}{suffix}'):
+            return f'{name}{suffix}'
+
+    return None
+
+
+def open_reader(path):
+    """
+    Open the file for reading and decompress it based on the extension
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    elif path.endswith('.zst'):
+        if zstandard is None:
+            raise exceptions.CompressionNotAvailable(
+                'zstd compression requires the zstandard package'
+            )
+
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'))
+
+    return open(path, 'rb')
+
+
+def gzip_compressor(level):
+    # wbits of 31 gives a complete gzip member with a zeroed mtime
+    return zlib.compressobj(level, zlib.DEFLATED, 31)
+
+
+def compress_block(block, level=6):
+    compressor = gzip_compressor(level)
+    return compressor.compress(block) + compressor.flush()
+
+
+class ParallelGzipWriter(object):
+    """
+    File like object that splits the stream into blocks and compresses each
+    block as its own gzip member in a process pool. Concatenated members are
+    a valid gzip stream, so the output can be read with gzip or tar -xzf.
+    """
+    def __init__(self, fileobj, level=6, jobs=None, block_size=BLOCK_SIZE):
+        self.fileobj = fileobj
+        self.level = level
+        self.jobs = jobs or os.cpu_count() or 1
+        self.block_size = block_size
+        self.buffer = bytearray()
+        self.pending = collections.deque()
+        self.blocks_written = 0
+        self.pool = futures.ProcessPoolExecutor(max_workers=self.jobs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, data):
+        self.buffer.extend(data)
+        while len(self.buffer) >= self.block_size:
+            block = bytes(self.buffer[:self.block_size])
+            del self.buffer[:self.block_size]
+            self.submit(block)
+
+        return len(data)
+
+    def submit(self, block):
+        # Keep the amount of data in flight bounded by the worker count
+        while len(self.pending) >= self.jobs * 2:
+            self.write_next()
+
+        self.pending.append(
+            self.pool.submit(compress_block, block, self.level)
+        )
+
+    def write_next(self):
+        self.fileobj.write(self.pending.popleft().result())
+        self.blocks_written += 1
+
+    def flush(self):
+        while self.pending:
+            self.write_next()
+
+        self.fileobj.flush()
+
+    def close(self):
+        if self.pool is None:
+            return
+
+        try:
+            if self.buffer or self.blocks_written + len(self.pending) == 0:
+                # Always emit at least one member so the output is valid
+                self.submit(bytes(self.buffer))
+                self.buffer = bytearray()
+
+            self.flush()
+        finally:
+            self.pool.shutdown()
+            self.pool = None
+
+
+class GzipMemberWriter(object):
+    """
+    File like object that writes a gzip stream, starting a new member each
+    time the compression level changes. Level 0 stores the data in deflate
+    stored blocks, so data that is already compressed costs next to nothing
+    and the output is still a single stream that tar -xzf can read.
+    """
+    def __init__(self, fileobj, level=6):
+        self.fileobj = fileobj
+        self.level = level
+        self.compressor = None
+        self.position = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def set_level(self, level):
+        if level == self.level:
+            return
+
+        self.finish_member()
+        self.level = level
+
+    def finish_member(self):
+        if self.compressor is not None:
+            self.fileobj.write(self.compressor.flush())
+            self.compressor = None
+
+    def write(self, data):
+        if self.compressor is None:
+            self.compressor = gzip_compressor(self.level)
+
+        self.fileobj.write(self.compressor.compress(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        # tarfile keeps its offsets in the uncompressed stream
+        return self.position
+
+    def flush(self):
+        self.fileobj.flush()
+
+    def close(self):
+        if self.fileobj is None:
+            return
+
+        if self.position == 0:
+            self.write(b'')
+
+        self.finish_member()
+        self.fileobj.flush()
+        self.fileobj = None
+
+
+def is_compressed(name):
+    return any(name.lower().endswith(suffix) for suffix in COMPRESSED_SUFFIXES)
+
+
+def add_file_data(tar, tarinfo, path):
+    """
+    Add a regular file to tar the same way TarFile.addfile does, but copy
+    the data in BLOCK_SIZE reads and writes instead of the small buffer
+    tarfile uses.
+    """
+    header = tarinfo.tobuf(tar.format, tar.encoding, tar.errors)
+    tar.fileobj.write(header)
+    remaining = tarinfo.size
+    with open(path, 'rb') as source:
+        while remaining:
+            data = source.read(min(BLOCK_SIZE, remaining))
+            if not data:
+                raise OSError(f'{path} shrank while it was being archived')
+
+            tar.fileobj.write(data)
+            remaining -= len(data)
+
+    padding = -tarinfo.size % tarfile.BLOCKSIZE
+    tar.fileobj.write(tarfile.NUL * padding)
+    tar.offset += len(header) + tarinfo.size + padding
+    tar.members.append(tarinfo)
+
+
+def write_tree_archive(archive_path, directory, arcname, excludes=None,
+                       level=6):
+    """
+    Write directory to archive_path as a .tar.gz under arcname. Files that
+    are already compressed are stored without compressing them again, and
+    top level entries matching any of the exclude patterns are skipped.
+    Returns the HashingWriter that the archive was checksummed with.
+    """
+    excludes = excludes or []
+    archive_path = os.path.abspath(archive_path)
+    with open(archive_path, 'wb', buffering=BLOCK_SIZE) as f:
+        hashing = checksum.HashingWriter(f)
+        with GzipMemberWriter(hashing, level=level) as writer:
+            with tarfile.open(fileobj=writer, mode='w') as tar:
+                tar.add(directory, arcname=arcname, recursive=False)
+                for dirpath, dirnames, filenames in os.walk(directory):
+                    relative = os.path.relpath(dirpath, directory)
+                    names = sorted(dirnames + filenames)
+                    dirnames.sort()
+                    for name in names:
+                        path = os.path.join(dirpath, name)
+                        if os.path.abspath(path) == archive_path or (
+                            relative == '.' and any(
+                                fnmatch.fnmatch(name, e) for e in excludes
+                            )
+                        ):
+                            if name in dirnames:
+                                dirnames.remove(name)
+
+                            continue
+
+                        writer.set_level(0 if is_compressed(name) else level)
+                        tarinfo = tar.gettarinfo(
+                            path,
+                            arcname=os.path.normpath(
+                                os.path.join(arcname, relative, name)
+                            )
+                        )
+                        if tarinfo is None:
+                            # Sockets and the like cannot be archived
+                            continue
+                        elif tarinfo.isreg():
+                            add_file_data(tar, tarinfo, path)
+                        else:
+                            tar.addfile(tarinfo)
+
+    return hashing
+
+
+class NoCompressionWriter(object):
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, data):
+        return self.fileobj.write(data)
+
+    def flush(self):
+        self.fileobj.flush()
+
+    def close(self):
+        self.fileobj.flush()
+
+
+def open_writer(fileobj, compression, jobs=None, level=6):
+    """
+    Wrap a binary file object with a writer for the requested compression
+    """
+    if compression == 'gzip':
+        return gzip.GzipFile(
+            fileobj=fileobj,
+            mode='wb',
+            compresslevel=level,
+            mtime=0
+        )
+    elif compression == 'pigz-style-parallel':
+        return ParallelGzipWriter(fileobj, level=level, jobs=jobs)
+    elif compression == 'zstd':
+        if zstandard is None:
+            raise exceptions.CompressionNotAvailable(
+                'zstd compression requires the zstandard package'
+            )
+
+        compressor = zstandard.ZstdCompressor(threads=-1)
+        return compressor.stream_writer(fileobj, closefd=False)
+    elif compression == 'none':
+        return NoCompressionWriter(fileobj)
+
+    raise exceptions.CompressionNotAvailable(
+        f'Unknown compression type {compression}'
+    )
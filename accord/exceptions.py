@@ -28,3 +28,31 @@ class SecretNotFound(Exception):
 
 class NotValidTarfile(Exception):
     pass
+
+
+class CompressionNotAvailable(Exception):
+    pass
+
+
+class NoStorageSnapshot(Exception):
+    pass
+
+
+class InvalidStageGraph(Exception):
+    pass
+
+
+class PodWaitTimeout(Exception):
+    pass
+
+
+class UnableToCaptureDeployments(Exception):
+    pass
+
+
+class PsqlCommandFailed(Exception):
+    pass
+
+
+class ChecksumMismatch(Exception):
+    pass
@@ -0,0 +1,288 @@
+
+from accord import compression
+from accord import exceptions
+from accord import common
+
+
+from concurrent import futures
+import collections
+import functools
+import threading
+import tarfile
+import shutil
+import queue
+import grp
+import pwd
+import os
+
+
+log = common.define_logging_facility()
+
+
+# Files up to this size are handed to the writers, larger ones are copied
+# straight from the stream
+SMALL_FILE_SIZE = 1024 * 1024
+# Bounds on the file data that has been read but not written yet
+MAX_PENDING_BYTES = 256 * 1024 * 1024
+MAX_PENDING_FILES = 10000
+# Decompressed blocks held ahead of the tar reader
+PREFETCH_BLOCKS = 8
+# Never follow or reuse whatever is at the path already
+FILE_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_CLOEXEC
+
+
+class PrefetchReader(object):
+    """
+    File like object that reads and decompresses the archive in a thread of
+    its own, so decompression runs alongside the tar parsing and the
+    writers. Only a few blocks are held in memory at any time.
+    """
+    def __init__(self, path, block_size=compression.BLOCK_SIZE,
+                 blocks=PREFETCH_BLOCKS):
+        self.source = compression.open_reader(path)
+        self.block_size = block_size
+        self.blocks = queue.Queue(maxsize=blocks)
+        self.buffer = b''
+        self.offset = 0
+        self.done = False
+        self.error = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.fill, daemon=True)
+        self.thread.start()
+
+    def fill(self):
+        try:
+            while not self.stopped.is_set():
+                block = self.source.read(self.block_size)
+                self.put(block)
+                if not block:
+                    return
+        except Exception as e:
+            self.error = e
+            self.put(b'')
+
+    def put(self, block):
+        # Stop waiting on a full queue once the reader has been closed
+        while not self.stopped.is_set():
+            try:
+                self.blocks.put(block, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def read(self, size=-1):
+        chunks = []
+        while size != 0 and not self.done:
+            if self.offset >= len(self.buffer):
+                self.buffer = self.blocks.get()
+                self.offset = 0
+                if not self.buffer:
+                    self.done = True
+                    break
+
+            if size < 0:
+                end = len(self.buffer)
+            else:
+                end = min(len(self.buffer), self.offset + size)
+                size -= end - self.offset
+
+            chunks.append(self.buffer[self.offset:end])
+            self.offset = end
+
+        if self.error is not None:
+            raise self.error
+
+        return b''.join(chunks)
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        self.source.close()
+
+
+@functools.lru_cache(maxsize=None)
+def owner_ids(uname, gname, uid, gid):
+    # Names win over the ids in the archive, the same as tar
+    try:
+        uid = pwd.getpwnam(uname).pw_uid
+    except KeyError:
+        pass
+
+    try:
+        gid = grp.getgrnam(gname).gr_gid
+    except KeyError:
+        pass
+
+    return uid, gid
+
+
+def set_metadata(member, path):
+    if os.geteuid() == 0:
+        os.lchown(
+            path,
+            *owner_ids(member.uname, member.gname, member.uid, member.gid)
+        )
+
+    if not member.issym():
+        os.chmod(path, member.mode)
+
+    os.utime(path, (member.mtime, member.mtime), follow_symlinks=False)
+
+
+def create_file(path):
+    try:
+        return os.open(path, FILE_FLAGS, 0o600)
+    except FileExistsError:
+        # Replace what is there, as tar does
+        os.unlink(path)
+        return os.open(path, FILE_FLAGS, 0o600)
+
+
+def write_file(member, path, data):
+    descriptor = create_file(path)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(descriptor, view):]
+    finally:
+        os.close(descriptor)
+
+    set_metadata(member, path)
+
+
+class Extractor(object):
+    """
+    Extract the members of a tar stream under to_directory. Directories,
+    links and large files are made as they are read, while small files are
+    written and have their metadata set by a pool of writers. Directory
+    metadata is set at the end so creating files does not change it.
+    """
+    def __init__(self, tar, to_directory, jobs=None):
+        self.tar = tar
+        self.to_directory = to_directory
+        self.jobs = jobs
+        self.pending = collections.deque()
+        self.pending_bytes = 0
+        self.directories = []
+        # Parents already made for members whose directory was not listed
+        self.parents = set()
+        self.files = 0
+        self.bytes = 0
+
+    def run(self):
+        with futures.ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            try:
+                while True:
+                    member = self.tar.next()
+                    if member is None:
+                        break
+
+                    # Members are not needed again so do not let them pile up
+                    self.tar.members = []
+                    self.extract(pool, member)
+            finally:
+                self.wait_pending()
+
+        # Deepest first so a parent is never changed after it is set
+        for member, path in reversed(self.directories):
+            set_metadata(member, path)
+
+        log.info(f'Extracted {self.files} files to {self.to_directory}')
+
+    def target_path(self, name):
+        if os.path.isabs(name) or '..' in name.split('/'):
+            raise exceptions.NotValidTarfile(
+                f'{name} would be extracted outside of {self.to_directory}'
+            )
+
+        return os.path.join(self.to_directory, os.path.normpath(name))
+
+    def extract(self, pool, member):
+        path = self.target_path(member.name)
+        if member.isdir():
+            os.makedirs(path, exist_ok=True)
+            self.directories.append((member, path))
+            return
+
+        # Archives made with --no-recursion need not list the parents
+        self.make_parent(path)
+        if member.isfile() and member.size <= SMALL_FILE_SIZE:
+            data = self.tar.extractfile(member).read()
+            self.wait_pending(len(data))
+            self.pending.append(
+                (pool.submit(write_file, member, path, data), len(data))
+            )
+            self.pending_bytes += len(data)
+            self.files += 1
+            self.bytes += len(data)
+        elif member.isfile():
+            descriptor = create_file(path)
+            with os.fdopen(descriptor, 'wb') as f:
+                shutil.copyfileobj(
+                    self.tar.extractfile(member),
+                    f,
+                    compression.BLOCK_SIZE
+                )
+
+            set_metadata(member, path)
+            self.files += 1
+            self.bytes += member.size
+        elif member.issym():
+            if os.path.lexists(path):
+                os.unlink(path)
+
+            os.symlink(member.linkname, path)
+            set_metadata(member, path)
+        elif member.islnk():
+            # The target may still be with the writers
+            self.wait_pending()
+            if os.path.lexists(path):
+                os.unlink(path)
+
+            os.link(self.target_path(member.linkname), path)
+        else:
+            log.warning(f'Skipping {member.name} as it is not a file')
+
+    def make_parent(self, path):
+        parent = os.path.dirname(path)
+        if parent not in self.parents:
+            os.makedirs(parent, exist_ok=True)
+            self.parents.add(parent)
+
+    def wait_pending(self, incoming=None):
+        """
+        Wait for the oldest writes until there is room for incoming more
+        bytes, or for all of them when incoming is None. Errors from the
+        writers are raised here.
+        """
+        while self.pending and (
+            incoming is None or
+            self.pending_bytes + incoming > MAX_PENDING_BYTES or
+            len(self.pending) >= MAX_PENDING_FILES
+        ):
+            future, size = self.pending.popleft()
+            self.pending_bytes -= size
+            future.result()
+
+
+def extract_archive(archive_path, to_directory, jobs=None, sync=True):
+    """
+    Extract the archive straight from where it is into to_directory. Files
+    are not synced one by one, instead the filesystems are synced once at
+    the end unless sync is False, so a caller extracting several archives
+    can sync once after the last. Returns the number of files and bytes
+    that were written.
+    """
+    reader = PrefetchReader(archive_path)
+    try:
+        # Let tarfile detect any compression that the extension did not
+        with tarfile.open(fileobj=reader, mode='r|*') as tar:
+            extractor = Extractor(tar, to_directory, jobs)
+            extractor.run()
+    finally:
+        reader.close()
+
+    if sync:
+        os.sync()
+
+    return extractor.files, extractor.bytes
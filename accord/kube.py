@@ -0,0 +1,286 @@
+
+from accord import exceptions
+from accord import common
+from accord import trace
+
+
+import subprocess
+import select
+import codecs
+import json
+import time
+import os
+
+
+log = common.define_logging_facility()
+
+
+DEFAULT_TIMEOUT = 900
+INITIAL_BACKOFF = 1
+MAX_BACKOFF = 30
+READ_SIZE = 64 * 1024
+SESSION_PREFIXES = ['anaconda-app-', 'anaconda-session-']
+
+
+class KubeClient(object):
+    """
+    Wrapper around kubectl that asks for JSON and parses it once. Lookups
+    are cached for the run by kind and namespace, and every mutating call
+    made through run() drops the cache so the next lookup is fresh.
+    """
+    def __init__(self, kubectl, metrics=None):
+        self.kubectl = kubectl
+        self.metrics = metrics
+        self.cache = {}
+
+    def count_call(self):
+        if self.metrics is not None:
+            self.metrics.add(subprocesses=1)
+
+    def objects(self, kind, namespace='default'):
+        """
+        Returns a dict of object name to object for the kind in namespace
+        """
+        key = (kind, namespace)
+        if key not in self.cache:
+            self.count_call()
+            command = ['get', kind, '--namespace', namespace, '-o', 'json']
+            with trace.command_span(['kubectl'] + command):
+                output = self.kubectl(*command)
+
+            self.cache[key] = {
+                item['metadata']['name']: item
+                for item in json.loads(str(output))['items']
+            }
+
+        return self.cache[key]
+
+    def get(self, kind, name, namespace='default'):
+        return self.objects(kind, namespace).get(name)
+
+    def run(self, *args, **kwargs):
+        # Anything run here may change the cluster so nothing cached is kept
+        self.count_call()
+        try:
+            with trace.command_span(['kubectl'] + list(args)):
+                return self.kubectl(*args, **kwargs)
+        finally:
+            self.invalidate()
+
+    def invalidate(self, kind=None):
+        if kind is None:
+            self.cache.clear()
+            return
+
+        for key in [k for k in self.cache if k[0] == kind]:
+            del self.cache[key]
+
+
+def is_deleting(pod):
+    return bool(pod['metadata'].get('deletionTimestamp'))
+
+
+def pod_phase(pod):
+    return pod.get('status', {}).get('phase')
+
+
+def postgres_running(pods):
+    return any(
+        'postgres' in name and pod_phase(pod) == 'Running'
+        and not is_deleting(pod)
+        for name, pod in pods.items()
+    )
+
+
+def postgres_stopped(pods):
+    # Terminating pods still count as they may be writing to pgdata
+    return not any('postgres' in name for name in pods)
+
+
+def is_session(name):
+    return any(prefix in name for prefix in SESSION_PREFIXES)
+
+
+def sessions_stopped(pods):
+    return not any(is_session(name) for name in pods)
+
+
+def all_pods_running(pods):
+    return bool(pods) and all(
+        pod_phase(pod) in ['Running', 'Succeeded'] and not is_deleting(pod)
+        for pod in pods.values()
+    )
+
+
+def decode_objects(buffer):
+    """
+    Split the complete JSON documents off the front of buffer, as kubectl
+    writes one document after another on a watch. Returns the documents
+    and the partial text that is left over.
+    """
+    decoder = json.JSONDecoder()
+    objects = []
+    while True:
+        buffer = buffer.lstrip()
+        if not buffer:
+            break
+
+        try:
+            document, end = decoder.raw_decode(buffer)
+        except ValueError:
+            break
+
+        objects.append(document)
+        buffer = buffer[end:]
+
+    return objects, buffer
+
+
+def apply_event(pods, event):
+    # Without --output-watch-events kubectl writes the bare object
+    if 'object' in event and 'type' in event:
+        event_type = event['type']
+        pod = event['object']
+    else:
+        event_type = 'MODIFIED'
+        pod = event
+
+    if pod.get('kind') != 'Pod':
+        return
+
+    name = pod['metadata']['name']
+    if event_type == 'DELETED':
+        pods.pop(name, None)
+    else:
+        pods[name] = pod
+
+
+def may_be_deleted(event):
+    # A bare object for a terminating pod may be the last one seen before it
+    # is gone, as the object does not say which
+    return (
+        'type' not in event and event.get('kind') == 'Pod'
+        and is_deleting(event)
+    )
+
+
+def list_pods(namespace):
+    command = [
+        'kubectl', 'get', 'pods', '--namespace', namespace, '-o', 'json'
+    ]
+    with trace.command_span(command):
+        results = subprocess.run(command, stdout=subprocess.PIPE, check=True)
+
+    return {
+        pod['metadata']['name']: pod
+        for pod in json.loads(results.stdout)['items']
+    }
+
+
+def open_watch(namespace):
+    # --output-watch-events needs kubectl 1.16 so only the objects are read
+    return subprocess.Popen(
+        [
+            'kubectl', 'get', 'pods', '--namespace', namespace, '--watch',
+            '-o', 'json'
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL
+    )
+
+
+def follow_watch(watch, pods, condition, deadline, namespace='default'):
+    """
+    Apply the watch events to pods until condition is met, the stream ends
+    or the deadline passes. A pod that is deleted shows up as the object
+    with its deletion timestamp, so the pods are listed again when one of
+    those is seen. Returns whether the condition was met and whether any
+    events were received.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    descriptor = watch.stdout.fileno()
+    buffer = ''
+    received = False
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False, received
+
+        readable, _, _ = select.select([descriptor], [], [], remaining)
+        if not readable:
+            return False, received
+
+        data = os.read(descriptor, READ_SIZE)
+        if not data:
+            return False, received
+
+        events, buffer = decode_objects(buffer + decoder.decode(data))
+        for event in events:
+            received = True
+            apply_event(pods, event)
+
+        if not events:
+            continue
+
+        if not condition(pods) and any(may_be_deleted(e) for e in events):
+            pods.clear()
+            pods.update(list_pods(namespace))
+
+        if condition(pods):
+            return True, received
+
+
+def wait_for_pods(condition, namespace='default', timeout=DEFAULT_TIMEOUT,
+                  description='pods'):
+    """
+    Wait until condition returns True for the pods in the namespace. The
+    condition is given a dict of pod name to pod object and is checked on
+    every change seen by a single kubectl watch, so this returns as soon as
+    the change lands. When the watch drops it is reopened with an
+    exponential backoff, and PodWaitTimeout is raised after timeout seconds.
+    """
+    deadline = time.monotonic() + timeout
+    backoff = INITIAL_BACKOFF
+    while True:
+        # Open the watch before listing so no change is missed in between
+        watch = open_watch(namespace)
+        try:
+            pods = list_pods(namespace)
+            if condition(pods):
+                return
+
+            with trace.span(f'wait for {description}', 'wait'):
+                met, received = follow_watch(
+                    watch,
+                    pods,
+                    condition,
+                    deadline,
+                    namespace
+                )
+
+            if met:
+                return
+        except subprocess.CalledProcessError as e:
+            log.warning(f'Unable to list pods: {e}')
+            received = False
+        finally:
+            if watch.poll() is None:
+                watch.kill()
+
+            watch.stdout.close()
+            watch.wait()
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            log.error(f'Timed out waiting for {description}')
+            raise exceptions.PodWaitTimeout(
+                f'Timed out after {timeout} seconds waiting for {description}'
+            )
+
+        if received:
+            backoff = INITIAL_BACKOFF
+
+        log.warning(f'Pod watch ended, reconnecting in {backoff} seconds')
+        with trace.span('sleep', 'wait', seconds=min(backoff, remaining)):
+            time.sleep(min(backoff, remaining))
+        backoff = min(backoff * 2, MAX_BACKOFF)
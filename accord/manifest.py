@@ -0,0 +1,121 @@
+
+import hashlib
+import stat
+import gzip
+import json
+import os
+
+
+# Paths that are not part of the storage backup
+EXCLUDES = ['storage/pgdata', 'storage/object/anaconda-repository']
+CHAIN_FILE = 'storage_chain.json'
+READ_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_SIZE), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def scan(source_directory, previous=None, top='storage', excludes=EXCLUDES):
+    """
+    Walk the tree and yield [path, size, mtime, inode, sha256] for every
+    file and symlink. The hash from the previous manifest is reused when the
+    size, mtime and inode have not changed so unchanged files are not read.
+    """
+    if previous is None:
+        previous = {}
+
+    for dirpath, dirnames, filenames in os.walk(f'{source_directory}/{top}'):
+        relative = os.path.relpath(dirpath, source_directory)
+        dirnames[:] = sorted(
+            d for d in dirnames if f'{relative}/{d}' not in excludes
+        )
+        # Symlinks to directories show up in dirnames and are not walked
+        for name in sorted(filenames + dirnames):
+            full_path = f'{dirpath}/{name}'
+            file_stat = os.lstat(full_path)
+            if stat.S_ISDIR(file_stat.st_mode):
+                continue
+
+            path = f'{relative}/{name}'
+            entry = [
+                path,
+                file_stat.st_size,
+                file_stat.st_mtime_ns,
+                file_stat.st_ino
+            ]
+            old = previous.get(path)
+            if old is not None and old[:4] == entry:
+                entry.append(old[4])
+            elif stat.S_ISLNK(file_stat.st_mode):
+                entry.append(
+                    hashlib.sha256(
+                        os.readlink(full_path).encode('utf-8')
+                    ).hexdigest()
+                )
+            elif stat.S_ISREG(file_stat.st_mode):
+                entry.append(hash_file(full_path))
+            else:
+                continue
+
+            yield entry
+
+
+def read_manifest(manifest_path):
+    manifest = {}
+    with gzip.open(manifest_path, 'rt') as f:
+        for line in f:
+            entry = json.loads(line)
+            manifest[entry[0]] = entry
+
+    return manifest
+
+
+def update_manifest(manifest_path, source_directory, previous):
+    """
+    Scan the tree and write the new manifest. Returns the paths that changed
+    since the previous manifest and the paths that have been deleted. Entries
+    are removed from previous as they are seen.
+    """
+    changed = []
+    with gzip.open(manifest_path, 'wt') as f:
+        for entry in scan(source_directory, previous):
+            f.write(json.dumps(entry, separators=(',', ':')) + '\n')
+            if previous.pop(entry[0], None) != entry:
+                changed.append(entry[0])
+
+    return changed, sorted(previous)
+
+
+def load_chain(directory):
+    chain_path = f'{directory}/{CHAIN_FILE}'
+    if not os.path.isfile(chain_path):
+        return []
+
+    with open(chain_path, 'r') as f:
+        return json.load(f)
+
+
+def save_chain(directory, chain):
+    with open(f'{directory}/{CHAIN_FILE}', 'w') as f:
+        json.dump(chain, f, indent=2)
+
+
+def reset_chain(directory):
+    # A full backup replaces the base so the old incrementals are useless
+    for link in load_chain(directory):
+        to_remove = [link.get('manifest'), link.get('deleted')]
+        if link['type'] == 'incremental':
+            to_remove.append(link['archive'])
+
+        for name in to_remove:
+            if name and os.path.isfile(f'{directory}/{name}'):
+                os.remove(f'{directory}/{name}')
+
+    if os.path.isfile(f'{directory}/{CHAIN_FILE}'):
+        os.remove(f'{directory}/{CHAIN_FILE}')
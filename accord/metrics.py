@@ -0,0 +1,221 @@
+
+from accord import common
+from accord import trace
+
+
+import collections
+import contextlib
+import threading
+import socket
+import json
+import time
+import os
+
+
+log = common.define_logging_facility()
+
+
+COUNTERS = ['bytes_read', 'bytes_written', 'files', 'subprocesses']
+PROMETHEUS_METRICS = [
+    (
+        'duration_seconds',
+        'duration',
+        'Time taken by the stage in the last run'
+    ),
+    ('bytes_read', 'bytes_read', 'Bytes read by the stage in the last run'),
+    (
+        'bytes_written',
+        'bytes_written',
+        'Bytes written by the stage in the last run'
+    ),
+    ('files', 'files', 'Files processed by the stage in the last run'),
+    (
+        'subprocesses',
+        'subprocesses',
+        'Commands started by the stage in the last run'
+    ),
+    ('exit_code', 'exit_code', 'Exit status of the stage in the last run'),
+    ('success', 'success', 'Whether the stage succeeded in the last run')
+]
+
+
+def exit_code(error):
+    # Use the exit status of the failed command when there is one
+    for attribute in ['returncode', 'exit_code', 'code']:
+        value = getattr(error, attribute, None)
+        if isinstance(value, int) and value != 0:
+            return value
+
+    return 1
+
+
+class StageMetrics(object):
+    def __init__(self, name):
+        self.name = name
+        self.started = None
+        self.duration = 0.0
+        self.status = 'pending'
+        self.exit_code = None
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.files = 0
+        self.subprocesses = 0
+
+    @property
+    def success(self):
+        return int(self.status == 'success')
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'started': self.started,
+            'duration': round(self.duration, 3),
+            'status': self.status,
+            'exit_code': self.exit_code,
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+            'files': self.files,
+            'subprocesses': self.subprocesses
+        }
+
+
+class RunMetrics(object):
+    """
+    Timings and counters for each stage of a run. Code running inside a
+    stage adds to the counters with add(), which goes to the stage that is
+    running on the current thread. Work handed to other threads is wrapped
+    with bind() so it is counted against the stage that handed it out.
+    """
+    def __init__(self, action):
+        self.action = action
+        self.started = time.time()
+        self.duration = 0.0
+        self.status = 'running'
+        self.stages = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.start_time = time.monotonic()
+
+    def current(self):
+        return getattr(self.local, 'stage', None)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        with self.lock:
+            if name not in self.stages:
+                self.stages[name] = StageMetrics(name)
+
+            stage = self.stages[name]
+
+        previous = self.current()
+        self.local.stage = stage
+        stage.started = time.time()
+        start = time.monotonic()
+        try:
+            with trace.span(name, 'stage'):
+                yield stage
+        except BaseException as e:
+            stage.status = 'failed'
+            stage.exit_code = exit_code(e)
+            raise
+        else:
+            stage.status = 'success'
+            stage.exit_code = 0
+        finally:
+            stage.duration = time.monotonic() - start
+            self.local.stage = previous
+
+    def add(self, **counters):
+        stage = self.current()
+        if stage is None:
+            return
+
+        with self.lock:
+            for counter, value in counters.items():
+                setattr(stage, counter, getattr(stage, counter) + value)
+
+    def bind(self, function):
+        stage = self.current()
+
+        def bound(*args, **kwargs):
+            previous = self.current()
+            self.local.stage = stage
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.local.stage = previous
+
+        return bound
+
+    def finish(self, error=None):
+        self.duration = time.monotonic() - self.start_time
+        self.status = 'success' if error is None else 'failed'
+
+    def report(self):
+        with self.lock:
+            stages = [stage.as_dict() for stage in self.stages.values()]
+
+        return {
+            'action': self.action,
+            'host': socket.gethostname(),
+            'started': self.started,
+            'duration': round(self.duration, 3),
+            'status': self.status,
+            'totals': {
+                counter: sum(stage[counter] for stage in stages)
+                for counter in COUNTERS
+            },
+            'stages': stages
+        }
+
+    def textfile(self):
+        """
+        The metrics in the Prometheus text format for the node exporter
+        textfile collector
+        """
+        lines = []
+        labels = f'action="{self.action}"'
+        for metric, attribute, description in PROMETHEUS_METRICS:
+            lines.append(f'# HELP accord_stage_{metric} {description}')
+            lines.append(f'# TYPE accord_stage_{metric} gauge')
+            for stage in self.stages.values():
+                value = getattr(stage, attribute)
+                if value is None:
+                    continue
+
+                lines.append(
+                    f'accord_stage_{metric}{{{labels},stage="{stage.name}"}} '
+                    f'{value}'
+                )
+
+        lines.extend([
+            '# HELP accord_run_duration_seconds Time taken by the last run',
+            '# TYPE accord_run_duration_seconds gauge',
+            f'accord_run_duration_seconds{{{labels}}} {self.duration}',
+            '# HELP accord_run_success Whether the last run succeeded',
+            '# TYPE accord_run_success gauge',
+            f'accord_run_success{{{labels}}} '
+            f'{int(self.status == "success")}',
+            '# HELP accord_run_timestamp_seconds When the last run started',
+            '# TYPE accord_run_timestamp_seconds gauge',
+            f'accord_run_timestamp_seconds{{{labels}}} {self.started}'
+        ])
+        return '\n'.join(lines) + '\n'
+
+    def write_report(self, report_path):
+        write_atomic(
+            report_path,
+            json.dumps(self.report(), indent=2) + '\n'
+        )
+
+    def write_textfile(self, textfile_path):
+        write_atomic(textfile_path, self.textfile())
+
+
+def write_atomic(path, text):
+    # The collector must never read a half written file
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w') as f:
+        f.write(text)
+
+    os.rename(temp_path, path)
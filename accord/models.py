@@ -1,6 +1,15 @@
 
+from accord import compression
+from accord import chunkstore
 from accord import exceptions
+from accord import checksum
+from accord import extract
 from accord import common
+from accord import metrics
+from accord import output
+from accord import trace
+from accord import kube
+from accord import psql
 
 
 import subprocess
@@ -10,13 +19,19 @@ import shlex
 import time
 import sys
 import os
-import re
 import sh
 
 
 log = common.define_logging_facility()
 
 
+ARCHIVE_PATTERNS = [
+    'ae5_backup_*.tar.gz',
+    'repos_db_backup_*.tar.gz',
+    '*.checksums.json'
+]
+
+
 class Accord(object):
     def __init__(self, args):
         # Where to the backup files will be by default
@@ -25,18 +40,44 @@ class Accord(object):
         # Action to perform
         self.action = args.action.lower()
 
+        # Timings and counters for each stage of the run
+        self.metrics = metrics.RunMetrics(self.action)
+
         if self.action == 'backup':
             self.archive = args.archive
+            # How the postgres dump gets out of the container
+            self.postgres_mode = args.postgres_mode
+            # Only package the storage files changed since the last backup
+            self.incremental = args.incremental
 
-        if self.action == 'restore':
+        if self.action in ['restore', 'verify']:
             # Allow user to chose tar archive to restore from
             self.restore_file = args.restore_file
+            # Check the backup against its checksums before restoring
+            self.verify = not args.no_verify
+
+        # Number of stages that can run at the same time
+        self.jobs = args.jobs
+
+        # Workers for parallel pg_dump and pg_restore
+        self.postgres_jobs = args.postgres_jobs
+
+        # Compression to use for the storage backup
+        self.compression = args.compression
+
+        # Keep backups as deduplicated chunks instead of tar archives
+        self.chunk_store = args.chunk_store
 
         # Backup file names
         self.var_lib_gravity_backup_name = "var_lib_gravity_backup.tar.gz"
         self.postgres_backup_name = "full_postgres_backup.sql"
-        self.storage_backup_name = "storage_backup.tar.gz"
+        self.storage_backup_name = compression.archive_name(
+            'storage_backup',
+            self.compression
+        )
         self.repository_db_name = "all_repositories.tar"
+        self.postgres_parallel_backup_name = "postgres_backup"
+        self.repository_db_directory_name = "all_repositories"
 
         # AE5 default locations for data - DO NOT CHANGE
         self.postgres_container_backup = "/var/lib/postgresql/data"
@@ -59,6 +100,22 @@ class Accord(object):
             self.postgres_container_backup,
             self.repository_db_name
         )
+        self.postgres_system_repo_directory_path = "{0}/{1}".format(
+            self.postgres_system_backup,
+            self.repository_db_directory_name
+        )
+        self.postgres_container_repo_directory_path = "{0}/{1}".format(
+            self.postgres_container_backup,
+            self.repository_db_directory_name
+        )
+        self.postgres_system_parallel_backup_path = "{0}/{1}".format(
+            self.postgres_system_backup,
+            self.postgres_parallel_backup_name
+        )
+        self.postgres_container_parallel_backup_path = "{0}/{1}".format(
+            self.postgres_container_backup,
+            self.postgres_parallel_backup_name
+        )
 
         # Repository location
         self.repository = (
@@ -76,17 +133,25 @@ class Accord(object):
             # If only doing the repos then assume sync
             self.sync_files = True
 
-        if self.action == 'restore':
+        if self.action in ['restore', 'verify']:
             self.sync_files = False
             self.override = args.override
         else:
             self.sync_files = args.sync
 
+        self.stream_sync = False
+        self.sync_jobs = 1
         if self.action == 'backup' and self.sync_files:
             # Set the sync user and node
             self.sync_user = args.sync_user
             self.sync_node = args.sync_node
 
+            # Send the storage backup directly to the sync node
+            self.stream_sync = args.stream_sync
+
+            # Number of rsync transfers to run at the same time
+            self.sync_jobs = args.sync_jobs
+
             if not self.sync_node:
                 log.error('Node to sync files to not provided')
                 raise exceptions.MissingSyncNode(
@@ -142,6 +207,10 @@ class Accord(object):
         self.docker_cont_id = None
 
         self.kubectl = sh.Command('kubectl')
+        self.kube = kube.KubeClient(self.kubectl, self.metrics)
+
+        # Checksums of the backup files hashed as they are written
+        self.checksums = checksum.ChecksumRecorder()
 
     def check_for_restore(self):
         return os.path.isfile(self.signal_file)
@@ -179,31 +248,19 @@ class Accord(object):
             )
             self.run_su_command(self.sync_user, setup_sync_folder)
 
-            set_permissions = (
-                f'/bin/ssh -t -q {self.sync_user}@{self.sync_node}'
-                f' \'sudo chown -R {self.sync_user}:{self.sync_user} '
-                f'{self.backup_directory}\''
-            )
-            self.run_su_command(self.sync_user, set_permissions)
-
     def get_postgres_docker_container(self):
-        temp_pods = self.kubectl('get', 'pods', f'-n {self.namespace}')
-        for line in temp_pods:
-            if 'postgres' in line:
-                temp = (re.sub(r'\s+', ' ', line)).split(' ')
-                self.postgres_pod = temp[0]
+        pods = self.kube.objects('pods', self.namespace)
+        for name, pod in pods.items():
+            if 'postgres' in name:
+                self.postgres_pod = name
                 break
 
-        temp_container = self.kubectl(
-            'describe',
-            'pod',
-            self.postgres_pod,
-            f'-n {self.namespace}'
-        )
-        for line in temp_container:
-            if 'docker://' in line:
-                temp = line.split('docker://')
-                self.docker_cont_id = temp[1]
+        statuses = pods[self.postgres_pod]['status']['containerStatuses']
+        for status in statuses:
+            if status.get('containerID', '').startswith('docker://'):
+                self.docker_cont_id = status['containerID'].split(
+                    'docker://'
+                )[1]
                 break
 
         return
@@ -227,7 +284,22 @@ class Accord(object):
             )
 
         if run_command:
-            gravity(run_command)
+            progress = output.OutputCounter(f'gravity {action}')
+            self.metrics.add(subprocesses=1)
+            try:
+                with trace.command_span(['gravity'] + list(run_command)):
+                    gravity(run_command, _out=progress, _err=progress)
+            except sh.ErrorReturnCode:
+                progress.log_tail()
+                raise
+
+            progress.log_summary()
+            if os.path.isfile(run_command[1]):
+                backup_size = os.path.getsize(run_command[1])
+                if action == 'backup':
+                    self.metrics.add(bytes_written=backup_size, files=1)
+                else:
+                    self.metrics.add(bytes_read=backup_size)
 
         return
 
@@ -235,17 +307,16 @@ class Accord(object):
         if not self.secret_files.get(self.namespace):
             self.secret_files[self.namespace] = []
 
-        temp_secrets = self.kubectl(
-            'get',
-            'secrets',
-            '-n {0}'.format(self.namespace)
-        )
-        for line in temp_secrets:
-            if 'anaconda-credentials-user' in line:
-                temp = (re.sub(r'\s+', ' ', line)).split(' ')
-                self.secret_files[self.namespace].append(temp[0])
+        for name in self.kube.objects('secrets', self.namespace):
+            if 'anaconda-credentials-user' in name:
+                self.secret_files[self.namespace].append(name)
 
-    def run_command_on_container(self, container, command, return_value=False):
+    def call_on_container(self, container, command, call):
+        """
+        Build the gravity command that runs command with bash on the
+        container and hand it to call, which starts it. Returns what call
+        returns, and exits if the command could not be run.
+        """
         try:
             command_build = (
                 'gravity exec docker exec -i {0} /bin/bash -c "{1}"'.format(
@@ -254,33 +325,150 @@ class Accord(object):
                 )
             )
             formatted_command = shlex.split(command_build)
-            results = subprocess.run(
-                formatted_command,
-                stdout=subprocess.PIPE
-            )
+            self.metrics.add(subprocesses=1)
+            return call(formatted_command)
         except Exception as e:
             log.error(f'An exception {e} occurred running command: {command}')
             sys.exit(1)
 
-        if return_value:
-            return results.stdout
-
-        return
+    def run_command_on_container(self, container, command, return_value=False):
+        # Returns the output when return_value is set, else the exit code
+        with trace.span(
+            'run_command_on_container',
+            'command',
+            container=container,
+            command=trace.command_line(command)
+        ):
+            if return_value:
+                results = self.call_on_container(
+                    container,
+                    command,
+                    lambda c: subprocess.run(c, stdout=subprocess.PIPE)
+                )
+                return results.stdout
+
+            # Output nobody reads, like psql restoring a dump, is only
+            # counted instead of being held in memory
+            return_code, _ = self.call_on_container(
+                container,
+                command,
+                lambda c: output.run_counted(
+                    c,
+                    f'Command on container {container}'
+                )
+            )
+            return return_code
+
+    def stream_command_on_container(self, container, command, out):
+        """
+        Run the command on the container and write its output to out in
+        blocks, so large output is never held in memory. Returns the exit
+        code of the command.
+        """
+        results = self.call_on_container(
+            container,
+            command,
+            lambda c: subprocess.Popen(c, stdout=subprocess.PIPE)
+        )
+        with trace.span(
+            'stream_command_on_container',
+            'command',
+            container=container,
+            command=trace.command_line(command)
+        ):
+            try:
+                for block in iter(
+                    lambda: results.stdout.read(compression.BLOCK_SIZE), b''
+                ):
+                    out.write(block)
+            finally:
+                results.stdout.close()
+
+            return results.wait()
+
+    def stream_into_container(self, container, command, source):
+        """
+        Run the command on the container feeding source to its input in
+        blocks. Returns the exit code of the command.
+        """
+        results = self.call_on_container(
+            container,
+            command,
+            lambda c: subprocess.Popen(c, stdin=subprocess.PIPE)
+        )
+        with trace.span(
+            'stream_into_container',
+            'command',
+            container=container,
+            command=trace.command_line(command)
+        ):
+            try:
+                for block in iter(
+                    lambda: source.read(compression.BLOCK_SIZE), b''
+                ):
+                    results.stdin.write(block)
+                    self.metrics.add(bytes_read=len(block))
+            finally:
+                results.stdin.close()
+
+            return results.wait()
+
+    def open_psql_session(self, database='postgres'):
+        """
+        Start one psql session on the postgres container that statements can
+        be piped through, instead of starting psql for each command
+        """
+        command = "su - postgres -c '{0}'".format(
+            psql.PSQL_COMMAND.format(database)
+        )
+        return self.call_on_container(
+            self.docker_cont_id,
+            command,
+            psql.PsqlSession
+        )
 
     def run_su_command(self, user, command):
+        # Returns the exit code of the command
         try:
             command_build = (
                 'su - {0} -c "{1}"'.format(user, command)
             )
             formatted_command = shlex.split(command_build)
-            subprocess.run(formatted_command)
+            self.metrics.add(subprocesses=1)
+            with trace.span(
+                'run_su_command',
+                'command',
+                user=user,
+                command=trace.command_line(command)
+            ):
+                return subprocess.run(formatted_command).returncode
         except Exception as e:
             log.error(f'An exception {e} occurred running command: {command}')
             sys.exit(1)
 
-        return
+    def open_su_pipe(self, user, command):
+        # Same as run_su_command, but hand back the process to write into
+        try:
+            command_build = (
+                'su - {0} -c "{1}"'.format(user, command)
+            )
+            formatted_command = shlex.split(command_build)
+            self.metrics.add(subprocesses=1)
+            su_pipe = subprocess.Popen(
+                formatted_command,
+                stdin=subprocess.PIPE
+            )
+        except Exception as e:
+            log.error(f'An exception {e} occurred running command: {command}')
+            sys.exit(1)
+
+        return su_pipe
 
     def create_tar_archive(self):
+        if self.chunk_store:
+            self.create_chunk_archive()
+            return
+
         if self.repos_only:
             archive_file = (
                 f'repos_db_backup_{time.strftime("%Y%m%d-%H%M")}.tar.gz'
@@ -290,31 +478,82 @@ class Accord(object):
                 f'ae5_backup_{time.strftime("%Y%m%d-%H%M")}.tar.gz'
             )
 
-        with tarfile.open(
-            f'{self.backup_directory}/{archive_file}', 'w:gz'
-        ) as tar:
-            tar.add(
-                self.backup_directory,
-                arcname=os.path.basename(self.backup_directory)
-            )
+        # Earlier archives in the directory are not packed into this one
+        archive_path = f'{self.backup_directory}/{archive_file}'
+        hashing = compression.write_tree_archive(
+            archive_path,
+            self.backup_directory,
+            os.path.basename(self.backup_directory),
+            excludes=ARCHIVE_PATTERNS
+        )
 
-        if not tarfile.is_tarfile(f'{self.backup_directory}/{archive_file}'):
+        if not tarfile.is_tarfile(archive_path):
             raise exceptions.NotValidTarfile(
                 'tar archive file was not able to create successfully'
             )
 
+        self.metrics.add(bytes_written=hashing.size, files=1)
+
+        checksum.write_archive_checksums(archive_path, hashing)
+
+    def create_chunk_archive(self):
+        # Snapshot the backup directory so unchanged data is not stored again
+        store = chunkstore.ChunkStore(self.backup_directory)
+        temp_path = pathlib.Path(self.backup_directory).resolve()
+        top = temp_path.name
+        index_path, stats = store.snapshot(
+            str(temp_path.parent),
+            top,
+            'repos_db_backup' if self.repos_only else 'ae5_backup',
+            excludes=[f'{top}/chunks']
+        )
+        log.info(
+            f'Created archive snapshot {index_path} writing '
+            f'{stats["bytes_written"]} new bytes'
+        )
+
     def extract_tar_archive(self, to_directory='/opt'):
         if self.backup_directory != '/opt/anaconda_backup':
             temp_path = pathlib.Path(self.backup_directory)
             to_directory = temp_path.parent
 
-        if not tarfile.is_tarfile(self.restore_file):
+        if self.chunk_store and self.restore_file.endswith('.json.gz'):
+            # Archive was created as a snapshot in the chunk store
+            store = chunkstore.ChunkStore(self.backup_directory)
+            store.restore(self.restore_file, to_directory)
+            return
+
+        if self.verify:
+            self.verify_archive()
+        elif not tarfile.is_tarfile(self.restore_file):
             raise exceptions.NotValidTarfile(
                 'tar archive file is not a valid tar file'
             )
 
         # Ensure the backup is extracted to the right place
-        sh.tar('-xzvf', self.restore_file, '-C', to_directory)
+        extract.extract_archive(self.restore_file, str(to_directory))
+
+    def verify_archive(self):
+        checksums_path = checksum.archive_checksums_path(self.restore_file)
+        if not os.path.isfile(checksums_path):
+            # Archives from older versions do not have checksums
+            log.warning(f'No checksums found for {self.restore_file}')
+            if not tarfile.is_tarfile(self.restore_file):
+                raise exceptions.NotValidTarfile(
+                    'tar archive file is not a valid tar file'
+                )
+
+            return
+
+        checksum.verify_checksums(checksums_path)
+
+    def verify_backup(self, required=False):
+        checksums_path = f'{self.backup_directory}/{checksum.CHECKSUMS_FILE}'
+        if not required and not os.path.isfile(checksums_path):
+            log.warning(f'No checksums found in {self.backup_directory}')
+            return
+
+        checksum.verify_checksums(checksums_path)
 
     def authenticate_api(self):
         pass
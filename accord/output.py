@@ -0,0 +1,72 @@
+
+from accord import common
+
+
+import collections
+import subprocess
+import threading
+
+
+log = common.define_logging_facility()
+
+
+# Lines of output kept to show when a command fails
+TAIL_LINES = 20
+
+
+class OutputCounter(object):
+    """
+    Output callback that keeps a count of the lines and bytes a command
+    writes and only its last few lines, so a command that lists millions of
+    files does not hold its whole output in memory. Instances can be passed
+    to sh as _out and _err, which then does not store the output itself.
+    """
+    def __init__(self, description, unit='lines', tail=TAIL_LINES):
+        self.description = description
+        self.unit = unit
+        self.lines = 0
+        self.bytes = 0
+        self.tail = collections.deque(maxlen=tail)
+        # sh calls the stdout and stderr callbacks from their own threads
+        self.lock = threading.Lock()
+
+    def __call__(self, line):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', 'replace')
+
+        with self.lock:
+            self.lines += 1
+            self.bytes += len(line)
+            self.tail.append(line.rstrip('\n'))
+
+    def log_summary(self):
+        log.info(
+            f'{self.description}: {self.lines} {self.unit}, '
+            f'{self.bytes} bytes of output'
+        )
+
+    def log_tail(self):
+        for line in self.tail:
+            log.error(f'{self.description}: {line}')
+
+
+def run_counted(command, description, unit='lines', **kwargs):
+    """
+    Run the command with stdout read line by line into an OutputCounter.
+    stderr is left for the command to write as usual, so errors are shown
+    as they happen and are not counted. Returns the exit code and the
+    counter, and the last lines of output are logged if the command fails.
+    """
+    counter = OutputCounter(description, unit)
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, **kwargs)
+    with process.stdout:
+        for line in process.stdout:
+            counter(line)
+
+    return_code = process.wait()
+    counter.log_summary()
+    if return_code != 0:
+        log.error(f'{description} exited with {return_code}')
+        counter.log_tail()
+
+    return return_code, counter
@@ -1,30 +1,121 @@
 
 from accord.models import Accord
+from accord import compression
+from accord import chunkstore
 from accord import exceptions
+from accord import scheduler
+from accord import manifest
+from accord import checksum
+from accord import extract
+from accord import output
+from accord import trace
+from accord import kube
+from accord import sync
 from accord import common
 
 
+from concurrent import futures
+import subprocess
 import argparse
 import datetime
 import pathlib
+import shutil
 import json
 import time
 import yaml
 import glob
 import sys
 import os
+import re
 import sh
 
 
 log = common.define_logging_facility()
 
 
+# Use the libyaml bindings when they are available as they are much faster
+try:
+    from yaml import CSafeDumper as YamlDumper
+except ImportError:
+    from yaml import SafeDumper as YamlDumper
+
+
+# Run the receiving rsync as root on the sync node
+SUDO_RSYNC = 'sudo rsync'
+# Number of files given to each kubectl call when restoring secrets
+RESTORE_BATCH_SIZE = 50
+# Number of deployments given to each kubectl delete
+DELETE_BATCH_SIZE = 200
+RESTORE_RESULT = re.compile(r'^\S+?[/ ]"?([^"\s]+)"? (?:replaced|created)$')
+
+
+# Deployment columns kept to start the deployments again after a restore
+DEPLOYMENT_COLUMNS = [
+    'id',
+    'name',
+    'owner',
+    'type',
+    'url',
+    'command_name',
+    'project_name',
+    'project_revision',
+    'project_owner'
+]
+DEPLOYMENTS_TO_START = 'deployments_to_start.jsonl'
+
+
+METADATA_TO_CLEAR = [
+    'creationTimestamp',
+    'resourceVersion',
+    'selfLink',
+    'uid'
+]
+
+
+def path_size(path):
+    # Size in bytes and number of files of a file or directory, if it exists
+    if not os.path.lexists(path):
+        return 0, 0
+
+    return sync.tree_weight(path)
+
+
+def record_output(process, path):
+    # Count a backup file or directory written by an outside command
+    size, files = path_size(path)
+    process.metrics.add(bytes_written=size, files=files)
+
+
+def remove_postgres_backups(process):
+    """
+    Remove the postgres backup of every mode from the backup directory. The
+    restore picks the mode by the files it finds, so a dump from an earlier
+    run in another mode must not be left next to the new one.
+    """
+    backup_path = (
+        f'{process.backup_directory}/{process.postgres_parallel_backup_name}'
+    )
+    if os.path.exists(backup_path):
+        sh.rm('-Rf', backup_path)
+
+    for suffix in set(compression.SUFFIXES.values()):
+        dump_path = (
+            f'{process.backup_directory}/{process.postgres_backup_name}'
+            f'{suffix}'
+        )
+        if os.path.isfile(dump_path):
+            os.remove(dump_path)
+
+
+@trace.traced
 def backup_postgres_database(process):
     process.get_postgres_docker_container()
     backup_command = (
         "su - postgres -c 'pg_dumpall -U postgres --clean -f "
         f"{process.postgres_container_backup_path}'"
     )
+    remove_postgres_backups(process)
+
     # Check for existing sql file and if there remove it
     if os.path.isfile(process.postgres_system_backup_path):
         os.remove(process.postgres_system_backup_path)
@@ -44,8 +135,158 @@ def backup_postgres_database(process):
         process.postgres_system_backup_path,
         f'{process.backup_directory}/'
     )
+    record_output(
+        process,
+        f'{process.backup_directory}/{process.postgres_backup_name}'
+    )
+
 
+@trace.traced
+def stream_postgres_database(process):
+    """
+    Stream pg_dumpall out of the container and compress it on the fly into
+    the backup directory, so the dump never lands in the pgdata volume.
+    """
+    process.get_postgres_docker_container()
+    backup_command = "su - postgres -c 'pg_dumpall -U postgres --clean'"
+    dump_name = compression.compressed_name(
+        process.postgres_backup_name,
+        process.compression
+    )
+    dump_path = f'{process.backup_directory}/{dump_name}'
+    remove_postgres_backups(process)
+    try:
+        with open(dump_path, 'wb') as f:
+            hashing = checksum.HashingWriter(f)
+            with compression.open_writer(
+                hashing,
+                process.compression
+            ) as writer:
+                return_code = process.stream_command_on_container(
+                    process.docker_cont_id,
+                    backup_command,
+                    writer
+                )
+    except Exception:
+        # Do not leave a partial dump behind
+        if os.path.isfile(dump_path):
+            os.remove(dump_path)
 
+        raise
+
+    if return_code != 0:
+        os.remove(dump_path)
+        log.error('Streaming the postgres backup failed')
+        raise exceptions.NoPostgresBackup(
+            f'pg_dumpall exited with {return_code} while streaming'
+        )
+
+    process.checksums.record(dump_name, hashing)
+    process.metrics.add(bytes_written=hashing.size, files=1)
+
+
+@trace.traced
+def list_postgres_databases(process):
+    list_command = (
+        "su - postgres -c 'psql -U postgres -At -c \\\"select datname from "
+        "pg_database where datallowconn and not datistemplate;\\\"'"
+    )
+    results = process.run_command_on_container(
+        process.docker_cont_id,
+        list_command,
+        return_value=True
+    )
+    return [
+        line.strip() for line in results.decode('utf-8').split('\n')
+        if line.strip()
+    ]
+
+
+def postgres_parallelism(process, databases):
+    # Split the workers between the databases in flight and pg_dump -j
+    in_flight = max(1, min(len(databases), process.postgres_jobs))
+    return in_flight, max(1, process.postgres_jobs // in_flight)
+
+
+@trace.traced
+def dump_postgres_database(process, database, dump_jobs):
+    backup_command = (
+        f"su - postgres -c 'pg_dump -U postgres -Fd -j {dump_jobs} -f "
+        f"{process.postgres_container_parallel_backup_path}/{database} "
+        f"{database}'"
+    )
+    process.run_command_on_container(process.docker_cont_id, backup_command)
+
+    # Check for the table of contents to ensure the dump is there
+    dump_path = f'{process.postgres_system_parallel_backup_path}/{database}'
+    if not os.path.isfile(f'{dump_path}/toc.dat'):
+        log.error(f'Could not find backup for database {database}')
+        raise exceptions.NoPostgresBackup(
+            f'Could not find backup for database {database}'
+        )
+
+    sh.mv(
+        dump_path,
+        f'{process.backup_directory}/{process.postgres_parallel_backup_name}/'
+    )
+
+
+@trace.traced
+def parallel_backup_postgres_database(process):
+    """
+    Dump the globals on their own and every database in directory format
+    with pg_dump -j, running several databases at the same time.
+    """
+    process.get_postgres_docker_container()
+    backup_path = (
+        f'{process.backup_directory}/{process.postgres_parallel_backup_name}'
+    )
+    # Clear out any dumps from a previous run
+    remove_postgres_backups(process)
+    if os.path.exists(process.postgres_system_parallel_backup_path):
+        sh.rm('-Rf', process.postgres_system_parallel_backup_path)
+
+    pathlib.Path(backup_path).mkdir(parents=True)
+    process.run_command_on_container(
+        process.docker_cont_id,
+        "su - postgres -c 'mkdir -p "
+        f"{process.postgres_container_parallel_backup_path}'"
+    )
+
+    with open(f'{backup_path}/globals.sql', 'wb') as f:
+        return_code = process.stream_command_on_container(
+            process.docker_cont_id,
+            "su - postgres -c 'pg_dumpall -U postgres --globals-only'",
+            f
+        )
+
+    if return_code != 0:
+        log.error('Could not backup the postgres globals')
+        raise exceptions.NoPostgresBackup(
+            f'pg_dumpall --globals-only exited with {return_code}'
+        )
+
+    databases = list_postgres_databases(process)
+    in_flight, dump_jobs = postgres_parallelism(process, databases)
+    with futures.ThreadPoolExecutor(max_workers=in_flight) as pool:
+        list(
+            pool.map(
+                process.metrics.bind(
+                    lambda database: dump_postgres_database(
+                        process,
+                        database,
+                        dump_jobs
+                    )
+                ),
+                databases
+            )
+        )
+
+    sh.rm('-Rf', process.postgres_system_parallel_backup_path)
+    record_output(process, backup_path)
+
+
+@trace.traced
 def backup_repository_db(process):
     process.get_postgres_docker_container()
     backup_command = (
@@ -71,11 +312,175 @@ def backup_repository_db(process):
         f'{process.postgres_system_repo_backup_path}',
         f'{process.backup_directory}/'
     )
+    record_output(
+        process,
+        f'{process.backup_directory}/{process.repository_db_name}'
+    )
+
+
+@trace.traced
+def parallel_backup_repository_db(process):
+    """
+    Dump the repository database in directory format so it can be dumped
+    and restored with several workers
+    """
+    process.get_postgres_docker_container()
+    backup_path = (
+        f'{process.backup_directory}/{process.repository_db_directory_name}'
+    )
+    # Check for existing backups and if there remove them
+    for path in [backup_path, process.postgres_system_repo_directory_path]:
+        if os.path.exists(path):
+            sh.rm('-Rf', path)
+
+    backup_command = (
+        "su - postgres -c 'pg_dump -U postgres -Fd "
+        f"-j {process.postgres_jobs} -f "
+        f"{process.postgres_container_repo_directory_path} "
+        "anaconda_repository'"
+    )
+    process.run_command_on_container(process.docker_cont_id, backup_command)
+
+    # Check for the table of contents and ensure that it created
+    if not os.path.isfile(
+        f'{process.postgres_system_repo_directory_path}/toc.dat'
+    ):
+        log.error('Could not find backup file for postgres')
+        raise exceptions.NoPostgresBackup(
+            'Could not find backup file for postgres'
+        )
+
+    # Move the backup to the backup directory
+    sh.mv(
+        process.postgres_system_repo_directory_path,
+        f'{process.backup_directory}/'
+    )
+    record_output(process, backup_path)
+
+
+@trace.traced
+def stream_restore_postgres_database(process, dump_name):
+    # Decompress on the fly straight into psql in the container
+    restore_command = "su - postgres -c 'psql -U postgres'"
+    with compression.open_reader(
+        f'{process.backup_directory}/{dump_name}'
+    ) as source:
+        return_code = process.stream_into_container(
+            process.docker_cont_id,
+            restore_command,
+            source
+        )
+
+    if return_code != 0:
+        log.error('Streaming the postgres restore failed')
+        raise exceptions.NoPostgresBackup(
+            f'psql exited with {return_code} while restoring {dump_name}'
+        )
 
 
+@trace.traced
+def restore_parallel_database(process, database, restore_jobs):
+    restore_command = (
+        f"su - postgres -c 'pg_restore -U postgres -j {restore_jobs} --clean "
+        "--if-exists --create -d template1 "
+        f"{process.postgres_container_parallel_backup_path}/{database}'"
+    )
+    return_code = process.run_command_on_container(
+        process.docker_cont_id,
+        restore_command
+    )
+    if return_code != 0:
+        log.error(f'Restoring the {database} database failed')
+        raise exceptions.NoPostgresBackup(
+            f'pg_restore exited with {return_code} while restoring {database}'
+        )
+
+
+@trace.traced
+def parallel_restore_postgres_database(process):
+    """
+    Restore the globals and then each database with pg_restore -j, running
+    several databases at the same time.
+    """
+    backup_path = (
+        f'{process.backup_directory}/{process.postgres_parallel_backup_name}'
+    )
+    with open(f'{backup_path}/globals.sql', 'rb') as source:
+        return_code = process.stream_into_container(
+            process.docker_cont_id,
+            "su - postgres -c 'psql -U postgres'",
+            source
+        )
+
+    if return_code != 0:
+        log.error('Restoring the postgres globals failed')
+        raise exceptions.NoPostgresBackup(
+            f'psql exited with {return_code} while restoring globals.sql'
+        )
+
+    databases = sorted(
+        d for d in os.listdir(backup_path)
+        if os.path.isdir(f'{backup_path}/{d}')
+    )
+
+    # Move the dumps to the DB directory so the container can see them
+    if os.path.exists(process.postgres_system_parallel_backup_path):
+        sh.rm('-Rf', process.postgres_system_parallel_backup_path)
+
+    sh.mv(backup_path, process.postgres_system_parallel_backup_path)
+    sh.chown(
+        '-R',
+        'polkitd:input',
+        process.postgres_system_parallel_backup_path
+    )
+
+    in_flight, restore_jobs = postgres_parallelism(process, databases)
+    with futures.ThreadPoolExecutor(max_workers=in_flight) as pool:
+        list(
+            pool.map(
+                process.metrics.bind(
+                    lambda database: restore_parallel_database(
+                        process,
+                        database,
+                        restore_jobs
+                    )
+                ),
+                databases
+            )
+        )
+
+
+@trace.traced
 def restore_postgres_database(process):
     process.get_postgres_docker_container()
 
+    # Backups made in parallel mode are a directory of per database dumps
+    parallel_backup_path = (
+        f'{process.backup_directory}/{process.postgres_parallel_backup_name}'
+    )
+    if os.path.isdir(parallel_backup_path):
+        process.metrics.add(bytes_read=path_size(parallel_backup_path)[0])
+        parallel_restore_postgres_database(process)
+        return
+
+    # Backups made in stream mode are compressed and are streamed back in
+    if not os.path.isfile(
+        f'{process.backup_directory}/{process.postgres_backup_name}'
+    ):
+        dump_name = compression.find_compressed(
+            process.backup_directory,
+            process.postgres_backup_name
+        )
+        if dump_name:
+            stream_restore_postgres_database(process, dump_name)
+            return
+
+    process.metrics.add(
+        bytes_read=path_size(
+            f'{process.backup_directory}/{process.postgres_backup_name}'
+        )[0]
+    )
+
     # Copy SQL backup to the DB directory so the container can see it
     sh.mv(
         f'{process.backup_directory}/{process.postgres_backup_name}',
@@ -94,154 +499,426 @@ def restore_postgres_database(process):
     process.run_command_on_container(process.docker_cont_id, restore_command)
 
 
-def file_backup_restore(process, action):
-    if action == 'backup':
-        with sh.pushd('/opt/anaconda'):
-            sh.tar(
-                "--exclude=storage/pgdata",
-                "--exclude=storage/object/anaconda-repository",
-                "-czvf",
-                process.storage_backup_name,
-                "storage"
+@trace.traced
+def stream_storage_backup(process, fileobj, source_directory='/opt/anaconda',
+                          files_from=None):
+    """
+    Walk and tar the storage tree and compress it straight into the file
+    object. Only a handful of blocks are held in memory at any time so the
+    size of the tree does not matter. If files_from is given then only the
+    null separated paths listed in that file are packaged.
+    """
+    if files_from:
+        tar_command = [
+            'tar',
+            '-C',
+            source_directory,
+            '--null',
+            '--no-recursion',
+            '-T',
+            files_from,
+            '-cf',
+            '-'
+        ]
+    else:
+        tar_command = [
+            'tar',
+            '-C',
+            source_directory,
+            '--exclude=storage/pgdata',
+            '--exclude=storage/object/anaconda-repository',
+            '-cf',
+            '-',
+            'storage'
+        ]
+    tar = subprocess.Popen(tar_command, stdout=subprocess.PIPE)
+    process.metrics.add(subprocesses=1)
+    try:
+        with compression.open_writer(fileobj, process.compression) as writer:
+            for block in iter(
+                lambda: tar.stdout.read(compression.BLOCK_SIZE), b''
+            ):
+                writer.write(block)
+                process.metrics.add(bytes_read=len(block))
+    finally:
+        tar.stdout.close()
+        return_code = tar.wait()
+
+    if return_code != 0:
+        log.error('Could not create the storage backup')
+        raise subprocess.CalledProcessError(return_code, tar_command)
+
+
+@trace.traced
+def stream_storage_to_sync(process):
+    # Pipe the storage backup to the sync node so it is never written locally
+    remote_path = f'{process.backup_directory}/{process.storage_backup_name}'
+    stale_paths = ' '.join(
+        f'{process.backup_directory}/{name}'
+        for name in compression.other_archives(
+            'storage_backup',
+            process.compression
+        )
+    )
+    sync_pipe = process.open_su_pipe(
+        process.sync_user,
+        f'/bin/ssh -q {process.sync_user}@{process.sync_node}'
+        f' \'sudo rm -f {stale_paths} && '
+        f'sudo tee {remote_path} > /dev/null\''
+    )
+    hashing = checksum.HashingWriter(sync_pipe.stdin)
+    try:
+        stream_storage_backup(process, hashing)
+    finally:
+        sync_pipe.stdin.close()
+        return_code = sync_pipe.wait()
+
+    if return_code != 0:
+        log.error('Could not stream the storage backup to the sync node')
+        raise exceptions.UnableToSync(
+            f'Streaming storage backup to {process.sync_node} failed'
+        )
+
+    # Listed in the checksums so the copy on the sync node can be verified
+    process.checksums.record(process.storage_backup_name, hashing)
+    process.metrics.add(bytes_written=hashing.size, files=1)
+
+
+@trace.traced
+def stream_storage_to_file(process, storage_name=None, files_from=None,
+                           source_directory='/opt/anaconda'):
+    # Write straight into the backup directory with no intermediate copy
+    if storage_name is None:
+        storage_name = process.storage_backup_name
+
+    storage_path = f'{process.backup_directory}/{storage_name}'
+    try:
+        with open(storage_path, 'wb') as f:
+            hashing = checksum.HashingWriter(f)
+            stream_storage_backup(
+                process,
+                hashing,
+                source_directory,
+                files_from
             )
+    except Exception:
+        # Do not leave a partial backup behind
+        if os.path.isfile(storage_path):
+            os.remove(storage_path)
+
+        raise
+
+    process.checksums.record(storage_name, hashing)
+    process.metrics.add(bytes_written=hashing.size, files=1)
+
+
+@trace.traced
+def incremental_storage_backup(process, source_directory='/opt/anaconda'):
+    """
+    The first run takes a full base backup. Every run after that only
+    packages the files whose manifest entries changed, and records the
+    deleted paths as tombstones so the chain can be replayed on restore.
+    """
+    chain = manifest.load_chain(process.backup_directory)
+    if chain:
+        link_type = 'incremental'
+        previous = manifest.read_manifest(
+            f'{process.backup_directory}/{chain[-1]["manifest"]}'
+        )
+        base_name = f'storage_incremental_{time.strftime("%Y%m%d-%H%M%S")}'
+    else:
+        link_type = 'full'
+        previous = {}
+        base_name = 'storage_backup'
+
+    link = {
+        'type': link_type,
+        'archive': compression.archive_name(base_name, process.compression),
+        'manifest': f'{base_name}.manifest.json.gz'
+    }
+    changed, deleted = manifest.update_manifest(
+        f'{process.backup_directory}/{link["manifest"]}',
+        source_directory,
+        previous
+    )
+    if link_type == 'full':
+        compression.remove_other_archives(
+            process.backup_directory,
+            base_name,
+            process.compression
+        )
+        stream_storage_to_file(
+            process,
+            link['archive'],
+            source_directory=source_directory
+        )
+    else:
+        log.info(
+            f'Packaging {len(changed)} changed files and '
+            f'{len(deleted)} deletions'
+        )
+        files_from = os.path.abspath(
+            f'{process.backup_directory}/{base_name}.files'
+        )
+        with open(files_from, 'w') as f:
+            for path in changed:
+                f.write(f'{path}\0')
+
+        try:
+            stream_storage_to_file(
+                process,
+                link['archive'],
+                files_from,
+                source_directory
+            )
+        finally:
+            os.remove(files_from)
+
+        link['deleted'] = f'{base_name}.deleted.json'
+        with open(f'{process.backup_directory}/{link["deleted"]}', 'w') as f:
+            json.dump(deleted, f)
+
+    chain.append(link)
+    manifest.save_chain(process.backup_directory, chain)
+
+
+@trace.traced
+def extract_storage_archive(process, archive_path, to_directory):
+    files, size = extract.extract_archive(
+        archive_path,
+        to_directory,
+        sync=False
+    )
+    process.metrics.add(
+        bytes_read=path_size(archive_path)[0],
+        bytes_written=size,
+        files=files
+    )
+
+
+@trace.traced
+def restore_storage_incrementals(process, to_directory='/opt/anaconda'):
+    # Replay the incrementals on top of the base in the order they were taken
+    for link in manifest.load_chain(process.backup_directory)[1:]:
+        log.info(f'Restoring incremental {link["archive"]}')
+        extract_storage_archive(
+            process,
+            f'{process.backup_directory}/{link["archive"]}',
+            to_directory
+        )
+        with open(f'{process.backup_directory}/{link["deleted"]}', 'r') as f:
+            deleted = json.load(f)
+
+        for path in deleted:
+            if os.path.lexists(f'{to_directory}/{path}'):
+                os.remove(f'{to_directory}/{path}')
+
+
+@trace.traced
+def chunk_storage_backup(process, source_directory='/opt/anaconda'):
+    # Only chunks that are not already in the store get written
+    store = chunkstore.ChunkStore(process.backup_directory)
+    index_path, stats = store.snapshot(
+        source_directory,
+        'storage',
+        'storage',
+        excludes=manifest.EXCLUDES
+    )
+    log.info(
+        f'Storage snapshot {index_path}: {stats["files"]} files, '
+        f'{stats["reused"]} unchanged, {stats["bytes_read"]} bytes read, '
+        f'{stats["bytes_written"]} bytes written'
+    )
 
-        sh.mv(
-            f'/opt/anaconda/{process.storage_backup_name}',
-            f'{process.backup_directory}/'
+
+@trace.traced
+def chunk_storage_restore(process, to_directory='/opt/anaconda'):
+    store = chunkstore.ChunkStore(process.backup_directory)
+    index_path = store.latest_snapshot('storage')
+    if index_path is None:
+        log.error('Could not find a storage snapshot in the chunk store')
+        raise exceptions.NoStorageSnapshot(
+            f'No storage snapshot found in {store.snapshot_directory}'
         )
+
+    log.info(f'Restoring storage snapshot {index_path}')
+    store.restore(index_path, to_directory)
+
+
+@trace.traced
+def file_backup_restore(process, action):
+    if action == 'backup':
+        if process.chunk_store:
+            chunk_storage_backup(process)
+        elif process.incremental:
+            incremental_storage_backup(process)
+        else:
+            manifest.reset_chain(process.backup_directory)
+            if process.stream_sync:
+                stream_storage_to_sync(process)
+            else:
+                compression.remove_other_archives(
+                    process.backup_directory,
+                    'storage_backup',
+                    process.compression
+                )
+                stream_storage_to_file(process)
+    elif action == 'restore' and process.chunk_store:
+        chunk_storage_restore(process)
     elif action == 'restore':
-        sh.cp(
+        # Resolved here as a restore file is only extracted after start up
+        process.storage_backup_name = compression.find_archive(
+            process.backup_directory,
+            'storage_backup',
+            process.compression
+        )
+
+        # Extract straight from the backup directory with no copy first
+        extract_storage_archive(
+            process,
             f'{process.backup_directory}/{process.storage_backup_name}',
             '/opt/anaconda'
         )
-        with sh.pushd('/opt/anaconda'):
-            sh.tar(
-                '-xzvf',
-                f'/opt/anaconda/{process.storage_backup_name}'
-            )
-            sh.rm(f'{process.storage_backup_name}')
+        restore_storage_incrementals(process)
+
+        # One sync for everything instead of a fsync for every file
+        os.sync()
 
 
+@trace.traced
 def backup_secrets_config_maps(process):
     secret_path = f'{process.backup_directory}/secrets'
     if not os.path.exists(secret_path):
         pathlib.Path(secret_path).mkdir(parents=True)
 
     process.get_all_secrets()
+
+    # One kubectl call per kind and namespace, and every object is checked
+    # before anything is written so a missing one fails the run right away
+    exports = []
     for namespace, secrets in process.secret_files.items():
+        found = process.kube.objects('secrets', namespace)
         for secret in secrets:
-            temp_secret_path = f'{secret_path}/{secret}.yaml'
-            try:
-                with open(temp_secret_path, 'w') as fs:
-                    process.kubectl(
-                        'get',
-                        'secrets',
-                        secret,
-                        f'-n {namespace}',
-                        '-o yaml',
-                        _out=fs
-                    )
-            except sh.ErrorReturnCode_1:
+            if secret not in found:
                 log.error(f'Could not backup {secret} as it was not found')
                 raise exceptions.SecretNotFound(
                     f'{secret} has been removed and cannot be backed up'
                 )
 
+            exports.append((secret, found[secret]))
+
     for namespace, config_maps in process.config_maps.items():
+        found = process.kube.objects('configmaps', namespace)
         for cm in config_maps:
-            temp_cm_path = f'{secret_path}/{cm}.yaml'
-            try:
-                with open(temp_cm_path, 'w') as fcm:
-                    process.kubectl(
-                        'get',
-                        'configmaps',
-                        cm,
-                        f'-n {namespace}',
-                        '-o yaml',
-                        _out=fcm
-                    )
-            except sh.ErrorReturnCode_1:
+            if cm not in found:
                 log.error(f'Could not backup {cm} as it was not found')
                 raise exceptions.ConfigMapNotFound(
                     f'{cm} has been removed and cannot be backed up'
                 )
 
-    return
-
-
-def sanitize_secrets_config_maps(process):
-    metadata_to_clear = [
-        "creationTimestamp",
-        "resourceVersion",
-        "selfLink",
-        "uid"
-    ]
-    for namespace, secrets in process.secret_files.items():
-        for secret in secrets:
-            temp_secret = f'{process.backup_directory}/secrets/{secret}.yaml'
-            with open(temp_secret, 'r') as f:
-                data = yaml.load(f, Loader=yaml.FullLoader)
-
-            for label in metadata_to_clear:
-                del data['metadata'][label]
+            exports.append((cm, found[cm]))
+
+    # Metadata tied to the source cluster is dropped before the single dump
+    for name, item in exports:
+        for label in METADATA_TO_CLEAR:
+            item['metadata'].pop(label, None)
+
+        with open(f'{secret_path}/{name}.yaml', 'wb') as f:
+            hashing = checksum.HashingWriter(f)
+            hashing.write(
+                yaml.dump(
+                    item,
+                    Dumper=YamlDumper,
+                    default_flow_style=False
+                ).encode('utf-8')
+            )
 
-            with open(temp_secret, 'w') as f:
-                yaml.dump(data, f, default_flow_style=False)
+        process.checksums.record(f'secrets/{name}.yaml', hashing)
+        process.metrics.add(bytes_written=hashing.size, files=1)
 
-    for namespace, config_maps in process.config_maps.items():
-        for cm in config_maps:
-            temp_cm = f'{process.backup_directory}/secrets/{cm}.yaml'
-            with open(temp_cm, 'r') as f:
-                data = yaml.load(f, Loader=yaml.FullLoader)
+    return
 
-            for label in metadata_to_clear:
-                del data['metadata'][label]
 
-            with open(temp_cm, 'w') as f:
-                yaml.dump(data, f, default_flow_style=False)
+@trace.traced
+def sync_files(process):
+    """
+    Run the rsync as root so the backup directory can be read without
+    changing its owner, with ssh running as the sync user. The receiving
+    rsync runs under sudo so the files keep their owners on the sync node.
+    """
+    rsync_command = [
+        'rsync',
+        '-aq',
+        f'--rsync-path={SUDO_RSYNC}',
+        '-e',
+        f'sudo -H -u {process.sync_user} /bin/ssh -q',
+        f'{process.backup_directory}/',
+        f'{process.sync_user}@{process.sync_node}:{process.backup_directory}'
+    ]
+    process.metrics.add(subprocesses=1)
+    with trace.command_span(rsync_command):
+        return_code = subprocess.run(rsync_command).returncode
+
+    if return_code != 0:
+        log.error('Could not sync the backup directory to the sync node')
+        raise exceptions.UnableToSync(
+            f'Syncing the backup directory to {process.sync_node} failed'
+        )
 
 
-def sync_files(process):
-    # Set permissions to rsync user for all of the backup directory
-    sh.chown(
-        '-R',
-        f'{process.sync_user}:{process.sync_user}',
-        f'{process.backup_directory}'
+@trace.traced
+def sync_repository_shards(process):
+    """
+    Split the repository into sync_jobs shards balanced by size and file
+    count and run an rsync for each shard at the same time. Each shard is
+    retried on its own when its rsync fails.
+    """
+    # Files are written as root on the sync node as they arrive, so only
+    # the files that changed have their owner set
+    rsync_arguments = (
+        f"--rsync-path='{SUDO_RSYNC}' --chown=root:root "
+        f'{process.repository}/ '
+        f'{process.sync_user}@{process.sync_node}:{process.repository}'
     )
+    if process.sync_jobs <= 1:
+        sync.run_shards(
+            process.metrics.bind(
+                lambda shard: process.run_su_command(
+                    process.sync_user,
+                    f'rsync -avrq {rsync_arguments}'
+                )
+            ),
+            [process.repository],
+            1
+        )
+        return
 
-    # Run the rsync to the sync server
-    rsync_command = (
-        f'rsync -avrq {process.backup_directory}/ '
-        f'{process.sync_user}@{process.sync_node}:{process.backup_directory}'
-    )
-    process.run_su_command(process.sync_user, rsync_command)
+    shards = sync.plan_shards(process.repository, process.sync_jobs)
+    list_directory, list_paths = sync.write_shard_lists(shards)
+    try:
+        sync.run_shards(
+            process.metrics.bind(
+                lambda list_path: process.run_su_command(
+                    process.sync_user,
+                    f'rsync -avrq --files-from={list_path} {rsync_arguments}'
+                )
+            ),
+            list_paths,
+            process.sync_jobs
+        )
+    finally:
+        shutil.rmtree(list_directory, ignore_errors=True)
 
+    return
 
-def sync_repositories(process):
-    # Change permissions for the repo directories
-    user_perms_command = (
-        f'/bin/ssh -t -q {process.sync_user}@{process.sync_node}'
-        f' \'sudo chown -R {process.sync_user}:{process.sync_user} '
-        f'{process.repository}\''
-    )
-    process.run_su_command(process.sync_user, user_perms_command)
 
+@trace.traced
+def sync_repositories(process):
     # Run the rsync for all of the repository directories
-    rsync_command = (
-        f'rsync -avrq {process.repository}/ '
-        f'{process.sync_user}@{process.sync_node}:{process.repository}'
-    )
-    process.run_su_command(process.sync_user, rsync_command)
-
-    # Change the permissions back after the rsync
-    root_perms_command = (
-        f'/bin/ssh -t -q {process.sync_user}@{process.sync_node}'
-        f' \'sudo chown -R root:root '
-        f'{process.repository}\''
-    )
-    process.run_su_command(process.sync_user, root_perms_command)
+    sync_repository_shards(process)
 
 
+@trace.traced
 def scale_postgres_pod(process, pod_number):
     if pod_number not in [1, 0]:
         log.error('Invalid replica count to scale for postgres')
@@ -249,56 +926,49 @@ def scale_postgres_pod(process, pod_number):
             'Invalid replica count to scale for postgres'
         )
 
-    process.kubectl(
+    process.kube.run(
         'scale',
         'deploy',
         f'--replicas={pod_number}',
         'anaconda-enterprise-postgres'
     )
-    success = False
-    while success is False:
-        if pod_number == 1:
-            try:
-                sh.grep(
-                    sh.grep(
-                        process.kubectl('get', 'pods'),
-                        'postgres'
-                    ),
-                    'Running'
-                )
-                success = True
-            except sh.ErrorReturnCode_1:
-                pass
-                """
-                Exception will be thrown as no results will be given and
-                it is running then it will exit properly
-                """
-        else:
-            try:
-                sh.grep(process.kubectl('get', 'pods'), 'postgres')
-            except sh.ErrorReturnCode_1:
-                """
-                Exception will be thrown as no results will be given which
-                is the desired result on the scale down
-                """
-                success = True
-
-        # Waiting for postgres pod to complete scale
-        time.sleep(2)
+    if pod_number == 1:
+        kube.wait_for_pods(
+            kube.postgres_running,
+            process.namespace,
+            description='postgres to start'
+        )
+    else:
+        kube.wait_for_pods(
+            kube.postgres_stopped,
+            process.namespace,
+            description='postgres to stop'
+        )
 
     return
 
 
+@trace.traced
 def cleanup_and_restore_files(process):
     timestamp = datetime.datetime.utcnow().strftime('%Y-%m-%dT%H%M%S')
-    # Compress and timestamp the existing files minus the repos
+    # Compress and timestamp the existing files minus the repos. The file
+    # list from -v is only counted as it can run into millions of lines.
+    snapshot = output.OutputCounter('Snapshot of storage', 'files')
     with sh.pushd('/opt/anaconda'):
-        sh.tar(
-            "--exclude=storage/object/anaconda-repository",
-            "-czvf",
-            f"git_pgdata.snapshot_{timestamp}.tar.gz",
-            "storage"
-        )
+        try:
+            sh.tar(
+                "--exclude=storage/object/anaconda-repository",
+                "-czvf",
+                f"git_pgdata.snapshot_{timestamp}.tar.gz",
+                "storage",
+                _out=snapshot,
+                _err=snapshot
+            )
+        except sh.ErrorReturnCode:
+            snapshot.log_tail()
+            raise
+
+    snapshot.log_summary()
 
     # Cleanup directories as things will get restored
     sh.rm('-Rf', '/opt/anaconda/storage/git')
@@ -317,104 +987,183 @@ def cleanup_and_restore_files(process):
     return
 
 
+@trace.traced
 def restart_pods(process):
     # Restart all the pods after the restore
-    process.kubectl('delete', '--all', 'pods')
+    process.kube.run('delete', '--all', 'pods')
 
     # Watch the pods and make sure they come back up
-    success = False
-    while success is False:
-        try:
-            sh.grep(
-                sh.grep(
-                    process.kubectl('get', 'pods'),
-                    '-v',
-                    'Running'
-                ),
-                '-v',
-                'NAME'
-            )
-        except sh.ErrorReturnCode_1:
-            """
-            When sh throws exception it means nothing returned
-            which is what we are waiting for
-            """
-            success = True
-
-        # Waiting for postgres pod to complete scale
-        time.sleep(2)
+    kube.wait_for_pods(
+        kube.all_pods_running,
+        process.namespace,
+        description='all pods to be running'
+    )
 
 
+@trace.traced
 def cleanup_sessions_deployments(process):
-    # Grab all sessions and deployments and remove them
-    deployments = []
-    try:
-        deployments = sh.awk(
-            sh.grep(
-                process.kubectl('get', 'deployments'),
-                'anaconda-app-\|anaconda-session-'  # noqa
+    """
+    Delete every session and app deployment with batches of names given to
+    each kubectl delete, running up to jobs batches at the same time, then
+    wait once for all of their pods to be gone.
+    """
+    deployments = [
+        name for name in process.kube.objects('deployments', process.namespace)
+        if kube.is_session(name)
+    ]
+    if not deployments:
+        return
+
+    batches = [
+        deployments[i:i + DELETE_BATCH_SIZE]
+        for i in range(0, len(deployments), DELETE_BATCH_SIZE)
+    ]
+    with futures.ThreadPoolExecutor(max_workers=max(process.jobs, 1)) as pool:
+        list(pool.map(
+            process.metrics.bind(
+                lambda batch: process.kube.run(
+                    'delete',
+                    'deployment',
+                    '--ignore-not-found',
+                    '--namespace',
+                    process.namespace,
+                    *batch
+                )
             ),
-            '{print $1}'
+            batches
+        ))
+
+    kube.wait_for_pods(
+        kube.sessions_stopped,
+        process.namespace,
+        description='sessions and deployments to stop'
+    )
+    return
+
+
+@trace.traced
+def capture_started_deployments(process, session):
+    """
+    Stream the started deployments out of postgres into a JSON lines file in
+    the backup directory, filtering and picking the columns in SQL, then
+    load them into to_start a line at a time.
+    """
+    deployments_gather = (
+        'select row_to_json(t) from (select '
+        f'{", ".join(DEPLOYMENT_COLUMNS)} from deployments where '
+        "status_text = 'Started') t;"
+    )
+    to_start_path = f'{process.backup_directory}/{DEPLOYMENTS_TO_START}'
+    try:
+        with open(f'{to_start_path}.tmp', 'w') as f:
+            for row in session.query(deployments_gather):
+                f.write(f'{row}\n')
+    except exceptions.PsqlCommandFailed as e:
+        os.remove(f'{to_start_path}.tmp')
+        log.error('Unable to get the started deployments')
+        raise exceptions.UnableToCaptureDeployments(
+            'Unable to get the started deployments from the database, '
+            f'deployments have not been cleaned up: {e}'
         )
-    except Exception:
-        # Ok if exception thrown as it means nothing was found
-        pass
 
-    for deploy in deployments:
-        process.kubectl('delete', 'deployment', deploy.strip())
+    os.replace(f'{to_start_path}.tmp', to_start_path)
+    with open(to_start_path, 'r') as f:
+        for row in f:
+            if row.strip():
+                process.to_start.append(json.loads(row))
 
     return
 
 
+@trace.traced
 def cleanup_postgres_database(process):
     # Get the docker container IDs
     process.get_postgres_docker_container()
 
-    # Cleanup the sessions so there are no running sessions in the DB
-    session_cleanup = (
-        "su - postgres -c 'psql -U postgres -d "
-        "anaconda_workspace -c \\\"delete from sessions;\\\"'"
-    )
-    process.run_command_on_container(process.docker_cont_id, session_cleanup)
+    # One psql session is used for all of the cleanup statements
+    with process.open_psql_session('anaconda_workspace') as session:
+        # Cleanup the sessions so there are no running sessions in the DB
+        session.execute('delete from sessions;')
+
+        """
+        After DB restore grab all deployments that are in a started state.
+        This will allow for deployments to be started after everything has
+        been restored properly. The capture and the cleanup of the
+        deployments happen in one transaction, so either both or neither
+        take effect.
+        """
+        session.connect('anaconda_deploy')
+        with session.transaction():
+            capture_started_deployments(process, session)
+            session.execute('truncate deployments cascade;')
+
+    return
 
+
+@trace.traced
+def apply_restore_batch(process, action, paths):
     """
-    After DB restore grab all deployments that are in a started state. This
-    will allow for deployments to be started after everything has been
-    restored properly
+    Run kubectl replace or create for a batch of files in one call. kubectl
+    carries on past the objects that fail, so the names it reports back are
+    the ones that worked.
     """
-    deployments_gather = (
-        "su - postgres -c 'psql -t -U postgres -d anaconda_deploy "
-        "-c \\\"select row_to_json(t) from(select * from deployments) t;\\\"'"
-    )
-    return_select = process.run_command_on_container(
-        process.docker_cont_id,
-        deployments_gather,
-        return_value=True
-    )
-    rows = return_select.decode('utf-8').split('\n')
-    for row in rows:
-        if row != '':
-            temp_row = json.loads(row)
-            if temp_row.get('status_text', None) == 'Started':
-                process.to_start.append(temp_row)
+    args = [action]
+    for path in paths:
+        args.extend(['-f', path])
 
-    # Cleanup the deployments so there are no running deployments in the DB
-    deployments_cleanup = (
-        "su - postgres -c 'psql -U postgres -d "
-        "anaconda_deploy -c \\\"truncate deployments cascade;\\\"'"
-    )
-    process.run_command_on_container(
-        process.docker_cont_id,
-        deployments_cleanup
-    )
-    return
+    try:
+        kubectl_output = str(process.kube.run(*args))
+    except sh.ErrorReturnCode as e:
+        kubectl_output = e.stdout.decode('utf-8')
+        log.info(f'Not every file could be {action}d: {e.stderr.decode()}')
+
+    done = set()
+    for line in kubectl_output.splitlines():
+        match = RESTORE_RESULT.match(line.strip())
+        if match:
+            done.add(match.group(1))
+
+    return done
+
+
+def restore_object_name(path):
+    # Files are written by the backup as <object name>.yaml
+    return os.path.basename(path)[:-len('.yaml')]
+
+
+@trace.traced
+def restore_batch(process, paths):
+    results = {}
+    names = {restore_object_name(path): path for path in paths}
+    replaced = apply_restore_batch(process, 'replace', paths)
+    missing = [path for name, path in names.items() if name not in replaced]
+    created = set()
+    if missing:
+        created = apply_restore_batch(process, 'create', missing)
+
+    for name in names:
+        if name in replaced:
+            results[name] = 'replaced'
+        elif name in created:
+            results[name] = 'created'
+        else:
+            results[name] = 'failed'
+
+    return results
 
 
+@trace.traced
 def restoring_files(process):
-    # Grab all of the yaml files that were backed up and replace/create them
-    # within the restore cluster
-    restore_files = glob.glob(f'{process.backup_directory}/secrets/*.yaml')
-    for restore in restore_files:
+    """
+    Replace the backed up secrets and config maps in the restore cluster,
+    creating the ones that do not exist yet. The files are sent to kubectl
+    in batches with up to jobs batches running at the same time. Returns
+    the result for each object.
+    """
+    restore_files = []
+    for restore in sorted(
+        glob.glob(f'{process.backup_directory}/secrets/*.yaml')
+    ):
         if (
             process.no_config and
             'anaconda-enterprise-anaconda-platform.yml' in restore
@@ -422,29 +1171,86 @@ def restoring_files(process):
             log.info('Skipping platform config due to passed in option')
             continue
 
-        restored = False
-        try:
-            replace_return = process.kubectl('replace', '-f', restore)
-            if 'replaced' in replace_return:
-                restored = True
-        except sh.ErrorReturnCode_1:
-            log.info(f'File {restore} was not able to be replaced')
+        restore_files.append(restore)
 
-        if not restored and 'NotFound' in replace_return:
-            try:
-                create_return = process.kubectl('create', '-f', restore)
-                if 'created' in create_return:
-                    restored = True
-            except sh.ErrorReturnCode_1:
-                log.info(f'File {restore} was not able to be created')
+    batches = [
+        restore_files[i:i + RESTORE_BATCH_SIZE]
+        for i in range(0, len(restore_files), RESTORE_BATCH_SIZE)
+    ]
+    results = {}
+    with futures.ThreadPoolExecutor(max_workers=max(process.jobs, 1)) as pool:
+        for batch_results in pool.map(
+            process.metrics.bind(lambda batch: restore_batch(process, batch)),
+            batches
+        ):
+            results.update(batch_results)
+
+    process.metrics.add(files=len(results))
+
+    failed = sorted(
+        name for name, result in results.items() if result == 'failed'
+    )
+    for name, result in sorted(results.items()):
+        log.info(f'File {name} was {result}')
+
+    log.info(
+        f'Restored {len(results) - len(failed)} of {len(results)} files'
+    )
+    if failed:
+        log.error(f'Files not able to be restored: {", ".join(failed)}')
 
-        if restored:
-            log.info(f'File {restore} was succefully restored')
+    return results
 
 
+@trace.traced
+def parallel_restore_repo_db(process):
+    """
+    Restore the directory format dump with pg_restore --jobs. pg_restore
+    creates the schema first, then loads the data in parallel and only builds
+    the indexes and constraints once all of the rows are in.
+    """
+    # Move the backup to the DB directory so the container can see it
+    if os.path.exists(process.postgres_system_repo_directory_path):
+        sh.rm('-Rf', process.postgres_system_repo_directory_path)
+
+    sh.mv(
+        f'{process.backup_directory}/{process.repository_db_directory_name}',
+        process.postgres_system_repo_directory_path
+    )
+    sh.chown(
+        '-R',
+        'polkitd:input',
+        process.postgres_system_repo_directory_path
+    )
+
+    restore_command = (
+        "su - postgres -c 'pg_restore -U postgres --clean --if-exists "
+        f"--jobs={process.postgres_jobs} -d anaconda_repository "
+        f"{process.postgres_container_repo_directory_path}'"
+    )
+    return_code = process.run_command_on_container(
+        process.docker_cont_id,
+        restore_command
+    )
+    if return_code != 0:
+        log.error('Restoring the repository database failed')
+        raise exceptions.NoPostgresBackup(
+            f'pg_restore exited with {return_code} while restoring '
+            f'{process.repository_db_directory_name}'
+        )
+
+
+@trace.traced
 def restore_repo_db(process):
     process.get_postgres_docker_container()
 
+    # Directory format backups are restored in parallel
+    if os.path.isdir(
+        f'{process.backup_directory}/{process.repository_db_directory_name}'
+    ):
+        parallel_restore_repo_db(process)
+        return
+
     # Copy backup to the DB directory so the container can see it
     sh.mv(
         f'{process.backup_directory}/{process.repository_db_name}',
@@ -465,6 +1271,7 @@ def restore_repo_db(process):
     process.run_command_on_container(process.docker_cont_id, restore_command)
 
 
+@trace.traced
 def restore_deployments(process):
     """
     This is specific request and is not implemented in the general code
@@ -472,6 +1279,111 @@ def restore_deployments(process):
     pass
 
 
+def backup_stages(process):
+    """
+    Stages for the backup with the stages they depend on. Stages that do
+    not depend on each other touch separate data and can run at the same
+    time.
+    """
+    if process.repos_only:
+        if process.postgres_mode == 'parallel':
+            repository_backup = parallel_backup_repository_db
+        else:
+            repository_backup = backup_repository_db
+
+        stages = [
+            scheduler.Stage(
+                'repository-db',
+                lambda: repository_backup(process),
+                message='Backing up repository database'
+            )
+        ]
+    else:
+        if process.postgres_mode == 'stream':
+            postgres_backup = stream_postgres_database
+        elif process.postgres_mode == 'parallel':
+            postgres_backup = parallel_backup_postgres_database
+        else:
+            postgres_backup = backup_postgres_database
+
+        stages = [
+            scheduler.Stage(
+                'postgres',
+                lambda: postgres_backup(process),
+                message='Backing up postgres database'
+            ),
+            scheduler.Stage(
+                'gravity',
+                lambda: process.gravity_backup_restore('backup'),
+                message='Running gravity backup'
+            ),
+            scheduler.Stage(
+                'storage',
+                lambda: file_backup_restore(process, 'backup'),
+                message='Packaging all of the files with tar'
+            ),
+            scheduler.Stage(
+                'secrets',
+                lambda: backup_secrets_config_maps(process),
+                message='Backing up all secrets'
+            )
+        ]
+
+    # Checksum everything that was written before signalling the restore
+    stages.append(
+        scheduler.Stage(
+            'checksums',
+            lambda: checksum.write_manifest(
+                process.backup_directory,
+                process.checksums.recorded()
+            ),
+            depends=[stage.name for stage in stages],
+            message='Writing checksums for the backup files'
+        )
+    )
+
+    # Drop in signal file to indicate good to restore
+    stages.append(
+        scheduler.Stage(
+            'signal',
+            process.add_signal_for_restore,
+            depends=['checksums'],
+            message='Adding signal for restore'
+        )
+    )
+    last_stage = 'signal'
+    if process.archive:
+        stages.append(
+            scheduler.Stage(
+                'archive',
+                process.create_tar_archive,
+                depends=['signal'],
+                message='Creating tar archive for backup'
+            )
+        )
+        last_stage = 'archive'
+
+    # Sync the files if requested
+    if process.sync_files:
+        stages.append(
+            scheduler.Stage(
+                'sync-repositories',
+                lambda: sync_repositories(process),
+                message='Syncing up repositories to restore cluster'
+            )
+        )
+        stages.append(
+            scheduler.Stage(
+                'sync-files',
+                lambda: sync_files(process),
+                depends=[last_stage],
+                message='Syncing all backup files to restore cluster'
+            )
+        )
+
+    return stages
+
+
 def handle_arguments():
     description = 'Backup or restore your Anaconda Enterprise install'
     parser = argparse.ArgumentParser(description=description)
@@ -505,6 +1417,26 @@ def handle_arguments():
             ' used to transfer the backup files. Default user is root'
         )
     )
+    sync_group.add_argument(
+        '--stream-sync',
+        required=False,
+        default=False,
+        action='store_true',
+        help=(
+            'Stream the storage backup straight to the sync node instead of '
+            'writing it to the local backup directory first. Default is False'
+        )
+    )
+    sync_group.add_argument(
+        '--sync-jobs',
+        required=False,
+        default=1,
+        type=int,
+        help=(
+            'Number of rsync transfers to run at the same time when syncing '
+            'the repository, each with a shard of it. Default is 1'
+        )
+    )
     sync_group.add_argument(
         '-n',
         '--sync-node',
@@ -519,8 +1451,11 @@ def handle_arguments():
         '-a',
         '--action',
         required=True,
-        choices=['backup', 'restore'],
-        help='Action to perform on the cluster.'
+        choices=['backup', 'restore', 'verify'],
+        help=(
+            'Action to perform on the cluster. verify checks the backup '
+            'files, or the --restore-file archive, against their checksums'
+        )
     )
     parser.add_argument(
         '-d',
@@ -542,6 +1477,76 @@ def handle_arguments():
             'as arguments'
         )
     )
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        required=False,
+        default=1,
+        type=int,
+        help=(
+            'Number of backup stages to run at the same time. Stages that '
+            'do not depend on each other, like the postgres dump and the '
+            'storage backup, run in parallel. On restore, the number of '
+            'batches of secrets and config maps applied at the same time. '
+            'Default is 1'
+        )
+    )
+    parser.add_argument(
+        '--postgres-mode',
+        required=False,
+        default='file',
+        choices=['file', 'stream', 'parallel'],
+        help=(
+            'How to get the postgres dump out of the container. file writes '
+            'the dump to the postgres data volume and moves it, stream pipes '
+            'it out of the container and compresses it on the fly, parallel '
+            'dumps each database in directory format with pg_dump -j. '
+            'Default is file'
+        )
+    )
+    parser.add_argument(
+        '--postgres-jobs',
+        required=False,
+        default=4,
+        type=int,
+        help=(
+            'Number of workers for the parallel postgres backup and restore, '
+            'split between the databases in flight and pg_dump/pg_restore -j.'
+            ' Default is 4'
+        )
+    )
+    parser.add_argument(
+        '--compression',
+        required=False,
+        default='gzip',
+        choices=compression.COMPRESSION_TYPES,
+        help=(
+            'Compression to use for the storage backup. '
+            'pigz-style-parallel compresses blocks across all of the cores '
+            'and is still readable with tar -xzf. Default is gzip'
+        )
+    )
+    parser.add_argument(
+        '--incremental',
+        required=False,
+        default=False,
+        action='store_true',
+        help=(
+            'Only package the storage files that changed since the last '
+            'backup. The first run takes a full base backup. Default is False'
+        )
+    )
+    parser.add_argument(
+        '--chunk-store',
+        required=False,
+        default=False,
+        action='store_true',
+        help=(
+            'Store the storage backup and archive as deduplicated chunks '
+            'under [BACKUP_DIRECTORY]/chunks, with a small snapshot index for '
+            'each run. Default is False'
+        )
+    )
     parser.add_argument(
         '--archive',
         required=False,
@@ -566,6 +1571,16 @@ def handle_arguments():
         action='store_true',
         help='Do not restore the config files to the system. Default is False'
     )
+    restore_group.add_argument(
+        '--no-verify',
+        required=False,
+        default=False,
+        action='store_true',
+        help=(
+            'Do not check the backup files against their checksums before '
+            'the restore. Default is False'
+        )
+    )
     restore_group.add_argument(
         '--start-deployments',
         required=False,
@@ -576,124 +1591,229 @@ def handle_arguments():
             'the restore destination'
         )
     )
+    parser.add_argument(
+        '--metrics-textfile',
+        required=False,
+        default=None,
+        help=(
+            'Write the time, bytes, files and commands of each stage to this '
+            'file in the Prometheus text format, for the node exporter '
+            'textfile collector. The file name should end in .prom'
+        )
+    )
+    parser.add_argument(
+        '--report',
+        required=False,
+        default=None,
+        help='Write a JSON report of each stage of the run to this file'
+    )
+    parser.add_argument(
+        '--trace',
+        required=False,
+        default=None,
+        help=(
+            'Write a Chrome trace of the stages and commands of the run to '
+            'this file, which can be opened in Perfetto or about:tracing'
+        )
+    )
     restore_group.add_argument(
         '--restore-file',
         required=False,
         help='Specify the tar file to restore.'
     )
     args = parser.parse_args()
+    # Fail before any of the backup is written, not when the dump starts
+    if args.compression == 'zstd' and compression.zstandard is None:
+        parser.error('--compression zstd requires the zstandard package')
+
     return args
 
 
-def main():
-    arguments = handle_arguments()
-    try:
-        process = Accord(arguments)
-    except exceptions.RestoreSignal:
-        log.error(
-            'Signal file for restore not found so not performing '
-            'restore of AE5'
+def run_step(process, name, message, function, *args):
+    # Restore steps run one after the other and are timed like the stages
+    log.info(message)
+    with process.metrics.stage(name):
+        return function(*args)
+
+
+def restore(process):
+    if process.restore_file is not None:
+        run_step(
+            process,
+            'extract-archive',
+            'Extracting the backup archive',
+            process.extract_tar_archive
         )
-        sys.exit(1)
 
-    if process.action == 'backup':
-        if process.repos_only:
-            # Backup the repository database only
-            log.info('Backing up repository database')
-            backup_repository_db(process)
-        else:
-            # Backup the full database
-            log.info('Backing up postgres database')
-            backup_postgres_database(process)
-
-            # Backup gravity
-            log.info('Running gravity backup')
-            process.gravity_backup_restore('backup')
-
-            # tar up all of the files
-            log.info('Packaging all of the files with tar')
-            file_backup_restore(process, process.action)
-
-            # Backup the secrets
-            log.info('Backing up all secrets')
-            backup_secrets_config_maps(process)
-
-            # Clean all of the secrets
-            log.info('Sanitizing secrets')
-            sanitize_secrets_config_maps(process)
-
-        # Drop in signal file to indicate good to restore
-        log.info('Adding signal for restore')
-        process.add_signal_for_restore()
-
-        if process.archive:
-            log.info('Creating tar archive for backup')
-            process.create_tar_archive()
-
-        # Sync the files if requested
-        if process.sync_files:
-            # Sync the anaconda repositories
-            log.info('Syncing up repositories to restore cluster')
-            sync_repositories(process)
-            # Sync the backup files
-            log.info('Syncing all backup files to restore cluster')
-            sync_files(process)
-
-    elif process.action == 'restore':
-        if process.restore_file is not None:
-            process.extract_tar_archive()
-
-            # After extract check for the restore signle file
-            log.info('Checking for restore signal file')
-            if not process.check_for_restore():
-                raise exceptions.RestoreSignal(
-                    'Restore signal file not found, closing application'
-                )
+        # After extract check for the restore signle file
+        log.info('Checking for restore signal file')
+        if not process.check_for_restore():
+            raise exceptions.RestoreSignal(
+                'Restore signal file not found, closing application'
+            )
 
-        if process.repos_only:
-            # Restore the repository database only
-            log.info('Restoring repositories only')
-            restore_repo_db(process)
-        else:
-            # Cleanup any existing deployments or sessions running
-            log.info('Cleaning up sessions and deployments')
-            cleanup_sessions_deployments(process)
+    if process.verify:
+        # Nothing has been touched yet so a bad backup stops here
+        run_step(
+            process,
+            'verify',
+            'Verifying backup files against their checksums',
+            process.verify_backup
+        )
+
+    if process.repos_only:
+        # Restore the repository database only
+        run_step(
+            process,
+            'restore-repository-db',
+            'Restoring repositories only',
+            restore_repo_db,
+            process
+        )
+    else:
+        # Cleanup any existing deployments or sessions running
+        run_step(
+            process,
+            'cleanup-sessions',
+            'Cleaning up sessions and deployments',
+            cleanup_sessions_deployments,
+            process
+        )
+
+        # Scale the postgres pod down to 0 so we can do some work
+        run_step(
+            process,
+            'scale-down-postgres',
+            'Scaling down postgres pod for restore',
+            scale_postgres_pod,
+            process,
+            0
+        )
 
-            # Scale the postgres pod down to 0 so we can do some work
-            log.info('Scaling down postgres pod for restore')
-            scale_postgres_pod(process, 0)
+        # Cleanup the existing files and restore the backup
+        run_step(
+            process,
+            'restore-files',
+            'Cleanup and setup directories for restore',
+            cleanup_and_restore_files,
+            process
+        )
+
+        # Scale the postgres pod up to 1
+        run_step(
+            process,
+            'scale-up-postgres',
+            'Scaling up postgres pod after restore',
+            scale_postgres_pod,
+            process,
+            1
+        )
 
-            # Cleanup the existing files and restore the backup
-            log.info('Cleanup and setup directories for restore')
-            cleanup_and_restore_files(process)
+        # Restore the postgres database
+        run_step(
+            process,
+            'restore-postgres',
+            'Restoring postgres database',
+            restore_postgres_database,
+            process
+        )
 
-            # Scale the postgres pod up to 1
-            log.info('Scaling up postgres pod after restore')
-            scale_postgres_pod(process, 1)
+        # Cleanup sessions and deployments
+        run_step(
+            process,
+            'cleanup-postgres',
+            'Cleaning up postgres database',
+            cleanup_postgres_database,
+            process
+        )
 
-            # Restore the postgres database
-            log.info('Restoring postgres database')
-            restore_postgres_database(process)
+        # Restore secrets/configmaps for cluster
+        run_step(
+            process,
+            'restore-secrets',
+            'Restoring files',
+            restoring_files,
+            process
+        )
 
-            # Cleanup sessions and deployments
-            log.info('Cleaning up postgres database')
-            cleanup_postgres_database(process)
+        # Restart the pods
+        run_step(
+            process,
+            'restart-pods',
+            'Restarting all pods',
+            restart_pods,
+            process
+        )
 
-            # Restore secrets/configmaps for cluster
-            log.info('Restoring files')
-            restoring_files(process)
+        if process.start_deployments:
+            # Restore deployments
+            run_step(
+                process,
+                'start-deployments',
+                'Starting up deployments that should be running',
+                restore_deployments,
+                process
+            )
 
-            # Restart the pods
-            log.info('Restarting all pods')
-            restart_pods(process)
+    log.info('Cleaning up restore file')
+    process.remove_signal_restore_file()
 
-            if process.start_deployments:
-                # Restore deployments
-                log.info('Starting up deployments that should be running')
-                restore_deployments(process)
 
-        log.info('Cleaning up restore file')
-        process.remove_signal_restore_file()
+def write_metrics(process, arguments):
+    # A run that failed still reports how far it got
+    try:
+        if arguments.metrics_textfile:
+            process.metrics.write_textfile(arguments.metrics_textfile)
+
+        if arguments.report:
+            process.metrics.write_report(arguments.report)
+    except OSError as e:
+        log.error(f'Unable to write the run metrics: {e}')
+
+
+def run_action(arguments):
+    try:
+        process = Accord(arguments)
+    except exceptions.RestoreSignal:
+        log.error(
+            'Signal file for restore not found so not performing '
+            'restore of AE5'
+        )
+        sys.exit(1)
+
+    error = None
+    try:
+        if process.action == 'backup':
+            scheduler.run_stages(
+                backup_stages(process),
+                process.jobs,
+                process.metrics
+            )
+        elif process.action == 'verify':
+            with process.metrics.stage('verify'):
+                if process.restore_file is not None:
+                    process.verify_archive()
+                else:
+                    process.verify_backup(required=True)
+        elif process.action == 'restore':
+            restore(process)
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        process.metrics.finish(error)
+        write_metrics(process, arguments)
+
+
+def main():
+    arguments = handle_arguments()
+    if arguments.trace:
+        trace.start()
+
+    try:
+        run_action(arguments)
+    finally:
+        trace.stop(arguments.trace)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,109 @@
+
+from accord import exceptions
+from accord import common
+
+
+import contextlib
+import subprocess
+import threading
+import itertools
+
+
+log = common.define_logging_facility()
+
+
+PSQL_COMMAND = 'psql -U postgres -X -q -A -t -v ON_ERROR_STOP=1 -d {0}'
+
+
+class PsqlSession(object):
+    """
+    One long running psql process that statements are piped through. After
+    each statement a marker is echoed so the output of the statement can be
+    read back, or streamed, up to the marker. psql stops on the first error
+    which rolls back any open transaction.
+    """
+    def __init__(self, command):
+        self.process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True
+        )
+        self.counter = itertools.count()
+        self.errors = []
+        # Drain stderr so notices can never fill the pipe and block psql
+        self.error_reader = threading.Thread(
+            target=lambda: self.errors.extend(self.process.stderr),
+            daemon=True
+        )
+        self.error_reader.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def query(self, statement):
+        """
+        Run the statement and yield each line of its output as it is read.
+        The lines have to be consumed before the next statement is run.
+        """
+        marker = f'__accord_done_{next(self.counter)}__'
+        try:
+            self.process.stdin.write(f'{statement}\n\\echo {marker}\n')
+            self.process.stdin.flush()
+        except (BrokenPipeError, ValueError):
+            self.failed(statement)
+
+        for line in self.process.stdout:
+            line = line.rstrip('\n')
+            if line == marker:
+                return
+
+            yield line
+
+        self.failed(statement)
+
+    def execute(self, statement):
+        for _ in self.query(statement):
+            pass
+
+    def connect(self, database):
+        self.execute(f'\\connect {database}')
+
+    @contextlib.contextmanager
+    def transaction(self):
+        self.execute('BEGIN;')
+        try:
+            yield self
+        except Exception:
+            if self.process.poll() is None:
+                self.execute('ROLLBACK;')
+
+            raise
+
+        self.execute('COMMIT;')
+
+    def failed(self, statement):
+        return_code = self.process.wait()
+        self.error_reader.join()
+        message = ''.join(self.errors).strip()
+        log.error(f'psql exited with {return_code} running: {statement}')
+        raise exceptions.PsqlCommandFailed(
+            f'psql exited with {return_code}: {message}'
+        )
+
+    def close(self):
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.write('\\q\n')
+                self.process.stdin.close()
+            except (BrokenPipeError, ValueError):
+                pass
+
+        self.process.wait()
+        self.error_reader.join()
+        self.process.stdout.close()
+        self.process.stderr.close()
@@ -0,0 +1,106 @@
+
+from accord import exceptions
+from accord import common
+
+
+from concurrent import futures
+
+
+log = common.define_logging_facility()
+
+
+class Stage(object):
+    def __init__(self, name, function, depends=None, message=None):
+        self.name = name
+        self.function = function
+        self.depends = depends or []
+        self.message = message
+
+
+def validate_stages(stages):
+    names = [stage.name for stage in stages]
+    if len(set(names)) != len(names):
+        raise exceptions.InvalidStageGraph('Stage names must be unique')
+
+    for stage in stages:
+        for depend in stage.depends:
+            if depend not in names:
+                raise exceptions.InvalidStageGraph(
+                    f'Stage {stage.name} depends on unknown stage {depend}'
+                )
+
+    # Walk the graph to make sure that every stage is able to run
+    done = set()
+    remaining = list(stages)
+    while remaining:
+        ready = [s for s in remaining if set(s.depends) <= done]
+        if not ready:
+            raise exceptions.InvalidStageGraph(
+                'Stages have a dependency cycle: '
+                f'{", ".join(s.name for s in remaining)}'
+            )
+
+        for stage in ready:
+            done.add(stage.name)
+            remaining.remove(stage)
+
+
+def timed_stage(stage, metrics):
+    with metrics.stage(stage.name):
+        return stage.function()
+
+
+def run_stages(stages, jobs=1, metrics=None):
+    """
+    Run the stages with up to jobs of them at the same time. A stage starts
+    as soon as everything it depends on has finished, and stages are started
+    in the order they were declared. After a failure no new stages are
+    started and the first exception is raised once the running ones finish.
+    Each stage is timed in metrics when it is given.
+    """
+    validate_stages(stages)
+    jobs = max(jobs, 1)
+    done = set()
+    waiting = list(stages)
+    running = {}
+    error = None
+    with futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        while waiting or running:
+            if error is None:
+                for stage in list(waiting):
+                    if len(running) >= jobs:
+                        break
+
+                    if set(stage.depends) <= done:
+                        if stage.message:
+                            log.info(stage.message)
+
+                        waiting.remove(stage)
+                        if metrics is None:
+                            future = pool.submit(stage.function)
+                        else:
+                            future = pool.submit(timed_stage, stage, metrics)
+
+                        running[future] = stage
+
+            if not running:
+                break
+
+            finished, _ = futures.wait(
+                running,
+                return_when=futures.FIRST_COMPLETED
+            )
+            for future in finished:
+                stage = running.pop(future)
+                try:
+                    future.result()
+                    done.add(stage.name)
+                except Exception as e:
+                    log.error(f'Stage {stage.name} failed: {e}')
+                    if error is None:
+                        error = e
+
+    if error is not None:
+        raise error
+
+    return
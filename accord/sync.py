@@ -0,0 +1,159 @@
+
+from accord import exceptions
+from accord import common
+from accord import trace
+
+
+from concurrent import futures
+import tempfile
+import heapq
+import time
+import os
+
+
+log = common.define_logging_facility()
+
+
+# Rough cost of a file in bytes, so many small files weigh in on a shard
+FILE_COST = 64 * 1024
+SYNC_RETRIES = 3
+RETRY_DELAY = 2
+
+
+def weigh_directory(path, relative, children):
+    """
+    Walks the directory once, bottom up, and returns its size in bytes and
+    number of files. The weight and path of every entry is cached in
+    children, keyed by the path of its directory relative to the top.
+    """
+    size = 0
+    files = 0
+    entries = []
+    with os.scandir(path) as scan:
+        for entry in sorted(scan, key=lambda e: e.name):
+            entry_path = os.path.normpath(f'{relative}/{entry.name}')
+            # Symlinks to directories count as files and are not followed
+            if entry.is_dir(follow_symlinks=False):
+                entry_size, entry_files = weigh_directory(
+                    entry.path,
+                    entry_path,
+                    children
+                )
+            else:
+                entry_size = entry.stat(follow_symlinks=False).st_size
+                entry_files = 1
+
+            size += entry_size
+            files += entry_files
+            entries.append((entry_size + entry_files * FILE_COST, entry_path))
+
+    children[relative] = entries
+    return size, files
+
+
+def tree_weight(path):
+    """
+    Returns the size in bytes and the number of files under path, without
+    following symlinks.
+    """
+    if not os.path.isdir(path) or os.path.islink(path):
+        return os.lstat(path).st_size, 1
+
+    return weigh_directory(path, '.', {})
+
+
+def sync_units(children, relative, share):
+    """
+    Split the tree into units to hand out to the shards. Directories that
+    are heavier than a fair share are split into their children so one
+    large directory does not leave the other shards idle.
+    """
+    units = []
+    for weight, path in children[relative]:
+        if weight > share and children.get(path):
+            units.extend(sync_units(children, path, share))
+        else:
+            units.append((weight, path))
+
+    return units
+
+
+def plan_shards(source_directory, shards):
+    """
+    Balance the tree under source_directory into shards lists of relative
+    paths by size and file count, giving the heaviest unit left to the
+    lightest shard each time.
+    """
+    children = {}
+    size, files = weigh_directory(source_directory, '.', children)
+    share = (size + files * FILE_COST) / shards
+    loads = [(0, i, []) for i in range(shards)]
+    for weight, path in sorted(
+        sync_units(children, '.', share),
+        reverse=True
+    ):
+        load, i, paths = heapq.heappop(loads)
+        paths.append(path)
+        heapq.heappush(loads, (load + weight, i, paths))
+
+    return [
+        paths for _, _, paths in sorted(loads, key=lambda s: s[1]) if paths
+    ]
+
+
+def write_shard_lists(shards):
+    # The lists are read by rsync running as the sync user
+    list_directory = tempfile.mkdtemp(prefix='accord_sync_')
+    os.chmod(list_directory, 0o755)
+    list_paths = []
+    for i, paths in enumerate(shards):
+        list_path = f'{list_directory}/shard_{i}.txt'
+        with open(list_path, 'w') as f:
+            for path in paths:
+                f.write(f'{path}\n')
+
+        os.chmod(list_path, 0o644)
+        list_paths.append(list_path)
+
+    return list_directory, list_paths
+
+
+def run_with_retries(run_shard, shard, retries=SYNC_RETRIES):
+    for attempt in range(1, retries + 1):
+        return_code = run_shard(shard)
+        if not return_code:
+            return True
+
+        log.warning(
+            f'Sync of shard {shard} failed with {return_code}, '
+            f'attempt {attempt} of {retries}'
+        )
+        if attempt < retries:
+            delay = RETRY_DELAY * 2 ** (attempt - 1)
+            with trace.span('sleep', 'wait', seconds=delay):
+                time.sleep(delay)
+
+    return False
+
+
+def run_shards(run_shard, shards, jobs, retries=SYNC_RETRIES):
+    """
+    Run run_shard for every shard with up to jobs at the same time. A shard
+    that fails is retried on its own and UnableToSync is raised at the end
+    if any shard never made it.
+    """
+    with futures.ThreadPoolExecutor(max_workers=max(jobs, 1)) as pool:
+        results = list(pool.map(
+            lambda shard: run_with_retries(run_shard, shard, retries),
+            shards
+        ))
+
+    failed = [shard for shard, done in zip(shards, results) if not done]
+    if failed:
+        log.error(f'Unable to sync shards: {failed}')
+        raise exceptions.UnableToSync(
+            f'{len(failed)} of {len(shards)} sync shards failed after '
+            f'{retries} attempts'
+        )
+
+    return
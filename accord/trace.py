@@ -0,0 +1,155 @@
+
+from accord import common
+
+
+import contextlib
+import functools
+import threading
+import json
+import time
+import os
+
+
+log = common.define_logging_facility()
+
+
+# Longest command line kept on a span
+MAX_COMMAND_LENGTH = 200
+
+# The tracer for the run, None unless --trace was given
+tracer = None
+
+
+class Tracer(object):
+    """
+    Collects complete events in the Chrome trace event format, so a run can
+    be opened in Perfetto or about:tracing. Each thread shows as a track of
+    its own.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+        self.threads = set()
+        self.pid = os.getpid()
+        self.start = time.perf_counter()
+
+    def timestamp(self):
+        # Trace events are in microseconds
+        return (time.perf_counter() - self.start) * 1000000
+
+    def add_span(self, name, category, start, end, args=None):
+        thread = threading.current_thread()
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': round(start, 1),
+            'dur': round(end - start, 1),
+            'pid': self.pid,
+            'tid': thread.ident
+        }
+        if args:
+            event['args'] = args
+
+        with self.lock:
+            if thread.ident not in self.threads:
+                self.threads.add(thread.ident)
+                self.events.append({
+                    'name': 'thread_name',
+                    'ph': 'M',
+                    'pid': self.pid,
+                    'tid': thread.ident,
+                    'args': {'name': thread.name}
+                })
+
+            self.events.append(event)
+
+    def write(self, trace_path):
+        with self.lock:
+            events = list(self.events)
+
+        temp_path = f'{trace_path}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(
+                {'traceEvents': events, 'displayTimeUnit': 'ms'},
+                f
+            )
+
+        os.rename(temp_path, trace_path)
+
+
+@contextlib.contextmanager
+def span(name, category='function', **args):
+    if tracer is None:
+        yield
+        return
+
+    start = tracer.timestamp()
+    try:
+        yield
+    except BaseException as e:
+        args['error'] = str(e)[:MAX_COMMAND_LENGTH]
+        raise
+    finally:
+        tracer.add_span(name, category, start, tracer.timestamp(), args)
+
+
+def traced(function):
+    # Record a span for every call of the function while tracing
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if tracer is None:
+            return function(*args, **kwargs)
+
+        with span(function.__name__):
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+def command_line(command):
+    if isinstance(command, (list, tuple)):
+        command = ' '.join(str(part) for part in command)
+
+    return str(command)[:MAX_COMMAND_LENGTH]
+
+
+def command_name(command):
+    if isinstance(command, (list, tuple)):
+        command = command[0] if command else ''
+
+    return os.path.basename(str(command).split(' ')[0])
+
+
+def command_span(command, **args):
+    # Span for an external command, named after the program it runs
+    return span(
+        command_name(command),
+        'command',
+        command=command_line(command),
+        **args
+    )
+
+
+def start():
+    """
+    Start tracing the run. Spans are recorded until stop() is called.
+    """
+    global tracer
+    tracer = Tracer()
+    return tracer
+
+
+def stop(trace_path=None):
+    global tracer
+    if tracer is None:
+        return
+
+    try:
+        if trace_path:
+            tracer.write(trace_path)
+            log.info(f'Wrote trace of the run to {trace_path}')
+    except OSError as e:
+        log.error(f'Unable to write the trace: {e}')
+    finally:
+        tracer = None
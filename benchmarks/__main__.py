@@ -0,0 +1,6 @@
+
+from benchmarks import run
+
+
+if __name__ == '__main__':
+    run.main()
@@ -0,0 +1,232 @@
+
+import contextlib
+import random
+import base64
+import fcntl
+import json
+import time
+import os
+
+
+POSTGRES_DEPLOYMENT = 'anaconda-enterprise-postgres'
+PLATFORM_DEPLOYMENTS = [
+    POSTGRES_DEPLOYMENT,
+    'anaconda-enterprise-ap-auth',
+    'anaconda-enterprise-ap-deploy',
+    'anaconda-enterprise-ap-git-storage',
+    'anaconda-enterprise-ap-object-storage',
+    'anaconda-enterprise-ap-repository',
+    'anaconda-enterprise-ap-storage',
+    'anaconda-enterprise-ap-ui',
+    'anaconda-enterprise-ap-workspace',
+    'anaconda-enterprise-nginx-ingress'
+]
+
+
+class Cluster(object):
+    """
+    Cluster state for the kubectl stand-in, kept in a JSON file so that
+    every kubectl call sees the changes made by the ones before it. Pods
+    take pod_delay seconds to start or go away, like they do on a real
+    cluster, and every call takes latency seconds for the API round trip.
+    """
+    def __init__(self, state_path):
+        self.state_path = state_path
+
+    @contextlib.contextmanager
+    def state(self, write=False):
+        with open(f'{self.state_path}.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if write else fcntl.LOCK_SH)
+            with open(self.state_path) as f:
+                state = json.load(f)
+
+            settle(state, time.time())
+            yield state
+            if write:
+                temp_path = f'{self.state_path}.tmp'
+                with open(temp_path, 'w') as f:
+                    json.dump(state, f)
+
+                os.rename(temp_path, self.state_path)
+
+    def items(self, kind, namespace):
+        with self.state() as state:
+            return list(
+                state['objects'].get(namespace, {}).get(kind, {}).values()
+            )
+
+
+def pod(name, namespace, phase='Running', ready_at=None):
+    return {
+        'apiVersion': 'v1',
+        'kind': 'Pod',
+        'metadata': {'name': name, 'namespace': namespace},
+        'status': {
+            'phase': phase,
+            'containerStatuses': [
+                {'containerID': f'docker://{os.urandom(32).hex()}'}
+            ]
+        },
+        'ready_at': ready_at
+    }
+
+
+def pod_name(deployment):
+    return f'{deployment}-{os.urandom(5).hex()}'
+
+
+def deployment(name, namespace):
+    return {
+        'apiVersion': 'apps/v1',
+        'kind': 'Deployment',
+        'metadata': {'name': name, 'namespace': namespace},
+        'spec': {'replicas': 1}
+    }
+
+
+def secret(name, namespace, rng, size=2048):
+    data = rng.getrandbits(size * 8).to_bytes(size, 'little')
+    return {
+        'apiVersion': 'v1',
+        'kind': 'Secret',
+        'type': 'Opaque',
+        'metadata': {
+            'name': name,
+            'namespace': namespace,
+            'uid': f'{rng.getrandbits(128):032x}',
+            'resourceVersion': str(rng.randrange(1000000)),
+            'creationTimestamp': '2020-01-01T00:00:00Z'
+        },
+        'data': {'content': base64.b64encode(data).decode('ascii')}
+    }
+
+
+def config_map(name, namespace, size=16384):
+    return {
+        'apiVersion': 'v1',
+        'kind': 'ConfigMap',
+        'metadata': {'name': name, 'namespace': namespace},
+        'data': {name: 'setting: value\n' * (size // 15)}
+    }
+
+
+def create_state(state_path, sessions=50, users=100, pod_delay=1.0,
+                 latency=0.02, data=None, seed=0):
+    """
+    Write the starting state of a cluster running the platform, sessions
+    and apps for sessions, and a credentials secret for each of users. data
+    holds the sizes of the dumps and backups the other stand-ins write.
+    """
+    rng = random.Random(f'{seed}-cluster')
+    default = {'pods': {}, 'deployments': {}, 'secrets': {}, 'configmaps': {}}
+    session_deployments = [
+        f'anaconda-session-{i}' for i in range(sessions)
+    ] + [f'anaconda-app-{i}' for i in range(sessions)]
+    for name in PLATFORM_DEPLOYMENTS + session_deployments:
+        default['deployments'][name] = deployment(name, 'default')
+        name = pod_name(name)
+        default['pods'][name] = pod(name, 'default')
+
+    for name in [
+        'anaconda-enterprise-certs',
+        'anaconda-config-files'
+    ] + [f'anaconda-credentials-user-{i}' for i in range(users)]:
+        default['secrets'][name] = secret(name, 'default', rng)
+
+    name = 'anaconda-enterprise-anaconda-platform.yml'
+    default['configmaps'][name] = config_map(name, 'default')
+    state = {
+        'pod_delay': pod_delay,
+        'latency': latency,
+        'data': data or {},
+        'objects': {
+            'default': default,
+            'kube-system': {
+                'pods': {},
+                'deployments': {},
+                'secrets': {
+                    'cluster-tls': secret('cluster-tls', 'kube-system', rng)
+                },
+                'configmaps': {}
+            }
+        }
+    }
+    with open(state_path, 'w') as f:
+        json.dump(state, f)
+
+    return state
+
+
+def settle(state, now):
+    # Finish the pod starts and deletions that are due
+    for objects in state['objects'].values():
+        pods = objects['pods']
+        for name, item in list(pods.items()):
+            if item.get('ready_at') is None or item['ready_at'] > now:
+                continue
+
+            if item['metadata'].get('deletionTimestamp'):
+                del pods[name]
+            else:
+                item['status']['phase'] = 'Running'
+                item['ready_at'] = None
+
+
+def start_pod(state, namespace, deployment_name):
+    name = pod_name(deployment_name)
+    state['objects'][namespace]['pods'][name] = pod(
+        name,
+        namespace,
+        'Pending',
+        time.time() + state['pod_delay']
+    )
+
+
+def stop_pod(state, item):
+    item['metadata']['deletionTimestamp'] = '2020-01-01T00:00:00Z'
+    item['ready_at'] = time.time() + state['pod_delay']
+
+
+def deployment_pods(state, namespace, deployment_name):
+    return [
+        item for name, item in state['objects'][namespace]['pods'].items()
+        if name.rsplit('-', 1)[0] == deployment_name
+        and not item['metadata'].get('deletionTimestamp')
+    ]
+
+
+def scale(state, namespace, deployment_name, replicas):
+    state['objects'][namespace]['deployments'][deployment_name]['spec'][
+        'replicas'
+    ] = replicas
+    running = deployment_pods(state, namespace, deployment_name)
+    for item in running[replicas:]:
+        stop_pod(state, item)
+
+    for _ in range(replicas - len(running)):
+        start_pod(state, namespace, deployment_name)
+
+
+def delete_all_pods(state, namespace):
+    # The deployments start a new pod for every pod that is deleted
+    for name, item in list(state['objects'][namespace]['pods'].items()):
+        if item['metadata'].get('deletionTimestamp'):
+            continue
+
+        stop_pod(state, item)
+        start_pod(state, namespace, name.rsplit('-', 1)[0])
+
+
+def delete_deployments(state, namespace, names):
+    deployments = state['objects'][namespace]['deployments']
+    for name in names:
+        if deployments.pop(name, None) is None:
+            continue
+
+        for item in deployment_pods(state, namespace, name):
+            stop_pod(state, item)
+
+
+def public(item):
+    # Drop the bookkeeping that kubectl would never show
+    return {key: value for key, value in item.items() if key != 'ready_at'}
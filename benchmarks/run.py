@@ -0,0 +1,494 @@
+
+from benchmarks import storage
+from benchmarks import cluster
+from benchmarks import shims
+
+
+import subprocess
+import statistics
+import argparse
+import platform
+import tempfile
+import shutil
+import shlex
+import json
+import time
+import sys
+import os
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SANDBOX = 'ACCORD_BENCH_SANDBOX'
+MIB = 1024 * 1024
+# Lines of the accord output shown when a run fails
+LOG_TAIL = 20
+
+
+class Scenario(object):
+    """
+    One run of accord. Scenarios in requires are run first, untimed, when
+    the run needs what they leave behind, like the restore needs a backup.
+    """
+    def __init__(self, name, args, directory, classes, data, requires=None):
+        self.name = name
+        self.args = args
+        self.directory = directory
+        self.classes = classes
+        self.data = data
+        self.requires = requires or []
+
+
+# The storage backup leaves out the repository, which is only synced
+STORAGE_CLASSES = ['git-objects', 'project-files', 'objects']
+SCENARIOS = [
+    Scenario(
+        'backup',
+        ['-a', 'backup', '-d', '/opt/anaconda_backup'],
+        '/opt/anaconda_backup',
+        STORAGE_CLASSES,
+        ['dump_size', 'gravity_size']
+    ),
+    Scenario(
+        'repos-only',
+        [
+            '-a', 'backup', '--repos-only', '--sync', '--sync-node',
+            'restore-node',
+            '-d', '/opt/anaconda_backup_repos'
+        ],
+        '/opt/anaconda_backup_repos',
+        ['repo-packages'],
+        ['repository_size']
+    ),
+    Scenario(
+        'archive',
+        ['-a', 'backup', '--archive', '-d', '/opt/anaconda_archive'],
+        '/opt/anaconda_archive',
+        STORAGE_CLASSES,
+        ['dump_size', 'gravity_size']
+    ),
+    Scenario(
+        'restore',
+        ['-a', 'restore', '-d', '/opt/anaconda_backup'],
+        '/opt/anaconda_backup',
+        STORAGE_CLASSES,
+        ['dump_size', 'gravity_size'],
+        requires=['backup']
+    )
+]
+
+
+def data_sizes(scale):
+    return {
+        'dump_size': int(64 * MIB * scale),
+        'repository_size': int(32 * MIB * scale),
+        'database_size': int(16 * MIB * scale),
+        'gravity_size': int(32 * MIB * scale),
+        'databases': [
+            'anaconda_auth',
+            'anaconda_deploy',
+            'anaconda_repository',
+            'anaconda_workspace'
+        ],
+        'started_deployments': 20
+    }
+
+
+def handle_arguments():
+    parser = argparse.ArgumentParser(
+        description=(
+            'Time accord backups and restores of a synthetic AE5 install, '
+            'with stand-ins for kubectl, gravity, docker exec, ssh and rsync'
+        )
+    )
+    parser.add_argument(
+        '-s',
+        '--scenario',
+        action='append',
+        choices=[scenario.name for scenario in SCENARIOS],
+        help='Scenario to run, can be given more than once. Default is all'
+    )
+    parser.add_argument(
+        '--scale',
+        type=float,
+        default=1.0,
+        help=(
+            'Multiplier for the number of files of each kind and the dump '
+            'sizes. Default is 1.0, about 600 MiB of storage'
+        )
+    )
+    parser.add_argument(
+        '--files',
+        action='append',
+        default=[],
+        metavar='KIND=COUNT',
+        help=(
+            'Number of files of a kind before scaling, one of '
+            f'{", ".join(storage.default_classes())}'
+        )
+    )
+    parser.add_argument(
+        '--size',
+        action='append',
+        default=[],
+        metavar='KIND=BYTES',
+        help='Median size of the files of a kind'
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help='Seed for the generated data. Default is 0'
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=1,
+        help='Times to run each scenario, the median is reported'
+    )
+    parser.add_argument(
+        '--sessions',
+        type=int,
+        default=50,
+        help='Sessions and apps running on the fake cluster. Default is 50'
+    )
+    parser.add_argument(
+        '--users',
+        type=int,
+        default=100,
+        help='User credential secrets on the fake cluster. Default is 100'
+    )
+    parser.add_argument(
+        '--pod-delay',
+        type=float,
+        default=1.0,
+        help='Seconds a pod takes to start or stop. Default is 1.0'
+    )
+    parser.add_argument(
+        '--kubectl-latency',
+        type=float,
+        default=0.02,
+        help='Seconds added to every kubectl call. Default is 0.02'
+    )
+    parser.add_argument(
+        '--accord-args',
+        default='',
+        help='Extra arguments for every accord run, e.g. "-j 4"'
+    )
+    parser.add_argument(
+        '--work',
+        default=None,
+        help='Directory for the data and results. Default is a temp dir'
+    )
+    parser.add_argument(
+        '--keep',
+        action='store_true',
+        help='Keep the work directory after the run'
+    )
+    parser.add_argument(
+        '--trace',
+        action='store_true',
+        help='Write a trace of each accord run to the work directory'
+    )
+    parser.add_argument(
+        '-o',
+        '--output',
+        default=None,
+        help='Write the results as JSON to this file'
+    )
+    parser.add_argument(
+        '--compare',
+        default=None,
+        help='Results file of an earlier run to check for regressions'
+    )
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.1,
+        help=(
+            'Fraction a scenario may be slower or use more memory than in '
+            'the compared run before it counts as a regression. Default 0.1'
+        )
+    )
+    return parser.parse_args()
+
+
+def file_classes(arguments):
+    classes = storage.default_classes()
+    for setting, attribute in [
+        (arguments.files, 'count'),
+        (arguments.size, 'median')
+    ]:
+        for value in setting:
+            name, number = value.split('=', 1)
+            if name not in classes:
+                raise SystemExit(f'Unknown kind of file {name}')
+
+            setattr(classes[name], attribute, int(number))
+
+    return classes
+
+
+def enter_sandbox():
+    """
+    Run the benchmark again in a mount namespace of its own, so /opt can be
+    replaced by the work directory and /bin/ssh by its stand-in without
+    touching the machine. Without root a user namespace maps the user to
+    root, which accord expects to be.
+    """
+    if shutil.which('unshare') is None:
+        raise SystemExit('unshare from util-linux is needed to run this')
+
+    command = ['unshare', '--mount']
+    if os.geteuid() != 0:
+        command.extend(['--user', '--map-root-user'])
+
+    command.extend(['--', sys.executable, '-m', 'benchmarks'] + sys.argv[1:])
+    return subprocess.run(
+        command,
+        env=dict(os.environ, **{SANDBOX: '1'}, PYTHONPATH=ROOT)
+    ).returncode
+
+
+def setup_sandbox(work, bin_directory):
+    for path in ['/opt', '/bin/ssh']:
+        if not os.path.exists(path):
+            raise SystemExit(f'{path} has to exist to be replaced')
+
+    os.makedirs(f'{work}/opt', exist_ok=True)
+    subprocess.run(['mount', '--bind', f'{work}/opt', '/opt'], check=True)
+    subprocess.run(
+        [
+            'mount',
+            '--bind',
+            f'{bin_directory}/ssh',
+            os.path.realpath('/bin/ssh')
+        ],
+        check=True
+    )
+
+
+def run_accord(args, env, log_path):
+    """
+    Run accord and return its exit code, how long it took and the peak RSS
+    of it and the commands it waited for
+    """
+    with open(log_path, 'ab') as log_file:
+        start = time.perf_counter()
+        child = subprocess.Popen(
+            [sys.executable, '-m', 'accord.process'] + args,
+            env=env,
+            stdout=log_file,
+            stderr=subprocess.STDOUT
+        )
+        _, status, usage = os.wait4(child.pid, 0)
+        duration = time.perf_counter() - start
+
+    if os.WIFEXITED(status):
+        child.returncode = os.WEXITSTATUS(status)
+    else:
+        child.returncode = -os.WTERMSIG(status)
+
+    # Linux reports ru_maxrss in KiB
+    return child.returncode, duration, usage.ru_maxrss * 1024
+
+
+def stage_durations(report_path):
+    if not os.path.isfile(report_path):
+        return {}
+
+    with open(report_path) as f:
+        report = json.load(f)
+
+    return {stage['name']: stage['duration'] for stage in report['stages']}
+
+
+def scenario_bytes(scenario, summary, data):
+    return sum(summary[name]['bytes'] for name in scenario.classes) + sum(
+        data[name] for name in scenario.data
+    )
+
+
+def run_scenario(scenario, arguments, work, env, data, timed=True):
+    if scenario.name != 'restore':
+        shutil.rmtree(scenario.directory, ignore_errors=True)
+
+    # Every run starts from the same cluster
+    cluster.create_state(
+        env[shims.STATE],
+        sessions=arguments.sessions,
+        users=arguments.users,
+        pod_delay=arguments.pod_delay,
+        latency=arguments.kubectl_latency,
+        data=data,
+        seed=arguments.seed
+    )
+    args = scenario.args + shlex.split(arguments.accord_args)
+    report_path = f'{work}/results/{scenario.name}.json'
+    args.extend(['--report', report_path])
+    if arguments.trace and timed:
+        args.extend(['--trace', f'{work}/results/{scenario.name}.trace.json'])
+
+    return_code, duration, peak_rss = run_accord(
+        args,
+        env,
+        f'{work}/results/{scenario.name}.log'
+    )
+    if return_code != 0:
+        print(f'{scenario.name} failed with {return_code}:', file=sys.stderr)
+        with open(f'{work}/results/{scenario.name}.log') as f:
+            sys.stderr.writelines(f.readlines()[-LOG_TAIL:])
+
+    return {
+        'exit_code': return_code,
+        'duration': duration,
+        'peak_rss': peak_rss,
+        'stages': stage_durations(report_path)
+    }
+
+
+def run_benchmarks(arguments, work):
+    bin_directory = f'{work}/bin'
+    shims.install(bin_directory)
+    setup_sandbox(work, bin_directory)
+    os.makedirs(f'{work}/remote/opt/anaconda', exist_ok=True)
+    os.makedirs(f'{work}/results', exist_ok=True)
+    env = dict(
+        os.environ,
+        PATH=f'{bin_directory}:{os.environ["PATH"]}',
+        PYTHONPATH=ROOT,
+        **{
+            shims.STATE: f'{work}/cluster.json',
+            shims.REMOTE: f'{work}/remote',
+            shims.REAL_PATH: os.environ['PATH']
+        }
+    )
+    env.pop(SANDBOX)
+
+    start = time.perf_counter()
+    summary = storage.generate(
+        '/opt/anaconda',
+        file_classes(arguments),
+        arguments.scale,
+        arguments.seed
+    )
+    print(
+        f'Generated {sum(c["files"] for c in summary.values())} files, '
+        f'{sum(c["bytes"] for c in summary.values()) / MIB:.1f} MiB in '
+        f'{time.perf_counter() - start:.1f} seconds'
+    )
+
+    data = data_sizes(arguments.scale)
+    chosen = arguments.scenario or [scenario.name for scenario in SCENARIOS]
+    by_name = {scenario.name: scenario for scenario in SCENARIOS}
+    results = {}
+    for scenario in SCENARIOS:
+        if scenario.name not in chosen:
+            continue
+
+        runs = []
+        for _ in range(arguments.repeat):
+            for required in scenario.requires:
+                run_scenario(
+                    by_name[required],
+                    arguments,
+                    work,
+                    env,
+                    data,
+                    timed=False
+                )
+
+            runs.append(run_scenario(scenario, arguments, work, env, data))
+
+        size = scenario_bytes(scenario, summary, data)
+        duration = statistics.median(run['duration'] for run in runs)
+        results[scenario.name] = {
+            'exit_code': max(run['exit_code'] for run in runs),
+            'duration': round(duration, 3),
+            'durations': [round(run['duration'], 3) for run in runs],
+            'bytes': size,
+            'throughput': round(size / MIB / duration, 2),
+            'peak_rss': max(run['peak_rss'] for run in runs),
+            'stages': runs[-1]['stages']
+        }
+
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'scale': arguments.scale,
+            'seed': arguments.seed,
+            'accord_args': arguments.accord_args
+        },
+        'dataset': summary,
+        'scenarios': results
+    }
+
+
+def print_results(results):
+    print(
+        f'{"scenario":<12} {"seconds":>9} {"MiB":>9} {"MiB/s":>9} '
+        f'{"peak RSS MiB":>13}  status'
+    )
+    for name, result in results['scenarios'].items():
+        print(
+            f'{name:<12} {result["duration"]:>9.2f} '
+            f'{result["bytes"] / MIB:>9.1f} {result["throughput"]:>9.1f} '
+            f'{result["peak_rss"] / MIB:>13.1f}  '
+            f'{"ok" if result["exit_code"] == 0 else "failed"}'
+        )
+        for stage, duration in result['stages'].items():
+            print(f'    {stage:<24} {duration:>9.2f}')
+
+
+def regressions(results, baseline, threshold):
+    """
+    Returns a line for every scenario that got slower or used more memory
+    than in baseline by more than threshold
+    """
+    found = []
+    for name, result in results['scenarios'].items():
+        old = baseline.get('scenarios', {}).get(name)
+        if old is None:
+            continue
+
+        for metric in ['duration', 'peak_rss']:
+            if result[metric] > old[metric] * (1 + threshold):
+                found.append(
+                    f'{name} {metric} went from {old[metric]} to '
+                    f'{result[metric]}'
+                )
+
+    return found
+
+
+def main():
+    arguments = handle_arguments()
+    if os.environ.get(SANDBOX) != '1':
+        sys.exit(enter_sandbox())
+
+    work = arguments.work or tempfile.mkdtemp(prefix='accord_bench_')
+    try:
+        results = run_benchmarks(arguments, os.path.abspath(work))
+    finally:
+        if not arguments.keep:
+            shutil.rmtree(work, ignore_errors=True)
+
+    print_results(results)
+    if arguments.output:
+        with open(arguments.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    failed = any(
+        result['exit_code'] != 0 for result in results['scenarios'].values()
+    )
+    if arguments.compare:
+        with open(arguments.compare) as f:
+            found = regressions(results, json.load(f), arguments.threshold)
+
+        for line in found:
+            print(f'Regression: {line}', file=sys.stderr)
+
+        failed = failed or bool(found)
+
+    sys.exit(1 if failed else 0)
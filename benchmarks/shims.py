@@ -0,0 +1,496 @@
+
+from benchmarks import cluster
+from benchmarks import storage
+
+
+import subprocess
+import random
+import shutil
+import yaml
+import json
+import time
+import sys
+import os
+import re
+
+
+# Environment the stand-ins are configured by
+STATE = 'ACCORD_BENCH_STATE'
+REMOTE = 'ACCORD_BENCH_REMOTE'
+REAL_PATH = 'ACCORD_BENCH_PATH'
+
+# Data directory of the postgres container and where it is on the node
+CONTAINER_DATA = '/var/lib/postgresql/data'
+HOST_DATA = '/opt/anaconda/storage/pgdata'
+WATCH_INTERVAL = 0.05
+KINDS = {
+    'pod': 'pods',
+    'pods': 'pods',
+    'po': 'pods',
+    'deployment': 'deployments',
+    'deployments': 'deployments',
+    'deploy': 'deployments',
+    'secret': 'secrets',
+    'secrets': 'secrets',
+    'configmap': 'configmaps',
+    'configmaps': 'configmaps',
+    'cm': 'configmaps'
+}
+# Options that take a value, for the commands whose arguments are parsed
+KUBECTL_VALUES = ['-n', '--namespace', '-o', '--output', '-f', '--filename']
+SSH_VALUES = ['-i', '-p', '-o', '-l', '-F']
+SCRIPT = '''#!{python}
+import sys
+sys.path.insert(0, {root!r})
+from benchmarks import shims
+sys.exit(shims.main({name!r}, sys.argv[1:]))
+'''
+
+
+def data_settings():
+    with cluster.Cluster(os.environ[STATE]).state() as state:
+        return state['data']
+
+
+def split_options(args, with_values):
+    """
+    Split the arguments into a dict of options and a list of the rest. An
+    option given more than once keeps each value in a list.
+    """
+    options = {}
+    positional = []
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg.startswith('--') and '=' in arg:
+            name, value = arg.split('=', 1)
+            options.setdefault(name, []).append(value)
+        elif arg in with_values and args:
+            options.setdefault(arg, []).append(args.pop(0))
+        elif arg.startswith('-') and len(arg) > 1:
+            options.setdefault(arg, []).append(True)
+        else:
+            positional.append(arg)
+
+    return options, positional
+
+
+def option(options, *names, default=None):
+    for name in names:
+        if name in options:
+            return options[name][-1]
+
+    return default
+
+
+def run_shell(command):
+    # Replace the stand-in with bash so no extra process is left waiting
+    sys.stdout.flush()
+    os.execvp('bash', ['bash', '-c', command])
+
+
+def kubectl(args):
+    state_path = os.environ[STATE]
+    fake = cluster.Cluster(state_path)
+    with fake.state() as state:
+        time.sleep(state['latency'])
+
+    options, positional = split_options(args, KUBECTL_VALUES)
+    namespace = option(options, '-n', '--namespace', default='default')
+    verb = positional[0]
+    kind = KINDS.get(positional[1]) if len(positional) > 1 else None
+    if verb == 'get' and '--watch' in options:
+        return watch_pods(
+            fake,
+            namespace,
+            '--output-watch-events' in options
+        )
+
+    if verb == 'get':
+        print(json.dumps({
+            'apiVersion': 'v1',
+            'kind': 'List',
+            'items': [
+                cluster.public(item) for item in fake.items(kind, namespace)
+            ]
+        }))
+        return 0
+
+    if verb in ['replace', 'create']:
+        return apply_files(
+            fake,
+            verb,
+            namespace,
+            options.get('-f', []) + options.get('--filename', [])
+        )
+
+    with fake.state(write=True) as state:
+        if verb == 'scale':
+            cluster.scale(
+                state,
+                namespace,
+                positional[2],
+                int(option(options, '--replicas'))
+            )
+        elif verb == 'delete' and kind == 'pods' and '--all' in options:
+            cluster.delete_all_pods(state, namespace)
+        elif verb == 'delete' and kind == 'deployments':
+            cluster.delete_deployments(state, namespace, positional[2:])
+        else:
+            sys.stderr.write(f'kubectl stand-in: unsupported {args}\n')
+            return 1
+
+    return 0
+
+
+def deleted(item):
+    # The API server always sends the deleted pod with its deletion timestamp
+    item['metadata'].setdefault('deletionTimestamp', '2020-01-01T00:00:00Z')
+    return item
+
+
+def watch_pods(fake, namespace, watch_events=False):
+    # Write an event for every change until accord stops watching. As with
+    # kubectl, only the objects are written without --output-watch-events
+    seen = {}
+    try:
+        while True:
+            pods = {
+                item['metadata']['name']: cluster.public(item)
+                for item in fake.items('pods', namespace)
+            }
+            events = [
+                {
+                    'type': 'ADDED' if name not in seen else 'MODIFIED',
+                    'object': item
+                }
+                for name, item in pods.items() if seen.get(name) != item
+            ] + [
+                {'type': 'DELETED', 'object': deleted(item)}
+                for name, item in seen.items() if name not in pods
+            ]
+            for event in events:
+                if not watch_events:
+                    event = event['object']
+
+                sys.stdout.write(json.dumps(event) + '\n')
+
+            sys.stdout.flush()
+            seen = pods
+            time.sleep(WATCH_INTERVAL)
+    except BrokenPipeError:
+        return 0
+
+
+def apply_files(fake, verb, namespace, paths):
+    failed = False
+    with fake.state(write=True) as state:
+        for path in paths:
+            with open(path) as f:
+                item = yaml.safe_load(f)
+
+            kind = KINDS[item['kind'].lower()]
+            name = item['metadata']['name']
+            objects = state['objects'].setdefault(
+                item['metadata'].get('namespace', namespace),
+                {plural: {} for plural in set(KINDS.values())}
+            )[kind]
+            if verb == 'replace' and name not in objects:
+                sys.stderr.write(
+                    f'Error from server (NotFound): {kind} "{name}" not '
+                    'found\n'
+                )
+                failed = True
+                continue
+
+            if verb == 'create' and name in objects:
+                sys.stderr.write(
+                    f'Error from server (AlreadyExists): {kind} "{name}" '
+                    'already exists\n'
+                )
+                failed = True
+                continue
+
+            objects[name] = item
+            print(f'{item["kind"].lower()}/{name} {verb}d')
+
+    return 1 if failed else 0
+
+
+def gravity(args):
+    if args[0] == 'exec':
+        # gravity exec docker exec -i <container> /bin/bash -c <command>
+        command = args[args.index('-c') + 1]
+        run_shell(command.replace(CONTAINER_DATA, HOST_DATA))
+
+    settings = data_settings()
+    if args[0] == 'backup':
+        with open(args[1], 'wb') as f:
+            storage.write_content(
+                f,
+                random.Random('gravity'),
+                settings.get('gravity_size', 0)
+            )
+    elif args[0] == 'restore':
+        read_all(args[1])
+
+    return 0
+
+
+def su(args):
+    # su - <user> -c <command>, the user does not matter here
+    run_shell(args[args.index('-c') + 1])
+
+
+def sudo(args):
+    args = list(args)
+    while args and args[0].startswith('-'):
+        if args.pop(0) in ['-u', '-g']:
+            args.pop(0)
+
+    # Through bash so that builtins like cd work too
+    sys.stdout.flush()
+    os.execvp('bash', ['bash', '-c', '"$@"', 'sudo'] + args)
+
+
+def remote_command(command):
+    # The sync node keeps its /opt under the remote directory
+    return re.sub(
+        r'(?<![\w/.-])/opt(?=/|\b)',
+        f'{os.environ[REMOTE]}/opt',
+        command
+    )
+
+
+def ssh(args):
+    options, positional = split_options(args, SSH_VALUES)
+    if len(positional) < 2:
+        sys.stderr.write('ssh stand-in: only remote commands are supported\n')
+        return 255
+
+    run_shell(remote_command(' '.join(positional[1:])))
+
+
+def copy_file(source, destination):
+    # The same quick check as rsync, by size and modification time
+    source_stat = os.lstat(source)
+    if os.path.lexists(destination):
+        destination_stat = os.lstat(destination)
+        if (
+            destination_stat.st_size == source_stat.st_size and
+            destination_stat.st_mtime == source_stat.st_mtime
+        ):
+            return
+
+        os.unlink(destination)
+
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    if os.path.islink(source):
+        os.symlink(os.readlink(source), destination)
+    else:
+        shutil.copy2(source, destination)
+
+
+def copy_entry(source, destination):
+    if not os.path.isdir(source) or os.path.islink(source):
+        copy_file(source, destination)
+        return
+
+    for dirpath, dirnames, filenames in os.walk(source):
+        relative = os.path.relpath(dirpath, source)
+        os.makedirs(os.path.join(destination, relative), exist_ok=True)
+        links = [d for d in dirnames if os.path.islink(f'{dirpath}/{d}')]
+        for name in filenames + links:
+            copy_file(
+                f'{dirpath}/{name}',
+                os.path.normpath(os.path.join(destination, relative, name))
+            )
+
+
+def rsync(args):
+    options, positional = split_options(args, ['-e', '--files-from'])
+    source, destination = positional[-2:]
+    if ':' in destination and not destination.startswith('/'):
+        destination = (
+            f'{os.environ[REMOTE]}{destination.split(":", 1)[1]}'
+        )
+
+    # Without a trailing slash the directory itself is copied
+    if not source.endswith('/'):
+        destination = os.path.join(destination, os.path.basename(source))
+
+    entries = ['.']
+    files_from = option(options, '--files-from')
+    if files_from:
+        with open(files_from) as f:
+            entries = [line.strip() for line in f if line.strip()]
+
+    for entry in entries:
+        copy_entry(
+            os.path.normpath(os.path.join(source, entry)),
+            os.path.normpath(os.path.join(destination, entry))
+        )
+
+    return 0
+
+
+def chown(args):
+    # Users of the AE5 master, like polkitd, need not exist here
+    subprocess.run(
+        ['chown'] + list(args),
+        env=dict(os.environ, PATH=os.environ[REAL_PATH]),
+        stderr=subprocess.DEVNULL
+    )
+    return 0
+
+
+def output_file(options):
+    path = option(options, '-f', '--file')
+    if path is None:
+        return os.fdopen(sys.stdout.fileno(), 'wb', closefd=False)
+
+    return open(path, 'wb')
+
+
+def pg_dumpall(args):
+    options, _ = split_options(args, ['-U', '-f', '--file'])
+    size = data_settings().get('dump_size', 0)
+    if '--globals-only' in options:
+        size = 64 * 1024
+
+    rng = random.Random('pg_dumpall')
+    with output_file(options) as f:
+        storage.write_content(f, rng, size, storage.text_pool(rng))
+
+    return 0
+
+
+def pg_dump(args):
+    options, positional = split_options(
+        args,
+        ['-U', '-F', '-j', '-f', '--file']
+    )
+    database = positional[-1]
+    settings = data_settings()
+    if database == 'anaconda_repository':
+        size = settings.get('repository_size', 0)
+    else:
+        size = settings.get('database_size', 0)
+
+    rng = random.Random(f'pg_dump-{database}')
+    if '-Fd' not in options and option(options, '-F') != 'd':
+        with output_file(options) as f:
+            storage.write_content(f, rng, size, storage.text_pool(rng))
+
+        return 0
+
+    # Directory format has a table of contents and a file per table, which
+    # are already compressed
+    directory = option(options, '-f', '--file')
+    jobs = int(option(options, '-j', default=1))
+    os.makedirs(directory)
+    with open(f'{directory}/toc.dat', 'wb') as f:
+        storage.write_content(f, rng, 4096)
+
+    for table in range(max(jobs, 4)):
+        with open(f'{directory}/{3000 + table}.dat.gz', 'wb') as f:
+            storage.write_content(f, rng, size // max(jobs, 4))
+
+    return 0
+
+
+def read_all(path):
+    size = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(storage.BLOCK_SIZE), b''):
+            size += len(block)
+
+    return size
+
+
+def pg_restore(args):
+    options, positional = split_options(
+        args,
+        ['-U', '-d', '-j', '--jobs', '--section']
+    )
+    path = positional[-1]
+    if not os.path.isdir(path):
+        read_all(path)
+        return 0
+
+    # Only the data section reads the table files
+    sections = options.get('--section', ['data'])
+    for name in sorted(os.listdir(path)):
+        if name == 'toc.dat' or 'data' in sections:
+            read_all(f'{path}/{name}')
+
+    return 0
+
+
+def psql(args):
+    options, _ = split_options(args, ['-U', '-d', '-v', '-c'])
+    settings = data_settings()
+    statement = option(options, '-c')
+    if statement is not None:
+        if 'datname' in statement:
+            for database in settings.get('databases', []):
+                print(database)
+
+        return 0
+
+    # A script or a session piped in, with a marker echoed after each
+    # statement of a session
+    out = sys.stdout.buffer
+    for line in sys.stdin.buffer:
+        if line.startswith(b'\\echo '):
+            out.write(line[len(b'\\echo '):])
+            out.flush()
+        elif b'row_to_json' in line:
+            for i in range(settings.get('started_deployments', 0)):
+                out.write(json.dumps({
+                    'id': f'a{i:031x}',
+                    'name': f'deployment {i}',
+                    'owner': f'user{i % 10}',
+                    'type': 'deployment',
+                    'url': f'https://anaconda.example.com/deployment{i}',
+                    'command_name': 'default',
+                    'project_name': f'project{i}',
+                    'project_revision': 'latest',
+                    'project_owner': f'user{i % 10}'
+                }).encode('utf-8') + b'\n')
+
+    return 0
+
+
+SHIMS = {
+    'kubectl': kubectl,
+    'gravity': gravity,
+    'su': su,
+    'sudo': sudo,
+    'ssh': ssh,
+    'rsync': rsync,
+    'chown': chown,
+    'pg_dumpall': pg_dumpall,
+    'pg_dump': pg_dump,
+    'pg_restore': pg_restore,
+    'psql': psql
+}
+
+
+def install(bin_directory):
+    """
+    Write an executable for each stand-in to bin_directory, which goes at
+    the front of PATH for the run
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    os.makedirs(bin_directory, exist_ok=True)
+    for name in SHIMS:
+        path = f'{bin_directory}/{name}'
+        with open(path, 'w') as f:
+            f.write(SCRIPT.format(python=sys.executable, root=root, name=name))
+
+        os.chmod(path, 0o755)
+
+
+def main(name, args):
+    return SHIMS[name](args) or 0
@@ -0,0 +1,165 @@
+
+import collections
+import random
+import math
+import os
+
+
+BLOCK_SIZE = 1024 * 1024
+# Fixed mtimes so two trees made with the same seed are the same
+BASE_MTIME = 1600000000
+WORDS = [
+    'import', 'numpy', 'pandas', 'def', 'return', 'self', 'data', 'frame',
+    'model', 'value', 'index', 'for', 'in', 'if', 'else', 'print', 'plot',
+    'train', 'test', 'score', 'column', 'row', 'mean', 'sum', 'float', 'int',
+    'string', 'path', 'open', 'read', 'write', 'result', 'project', 'anaconda'
+]
+TEXT_SUFFIXES = ['py', 'ipynb', 'csv', 'md', 'yml', 'txt']
+PACKAGE_SUFFIXES = ['tar.bz2', 'conda']
+
+
+def git_object_path(rng, index):
+    # Loose objects in a few hundred repositories
+    object_id = '%040x' % rng.getrandbits(160)
+    return (
+        f'storage/git/user{index % 50}/project{index % 400}.git/objects/'
+        f'{object_id[:2]}/{object_id[2:]}'
+    )
+
+
+def project_file_path(rng, index):
+    return (
+        f'storage/object/anaconda-projects/project{index % 400}/'
+        f'dir{rng.randrange(8)}/file{index}.{rng.choice(TEXT_SUFFIXES)}'
+    )
+
+
+def object_path(rng, index):
+    return (
+        f'storage/object/anaconda-objects/{index % 64:02x}/'
+        f'{rng.getrandbits(128):032x}'
+    )
+
+
+def package_path(rng, index):
+    return (
+        f'storage/object/anaconda-repository/channel{index % 4}/'
+        f'{rng.choice(["linux-64", "noarch"])}/package{index}-1.0-0.'
+        f'{rng.choice(PACKAGE_SUFFIXES)}'
+    )
+
+
+class FileClass(object):
+    """
+    A kind of file in the storage tree. Sizes follow a log normal
+    distribution around median, clamped to minimum and maximum.
+    """
+    def __init__(self, name, path, count, median, sigma, minimum, maximum,
+                 compressible):
+        self.name = name
+        self.path = path
+        self.count = count
+        self.median = median
+        self.sigma = sigma
+        self.minimum = minimum
+        self.maximum = maximum
+        self.compressible = compressible
+
+    def size(self, rng):
+        size = int(rng.lognormvariate(math.log(self.median), self.sigma))
+        return max(self.minimum, min(self.maximum, size))
+
+
+def default_classes():
+    return collections.OrderedDict(
+        (file_class.name, file_class) for file_class in [
+            # Git objects are zlib compressed already
+            FileClass(
+                'git-objects', git_object_path, 20000, 2 * 1024, 1.2, 64,
+                1024 * 1024, False
+            ),
+            FileClass(
+                'project-files', project_file_path, 3000, 16 * 1024, 1.5,
+                16, 8 * 1024 * 1024, True
+            ),
+            FileClass(
+                'objects', object_path, 500, 128 * 1024, 1.0, 1024,
+                32 * 1024 * 1024, True
+            ),
+            FileClass(
+                'repo-packages', package_path, 100, 2 * 1024 * 1024, 1.0,
+                64 * 1024, 128 * 1024 * 1024, False
+            )
+        ]
+    )
+
+
+def text_pool(rng, size=BLOCK_SIZE):
+    # Text that compresses about as well as source code and notebooks
+    lines = []
+    length = 0
+    while length < size:
+        line = ' '.join(
+            rng.choice(WORDS) for _ in range(rng.randrange(2, 12))
+        )
+        lines.append(line)
+        length += len(line) + 1
+
+    return '\n'.join(lines).encode('utf-8')[:size]
+
+
+def write_content(f, rng, size, pool=None):
+    """
+    Write size bytes of random data, or of text taken from pool at a random
+    offset when the file should be compressible.
+    """
+    if pool is not None:
+        offset = rng.randrange(len(pool))
+        while size > 0:
+            block = pool[offset:offset + size]
+            f.write(block)
+            size -= len(block)
+            offset = 0
+
+        return
+
+    while size > 0:
+        take = min(size, BLOCK_SIZE)
+        f.write(rng.getrandbits(take * 8).to_bytes(take, 'little'))
+        size -= take
+
+
+def generate(root, classes=None, scale=1.0, seed=0):
+    """
+    Write a storage tree under root with the files of each class, the same
+    every time for the same seed. Returns the number of files and bytes of
+    each class.
+    """
+    if classes is None:
+        classes = default_classes()
+
+    os.makedirs(f'{root}/storage/pgdata', exist_ok=True)
+    pool = text_pool(random.Random(f'{seed}-text'))
+    summary = collections.OrderedDict()
+    for file_class in classes.values():
+        rng = random.Random(f'{seed}-{file_class.name}')
+        count = int(file_class.count * scale)
+        total = 0
+        for index in range(count):
+            path = f'{root}/{file_class.path(rng, index)}'
+            size = file_class.size(rng)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                write_content(
+                    f,
+                    rng,
+                    size,
+                    pool if file_class.compressible else None
+                )
+
+            os.utime(path, (BASE_MTIME + index, BASE_MTIME + index))
+            total += size
+
+        summary[file_class.name] = {'files': count, 'bytes': total}
+
+    return summary
@@ -1,69 +1,77 @@
 
-GET_PODS = [
-    'NAME                                                              '
-    'READY     STATUS    RESTARTS   AGE',
-    'anaconda-enterprise-ap-auth-68c4f864f8-x8trs                      '
-    '1/1       Running   0          30m',
-    'anaconda-enterprise-ap-auth-api-6cb6f9595d-9c774                  '
-    '1/1       Running   0          30m',
-    'anaconda-enterprise-ap-auth-escrow-7f597cfd7-kf4gs                '
-    '1/1       Running   0          30m',
-    'anaconda-enterprise-ap-deploy-58458665cf-lhc79                    '
-    '1/1       Running   0          30m',
-    'anaconda-enterprise-ap-docs-6d6cff47-6j7ld                        '
-    '1/1       Running   0          30m',
-    'anaconda-enterprise-ap-git-storage-56fcfc56b9-2ml4d               '
-    '2/2       Running   0          30m',
-    'anaconda-enterprise-ap-object-storage-586f97d7cf-mlzww            '
-    '1/1       Running   0          30m',
-    'anaconda-enterprise-ap-repository-86d44d6c84-5dtmj                '
-    '1/1       Running   0          30m',
-    'anaconda-enterprise-ap-storage-84946bc54d-lfxvk                   '
-    '1/1       Running   0          30m',
-    'anaconda-enterprise-ap-ui-798b4477cc-fk626                        '
-    '1/1       Running   0          30m',
-    'anaconda-enterprise-ap-workspace-68cf65df9f-97vx7                 '
-    '1/1       Running   0          30m',
-    'anaconda-enterprise-app-images-h8lkp                              '
-    '3/3       Running   0          29m',
-    'anaconda-enterprise-nginx-ingress-rc-4vgbc                        '
-    '1/1       Running   0          29m',
-    'anaconda-enterprise-postgres-58857557d-ctbfs                      '
-    '1/1       Running   0          30m'
-]
+import json
 
 
-DESCRIBE_POD = [
-    'Name:           anaconda-enterprise-postgres-58857557d-ctbfs',
-    'Namespace:      default',
-    'Containers:',
-    '  postgres:',
-    '    Container ID:   docker://fd234fad0a538a302ac68d0f260a155950b4'
-    'b8c7afca3176fcb25d1d799b045e',
-    '    Image:          leader.telekube.local:5000/postgres:9.6',
-    '    Port:           5432/TCP',
-    '    Host Port:      0/TCP',
-    '    Environment:  <none>',
-    '    Mounts:',
-    '      /var/lib/postgresql/data from storage (rw)',
-    '      /var/run/secrets/kubernetes.io/serviceaccount from '
-    'anaconda-enterprise-token-wdgqn (ro)'
-]
+def kube_list(names, **extra):
+    return json.dumps({
+        'apiVersion': 'v1',
+        'kind': 'List',
+        'items': [
+            dict({'metadata': {'name': name}}, **extra) for name in names
+        ]
+    })
 
 
-GET_SECRETS = [
-    'NAME                                                           '
-    'TYPE                                  DATA      AGE',
-    'anaconda-credentials-user-creds-anaconda-enterprise-3ggji6dp   '
-    'Opaque                                1         4s',
-    'anaconda-enterprise-certs                                      '
-    'Opaque                                6         50m',
-    'anaconda-enterprise-keycloak                                   '
-    'Opaque                                1         53m',
-    'anaconda-enterprise-platform-token-secret                      '
-    'Opaque                                1         50m',
-    'anaconda-enterprise-token-svdlm                                '
-    'kubernetes.io/service-account-token   3         50m',
-    'default-token-ghz4l                                            '
-    'kubernetes.io/service-account-token   3         1h'
-]
+GET_PODS = json.dumps({
+    'apiVersion': 'v1',
+    'kind': 'List',
+    'items': [
+        {
+            'kind': 'Pod',
+            'metadata': {
+                'name': 'anaconda-enterprise-ap-auth-68c4f864f8-x8trs'
+            },
+            'status': {
+                'phase': 'Running',
+                'containerStatuses': [
+                    {
+                        'name': 'auth',
+                        'containerID': 'docker://0123456789abcdef'
+                    }
+                ]
+            }
+        },
+        {
+            'kind': 'Pod',
+            'metadata': {
+                'name': 'anaconda-enterprise-app-images-h8lkp'
+            },
+            'status': {'phase': 'Running'}
+        },
+        {
+            'kind': 'Pod',
+            'metadata': {
+                'name': 'anaconda-enterprise-postgres-58857557d-ctbfs'
+            },
+            'status': {
+                'phase': 'Running',
+                'containerStatuses': [
+                    {
+                        'name': 'postgres',
+                        'containerID': (
+                            'docker://fd234fad0a538a302ac68d0f260a155950b4'
+                            'b8c7afca3176fcb25d1d799b045e'
+                        )
+                    }
+                ]
+            }
+        }
+    ]
+})
+
+
+GET_SECRETS = kube_list([
+    'anaconda-credentials-user-creds-anaconda-enterprise-3ggji6dp',
+    'anaconda-enterprise-certs',
+    'anaconda-enterprise-keycloak',
+    'anaconda-enterprise-platform-token-secret',
+    'anaconda-enterprise-token-svdlm',
+    'default-token-ghz4l'
+], kind='Secret')
+
+
+GET_DEPLOYMENTS = kube_list([
+    'anaconda-enterprise-ap-auth',
+    'anaconda-app-0123456789abcdef',
+    'anaconda-session-fedcba9876543210'
+], kind='Deployment')
@@ -0,0 +1,227 @@
+from benchmarks import storage
+from benchmarks import cluster
+from benchmarks import shims
+from benchmarks import run
+from unittest import TestCase
+
+
+import shutil
+import mock
+import json
+import time
+import os
+
+
+class TestBenchmarks(TestCase):
+    def setUp(self):
+        os.makedirs('testing_benchmarks', exist_ok=True)
+
+    def tearDown(self):
+        shutil.rmtree('testing_benchmarks', ignore_errors=True)
+
+    def small_classes(self):
+        classes = storage.default_classes()
+        for file_class in classes.values():
+            file_class.count = 5
+            file_class.median = 1024
+            file_class.maximum = 4096
+
+        return classes
+
+    def tree(self, root):
+        files = {}
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                with open(f'{dirpath}/{name}', 'rb') as f:
+                    files[os.path.relpath(f'{dirpath}/{name}', root)] = (
+                        f.read()
+                    )
+
+        return files
+
+    def test_generate_is_reproducible(self):
+        first = storage.generate('testing_benchmarks/a', self.small_classes())
+        second = storage.generate('testing_benchmarks/b', self.small_classes())
+        self.assertEqual(first, second)
+        self.assertEqual(
+            self.tree('testing_benchmarks/a'),
+            self.tree('testing_benchmarks/b')
+        )
+        self.assertEqual(first['git-objects']['files'], 5)
+        self.assertTrue(os.path.isdir('testing_benchmarks/a/storage/pgdata'))
+
+    def test_generate_scale_and_seed(self):
+        summary = storage.generate(
+            'testing_benchmarks/a',
+            self.small_classes(),
+            scale=2,
+            seed=1
+        )
+        other = storage.generate(
+            'testing_benchmarks/b',
+            self.small_classes(),
+            scale=2,
+            seed=2
+        )
+        self.assertEqual(summary['objects']['files'], 10)
+        self.assertNotEqual(
+            self.tree('testing_benchmarks/a'),
+            self.tree('testing_benchmarks/b')
+        )
+        self.assertNotEqual(summary, other)
+
+    def test_cluster_pods_take_pod_delay(self):
+        state_path = 'testing_benchmarks/cluster.json'
+        cluster.create_state(state_path, sessions=1, pod_delay=60)
+        fake = cluster.Cluster(state_path)
+        with fake.state(write=True) as state:
+            cluster.scale(
+                state,
+                'default',
+                cluster.POSTGRES_DEPLOYMENT,
+                0
+            )
+
+        pods = fake.items('pods', 'default')
+        postgres = [
+            p for p in pods if cluster.POSTGRES_DEPLOYMENT in
+            p['metadata']['name']
+        ]
+        self.assertTrue(postgres[0]['metadata']['deletionTimestamp'])
+
+        with fake.state() as state:
+            cluster.settle(state, time.time() + 120)
+            self.assertFalse(
+                any(
+                    cluster.POSTGRES_DEPLOYMENT in name
+                    for name in state['objects']['default']['pods']
+                )
+            )
+
+    def test_cluster_delete_deployments(self):
+        state = cluster.create_state(
+            'testing_benchmarks/cluster.json',
+            sessions=2,
+            pod_delay=0
+        )
+        cluster.delete_deployments(
+            state,
+            'default',
+            ['anaconda-session-0', 'missing']
+        )
+        cluster.settle(state, time.time())
+        self.assertNotIn(
+            'anaconda-session-0',
+            state['objects']['default']['deployments']
+        )
+        self.assertEqual(
+            [
+                name for name in state['objects']['default']['pods']
+                if name.startswith('anaconda-session-')
+            ],
+            [
+                name for name in state['objects']['default']['pods']
+                if name.startswith('anaconda-session-1-')
+            ]
+        )
+
+    def test_split_options(self):
+        options, positional = shims.split_options(
+            [
+                'delete', 'deployment', '--ignore-not-found', '--namespace',
+                'default', 'one', '--replicas=0', 'two'
+            ],
+            shims.KUBECTL_VALUES
+        )
+        self.assertEqual(positional, ['delete', 'deployment', 'one', 'two'])
+        self.assertEqual(shims.option(options, '--namespace'), 'default')
+        self.assertEqual(shims.option(options, '--replicas'), '0')
+        self.assertIn('--ignore-not-found', options)
+
+    def test_remote_command(self):
+        with mock.patch.dict(os.environ, {shims.REMOTE: '/tmp/remote'}):
+            self.assertEqual(
+                shims.remote_command("sudo mkdir -p /opt/anaconda_backup"),
+                'sudo mkdir -p /tmp/remote/opt/anaconda_backup'
+            )
+            self.assertEqual(
+                shims.remote_command("sudo cd /opt'"),
+                "sudo cd /tmp/remote/opt'"
+            )
+
+    def test_rsync_files_from(self):
+        storage.generate('testing_benchmarks/source', self.small_classes())
+        with open('testing_benchmarks/list.txt', 'w') as f:
+            f.write('storage/git\n')
+
+        remote = os.path.abspath('testing_benchmarks/remote')
+        with mock.patch.dict(os.environ, {shims.REMOTE: remote}):
+            shims.rsync([
+                '-avrq',
+                '--files-from=testing_benchmarks/list.txt',
+                'testing_benchmarks/source/',
+                'root@node:/opt/anaconda'
+            ])
+
+        copied = self.tree(f'{remote}/opt/anaconda')
+        self.assertEqual(
+            copied,
+            {
+                path: data for path, data in
+                self.tree('testing_benchmarks/source').items()
+                if path.startswith('storage/git/')
+            }
+        )
+
+    def test_kubectl_replace_and_create(self):
+        state_path = 'testing_benchmarks/cluster.json'
+        cluster.create_state(state_path, sessions=0, users=1, latency=0)
+        for name in ['anaconda-enterprise-certs', 'new-secret']:
+            with open(f'testing_benchmarks/{name}.yaml', 'w') as f:
+                json.dump(
+                    {'kind': 'Secret', 'metadata': {'name': name}},
+                    f
+                )
+
+        paths = [
+            '-f', 'testing_benchmarks/anaconda-enterprise-certs.yaml',
+            '-f', 'testing_benchmarks/new-secret.yaml'
+        ]
+        with mock.patch.dict(os.environ, {shims.STATE: state_path}):
+            with mock.patch('sys.stderr'):
+                with mock.patch('builtins.print') as printed:
+                    self.assertEqual(shims.kubectl(['replace'] + paths), 1)
+                    self.assertEqual(
+                        shims.kubectl(['create', paths[2], paths[3]]),
+                        0
+                    )
+
+        self.assertEqual(
+            [c[0][0] for c in printed.call_args_list],
+            [
+                'secret/anaconda-enterprise-certs replaced',
+                'secret/new-secret created'
+            ]
+        )
+
+    def test_regressions(self):
+        baseline = {
+            'scenarios': {
+                'backup': {'duration': 10.0, 'peak_rss': 100},
+                'restore': {'duration': 10.0, 'peak_rss': 100}
+            }
+        }
+        results = {
+            'scenarios': {
+                'backup': {'duration': 10.5, 'peak_rss': 100},
+                'restore': {'duration': 12.0, 'peak_rss': 200},
+                'archive': {'duration': 1.0, 'peak_rss': 1}
+            }
+        }
+        self.assertEqual(
+            run.regressions(results, baseline, 0.1),
+            [
+                'restore duration went from 10.0 to 12.0',
+                'restore peak_rss went from 100 to 200'
+            ]
+        )
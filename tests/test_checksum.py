@@ -0,0 +1,123 @@
+from unittest import TestCase
+
+
+from accord import exceptions
+from accord import checksum
+
+
+import hashlib
+import logging
+import shutil
+import json
+import mock
+import io
+import os
+
+
+class TestChecksum(TestCase):
+    def setUp(self):
+        logging.disable(logging.ERROR)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        shutil.rmtree('testing_checksum', ignore_errors=True)
+
+    def setup_backup(self):
+        os.makedirs('testing_checksum/secrets', exist_ok=True)
+        with open('testing_checksum/var_lib_gravity_backup.tar.gz', 'wb') as f:
+            f.write(os.urandom(3000))
+
+        with open('testing_checksum/secrets/cluster-tls.yaml', 'wb') as f:
+            f.write(b'kind: Secret\n')
+
+        open('testing_checksum/restore', 'a').close()
+        open('testing_checksum/ae5_backup_old.tar.gz', 'a').close()
+
+    def test_hashing_writer_pieces(self):
+        data = os.urandom(2500)
+        output = io.BytesIO()
+        writer = checksum.HashingWriter(output, piece_size=1000)
+        for i in range(0, len(data), 300):
+            writer.write(data[i:i + 300])
+
+        self.assertEqual(output.getvalue(), data)
+        self.assertEqual(
+            writer.entry(),
+            {
+                'size': 2500,
+                'pieces': [
+                    hashlib.sha256(data[i:i + 1000]).hexdigest()
+                    for i in range(0, 2500, 1000)
+                ]
+            }
+        )
+        self.assertEqual(
+            checksum.HashingWriter(io.BytesIO()).entry()['pieces'],
+            [hashlib.sha256(b'').hexdigest()]
+        )
+
+    def test_hash_pieces_matches_writer(self):
+        self.setup_backup()
+        path = 'testing_checksum/var_lib_gravity_backup.tar.gz'
+        with open(path, 'rb') as f:
+            writer = checksum.HashingWriter(io.BytesIO(), piece_size=1024)
+            writer.write(f.read())
+
+        self.assertEqual(
+            checksum.hash_pieces(path, piece_size=1024),
+            writer.entry()['pieces']
+        )
+        self.assertEqual(
+            checksum.hash_pieces(path, 2, 1, piece_size=1024),
+            writer.entry()['pieces'][2:]
+        )
+
+    def test_write_manifest(self):
+        self.setup_backup()
+        recorder = checksum.ChecksumRecorder()
+        writer = checksum.HashingWriter(io.BytesIO())
+        writer.write(b'kind: Secret\n')
+        recorder.record('secrets/cluster-tls.yaml', writer)
+
+        files = checksum.write_manifest(
+            'testing_checksum',
+            recorder.recorded()
+        )
+
+        self.assertEqual(
+            sorted(files),
+            ['secrets/cluster-tls.yaml', 'var_lib_gravity_backup.tar.gz']
+        )
+        with open('testing_checksum/checksums.json') as f:
+            self.assertEqual(json.load(f)['files'], files)
+
+        checksum.verify_checksums('testing_checksum/checksums.json')
+
+    def test_write_manifest_reuses_unchanged(self):
+        self.setup_backup()
+        checksum.write_manifest('testing_checksum', {})
+        with mock.patch(
+            'accord.checksum.file_entry',
+            wraps=checksum.file_entry
+        ) as file_entry:
+            checksum.write_manifest('testing_checksum', {})
+
+        file_entry.assert_not_called()
+
+    def test_verify_detects_corruption(self):
+        self.setup_backup()
+        checksum.write_manifest('testing_checksum', {})
+        path = 'testing_checksum/var_lib_gravity_backup.tar.gz'
+        with open(path, 'r+b') as f:
+            f.seek(2000)
+            f.write(b'\0' * 10)
+
+        os.remove('testing_checksum/secrets/cluster-tls.yaml')
+        with self.assertRaises(exceptions.ChecksumMismatch) as raised:
+            checksum.verify_checksums('testing_checksum/checksums.json')
+
+        self.assertIn('2 of 2 files', str(raised.exception))
+
+    def test_verify_missing_checksums(self):
+        with self.assertRaises(exceptions.ChecksumMismatch):
+            checksum.verify_checksums('testing_checksum/checksums.json')
@@ -0,0 +1,174 @@
+
+from unittest import TestCase
+
+
+from accord import chunkstore
+
+
+import random
+import shutil
+import mock
+import io
+import os
+
+
+SMALL_MASK = ((1 << 10) - 1) << 54
+
+
+def random_bytes(seed, size):
+    return random.Random(seed).getrandbits(size * 8).to_bytes(size, 'big')
+
+
+class TestChunkStore(TestCase):
+    def tearDown(self):
+        shutil.rmtree('testing_chunks', ignore_errors=True)
+
+    def setup_storage(self):
+        os.makedirs('testing_chunks/source/storage/git', exist_ok=True)
+        os.makedirs('testing_chunks/source/storage/pgdata', exist_ok=True)
+        os.makedirs('testing_chunks/backup', exist_ok=True)
+        with open('testing_chunks/source/storage/git/large.bin', 'wb') as f:
+            f.write(random_bytes(1, 600 * 1024))
+
+        with open('testing_chunks/source/storage/git/test.txt', 'w') as f:
+            f.write('testing')
+
+        with open('testing_chunks/source/storage/pgdata/test.sql', 'w') as f:
+            f.write('select 1;')
+
+        os.symlink('test.txt', 'testing_chunks/source/storage/git/link')
+        os.chmod('testing_chunks/source/storage/git/test.txt', 0o600)
+
+    def test_find_boundary_limits(self):
+        self.assertEqual(chunkstore.find_boundary(b'a' * 100), 100)
+        self.assertEqual(
+            chunkstore.find_boundary(b'\0' * 100, 10, 50, SMALL_MASK),
+            50
+        )
+
+    def test_find_boundary_without_numpy(self):
+        data = random_bytes(3, 64 * 1024)
+        with mock.patch('accord.chunkstore.SCAN_STEP', 100):
+            chunks = list(
+                chunkstore.split_chunks(
+                    io.BytesIO(data),
+                    1024,
+                    4096,
+                    SMALL_MASK
+                )
+            )
+
+        with mock.patch('accord.chunkstore.numpy', None):
+            self.assertEqual(
+                list(
+                    chunkstore.split_chunks(
+                        io.BytesIO(data),
+                        1024,
+                        4096,
+                        SMALL_MASK
+                    )
+                ),
+                chunks
+            )
+
+    def test_split_chunks_resync(self):
+        data = random_bytes(2, 200 * 1024)
+        original = list(
+            chunkstore.split_chunks(io.BytesIO(data), 1024, 16384, SMALL_MASK)
+        )
+        shifted = list(
+            chunkstore.split_chunks(
+                io.BytesIO(b'inserted' + data),
+                1024,
+                16384,
+                SMALL_MASK
+            )
+        )
+
+        self.assertEqual(b''.join(original), data)
+        self.assertGreater(len(original), 5)
+        # Only the chunks around the insert should change
+        self.assertGreaterEqual(
+            len(set(original) & set(shifted)),
+            len(original) - 2
+        )
+
+    def test_snapshot_and_restore(self):
+        self.setup_storage()
+        store = chunkstore.ChunkStore('testing_chunks/backup', jobs=2)
+        index_path, stats = store.snapshot(
+            'testing_chunks/source',
+            'storage',
+            'storage',
+            excludes=['storage/pgdata']
+        )
+
+        self.assertEqual(stats['files'], 2)
+        self.assertGreater(stats['bytes_written'], 0)
+        self.assertEqual(store.latest_snapshot('storage'), index_path)
+
+        store.restore(index_path, 'testing_chunks/restore')
+        with open('testing_chunks/restore/storage/git/large.bin', 'rb') as f:
+            with open(
+                'testing_chunks/source/storage/git/large.bin', 'rb'
+            ) as o:
+                self.assertEqual(f.read(), o.read())
+
+        self.assertEqual(
+            os.readlink('testing_chunks/restore/storage/git/link'),
+            'test.txt'
+        )
+        self.assertEqual(
+            os.stat('testing_chunks/restore/storage/git/test.txt').st_mode
+            & 0o777,
+            0o600
+        )
+        if os.path.exists('testing_chunks/restore/storage/pgdata'):
+            assert False, 'Excluded directory was restored'
+
+    def test_snapshot_deduplicates(self):
+        self.setup_storage()
+        store = chunkstore.ChunkStore('testing_chunks/backup', jobs=1)
+        store.snapshot('testing_chunks/source', 'storage', 'storage')
+        index_path, stats = store.snapshot(
+            'testing_chunks/source',
+            'storage',
+            'storage'
+        )
+
+        self.assertEqual(stats['files'], 3)
+        self.assertEqual(stats['bytes_written'], 0)
+
+    def test_snapshot_reuses_unchanged_files(self):
+        self.setup_storage()
+        store = chunkstore.ChunkStore('testing_chunks/backup', jobs=1)
+        store.snapshot('testing_chunks/source', 'storage', 'storage')
+        index_path, stats = store.snapshot(
+            'testing_chunks/source',
+            'storage',
+            'storage'
+        )
+
+        self.assertEqual(stats['reused'], 3)
+        self.assertEqual(stats['bytes_read'], 0)
+
+        with open('testing_chunks/source/storage/git/test.txt', 'w') as f:
+            f.write('changed')
+
+        os.utime('testing_chunks/source/storage/git/test.txt', (1, 1))
+        index_path, stats = store.snapshot(
+            'testing_chunks/source',
+            'storage',
+            'storage'
+        )
+
+        self.assertEqual(stats['files'], 3)
+        self.assertEqual(stats['reused'], 2)
+        self.assertEqual(stats['bytes_read'], 7)
+        store.restore(index_path, 'testing_chunks/restore')
+        with open('testing_chunks/restore/storage/git/test.txt') as f:
+            self.assertEqual(f.read(), 'changed')
+
+    def test_latest_snapshot_missing(self):
+        store = chunkstore.ChunkStore('testing_chunks/backup')
+        self.assertIsNone(store.latest_snapshot('storage'))
@@ -0,0 +1,251 @@
+
+from unittest import TestCase
+
+
+from accord import compression
+from accord import exceptions
+
+
+import subprocess
+import tarfile
+import shutil
+import gzip
+import mock
+import io
+import os
+
+
+class TestCompression(TestCase):
+    def tearDown(self):
+        for tf in ['test.tar.gz']:
+            if os.path.isfile(tf):
+                os.remove(tf)
+
+        try:
+            shutil.rmtree('testing_compression')
+        except Exception:
+            pass
+
+    def setup_testing_dir(self):
+        os.makedirs('testing_compression/storage', exist_ok=True)
+        with open('testing_compression/storage/test.txt', 'wb') as f:
+            f.write(os.urandom(1024) * 64)
+
+    def test_archive_name(self):
+        self.assertEqual(
+            compression.archive_name('storage_backup', 'gzip'),
+            'storage_backup.tar.gz'
+        )
+        self.assertEqual(
+            compression.archive_name('storage_backup', 'pigz-style-parallel'),
+            'storage_backup.tar.gz'
+        )
+        self.assertEqual(
+            compression.archive_name('storage_backup', 'zstd'),
+            'storage_backup.tar.zst'
+        )
+        self.assertEqual(
+            compression.archive_name('storage_backup', 'none'),
+            'storage_backup.tar'
+        )
+
+    def test_find_archive_fallback(self):
+        self.setup_testing_dir()
+        open('testing_compression/storage_backup.tar', 'a').close()
+        self.assertEqual(
+            compression.find_archive('testing_compression', 'storage_backup'),
+            'storage_backup.tar'
+        )
+
+    def test_find_archive_missing(self):
+        self.assertEqual(
+            compression.find_archive('testing_compression', 'storage_backup'),
+            'storage_backup.tar.gz'
+        )
+
+    def test_find_archive_newest(self):
+        self.setup_testing_dir()
+        open('testing_compression/storage_backup.tar.gz', 'a').close()
+        open('testing_compression/storage_backup.tar', 'a').close()
+        os.utime('testing_compression/storage_backup.tar.gz', (100, 100))
+        self.assertEqual(
+            compression.find_archive('testing_compression', 'storage_backup'),
+            'storage_backup.tar'
+        )
+
+    def test_remove_other_archives(self):
+        self.setup_testing_dir()
+        for name in ['storage_backup.tar.gz', 'storage_backup.tar']:
+            open(f'testing_compression/{name}', 'a').close()
+
+        compression.remove_other_archives(
+            'testing_compression',
+            'storage_backup',
+            'gzip'
+        )
+        self.assertTrue(
+            os.path.isfile('testing_compression/storage_backup.tar.gz')
+        )
+        self.assertFalse(
+            os.path.isfile('testing_compression/storage_backup.tar')
+        )
+
+    def test_parallel_gzip_round_trip(self):
+        data = os.urandom(4096) * 100
+        output = io.BytesIO()
+        with compression.ParallelGzipWriter(
+            output,
+            jobs=2,
+            block_size=10000
+        ) as writer:
+            for i in range(0, len(data), 3000):
+                writer.write(data[i:i + 3000])
+
+        self.assertGreater(writer.blocks_written, 1)
+        self.assertEqual(gzip.decompress(output.getvalue()), data)
+
+    def test_parallel_gzip_empty(self):
+        output = io.BytesIO()
+        with compression.ParallelGzipWriter(output, jobs=1):
+            pass
+
+        self.assertEqual(gzip.decompress(output.getvalue()), b'')
+
+    def test_parallel_gzip_readable_by_tar(self):
+        self.setup_testing_dir()
+        with open('test.tar.gz', 'wb') as f:
+            with compression.open_writer(
+                f,
+                'pigz-style-parallel',
+                jobs=2
+            ) as writer:
+                with tarfile.open(fileobj=writer, mode='w|') as tar:
+                    tar.add('testing_compression/storage', arcname='storage')
+
+        os.remove('testing_compression/storage/test.txt')
+        subprocess.run(
+            ['tar', '-xzf', '../test.tar.gz'],
+            cwd='testing_compression',
+            check=True
+        )
+        if not os.path.isfile('testing_compression/storage/test.txt'):
+            assert False, 'Did not extract the archive as expected'
+
+    def test_open_writer_none(self):
+        output = io.BytesIO()
+        with compression.open_writer(output, 'none') as writer:
+            writer.write(b'testing')
+
+        self.assertEqual(output.getvalue(), b'testing')
+
+    def test_open_writer_zstd_missing(self):
+        with mock.patch('accord.compression.zstandard', None):
+            try:
+                compression.open_writer(io.BytesIO(), 'zstd')
+                assert False, 'Exception should have been thrown'
+            except exceptions.CompressionNotAvailable:
+                pass
+            except Exception:
+                assert False, 'Did not catch proper exception'
+
+    def test_open_writer_unknown(self):
+        with self.assertRaises(exceptions.CompressionNotAvailable):
+            compression.open_writer(io.BytesIO(), 'bzip2')
+
+    def test_gzip_member_writer_levels(self):
+        data = os.urandom(64 * 1024)
+        output = io.BytesIO()
+        with compression.GzipMemberWriter(output) as writer:
+            writer.write(b'a' * 1024)
+            writer.set_level(0)
+            writer.write(data)
+            writer.set_level(6)
+            writer.write(b'b' * 1024)
+
+        self.assertEqual(writer.tell(), len(data) + 2048)
+        self.assertEqual(
+            gzip.decompress(output.getvalue()),
+            b'a' * 1024 + data + b'b' * 1024
+        )
+
+    def test_gzip_member_writer_empty(self):
+        output = io.BytesIO()
+        with compression.GzipMemberWriter(output):
+            pass
+
+        self.assertEqual(gzip.decompress(output.getvalue()), b'')
+
+    def test_is_compressed(self):
+        self.assertTrue(compression.is_compressed('storage_backup.tar.gz'))
+        self.assertTrue(compression.is_compressed('postgres.SQL.ZST'))
+        self.assertFalse(compression.is_compressed('storage_backup.tar'))
+
+    def test_write_tree_archive(self):
+        self.setup_testing_dir()
+        compressed = gzip.compress(os.urandom(512 * 1024))
+        with open('testing_compression/storage_backup.tar.gz', 'wb') as f:
+            f.write(compressed)
+
+        open('testing_compression/ae5_backup_old.tar.gz', 'a').close()
+        compression.write_tree_archive(
+            'testing_compression/ae5_backup_new.tar.gz',
+            'testing_compression',
+            'testing_compression',
+            excludes=['ae5_backup_*.tar.gz']
+        )
+
+        archive = 'testing_compression/ae5_backup_new.tar.gz'
+        with tarfile.open(archive) as tar:
+            names = tar.getnames()
+            stored = tar.extractfile(
+                'testing_compression/storage_backup.tar.gz'
+            ).read()
+
+        self.assertEqual(
+            sorted(names),
+            [
+                'testing_compression',
+                'testing_compression/storage',
+                'testing_compression/storage/test.txt',
+                'testing_compression/storage_backup.tar.gz'
+            ]
+        )
+        self.assertEqual(stored, compressed)
+        # The compressed member is stored, not deflated a second time
+        self.assertLess(
+            os.path.getsize(archive),
+            len(compressed) + 64 * 1024 + 16 * 1024
+        )
+
+        shutil.rmtree('testing_compression/storage')
+        subprocess.run(
+            ['tar', '-xzf', 'testing_compression/ae5_backup_new.tar.gz'],
+            check=True
+        )
+        if not os.path.isfile('testing_compression/storage/test.txt'):
+            assert False, 'Did not extract the archive as expected'
+
+    @mock.patch('accord.compression.BLOCK_SIZE', 1000)
+    def test_write_tree_archive_block_copy(self):
+        self.setup_testing_dir()
+        data = os.urandom(4321)
+        with open('testing_compression/storage/odd.bin', 'wb') as f:
+            f.write(data)
+
+        os.symlink('odd.bin', 'testing_compression/storage/link.bin')
+        compression.write_tree_archive(
+            'testing_compression/archive.tar.gz',
+            'testing_compression/storage',
+            'storage'
+        )
+
+        with tarfile.open('testing_compression/archive.tar.gz') as tar:
+            self.assertEqual(tar.extractfile('storage/odd.bin').read(), data)
+            self.assertEqual(
+                tar.getmember('storage/link.bin').linkname,
+                'odd.bin'
+            )
+            self.assertEqual(
+                len(tar.extractfile('storage/test.txt').read()),
+                1024 * 64
+            )
@@ -0,0 +1,199 @@
+from unittest import TestCase
+
+
+from accord import exceptions
+from accord import extract
+
+
+import tarfile
+import logging
+import shutil
+import gzip
+import mock
+import io
+import os
+
+
+class TestExtract(TestCase):
+    def setUp(self):
+        logging.disable(logging.ERROR)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        shutil.rmtree('testing_extract', ignore_errors=True)
+
+    def setup_archive(self, name='storage.tar.gz'):
+        os.makedirs('testing_extract/source/storage/git/objects/ab')
+        for i in range(50):
+            path = f'testing_extract/source/storage/git/objects/ab/{i:038d}'
+            with open(path, 'wb') as f:
+                f.write(os.urandom(i * 10))
+
+        with open('testing_extract/source/storage/large.bin', 'wb') as f:
+            f.write(os.urandom(300 * 1024))
+
+        os.chmod('testing_extract/source/storage/large.bin', 0o640)
+        os.symlink('large.bin', 'testing_extract/source/storage/link.bin')
+        os.link(
+            'testing_extract/source/storage/large.bin',
+            'testing_extract/source/storage/hard.bin'
+        )
+        os.utime('testing_extract/source/storage/git', (1000000, 1000000))
+        with tarfile.open(f'testing_extract/{name}', 'w:gz') as tar:
+            tar.add('testing_extract/source/storage', arcname='storage')
+
+        return f'testing_extract/{name}'
+
+    def assert_same_tree(self, source, target):
+        for dirpath, dirnames, filenames in os.walk(source):
+            relative = os.path.relpath(dirpath, source)
+            for name in dirnames + filenames:
+                source_path = os.path.join(source, relative, name)
+                target_path = os.path.join(target, relative, name)
+                source_stat = os.lstat(source_path)
+                target_stat = os.lstat(target_path)
+                self.assertEqual(source_stat.st_mode, target_stat.st_mode)
+                self.assertEqual(
+                    int(source_stat.st_mtime),
+                    int(target_stat.st_mtime),
+                    target_path
+                )
+                if os.path.islink(source_path):
+                    self.assertEqual(
+                        os.readlink(source_path),
+                        os.readlink(target_path)
+                    )
+                elif os.path.isfile(source_path):
+                    with open(source_path, 'rb') as s:
+                        with open(target_path, 'rb') as t:
+                            self.assertEqual(s.read(), t.read())
+
+    @mock.patch('accord.extract.SMALL_FILE_SIZE', 100 * 1024)
+    def test_extract_archive(self):
+        archive = self.setup_archive()
+        os.makedirs('testing_extract/target')
+        with mock.patch('accord.extract.os.sync') as sync:
+            extract.extract_archive(archive, 'testing_extract/target', jobs=4)
+
+        sync.assert_called_once_with()
+        self.assert_same_tree(
+            'testing_extract/source/storage',
+            'testing_extract/target/storage'
+        )
+        self.assertEqual(
+            os.stat('testing_extract/target/storage/large.bin').st_ino,
+            os.stat('testing_extract/target/storage/hard.bin').st_ino
+        )
+
+    @mock.patch('accord.extract.MAX_PENDING_FILES', 2)
+    def test_extract_archive_over_existing(self):
+        archive = self.setup_archive()
+        os.makedirs('testing_extract/target/storage/git/objects/ab')
+        with open('testing_extract/outside', 'w') as f:
+            f.write('outside')
+
+        # A symlink in the way is replaced and never written through
+        os.symlink(
+            '../../../../../outside',
+            'testing_extract/target/storage/git/objects/ab/' + '0' * 38
+        )
+        extract.extract_archive(
+            archive,
+            'testing_extract/target',
+            sync=False
+        )
+
+        self.assert_same_tree(
+            'testing_extract/source/storage',
+            'testing_extract/target/storage'
+        )
+        with open('testing_extract/outside') as f:
+            self.assertEqual(f.read(), 'outside')
+
+    @mock.patch('accord.extract.SMALL_FILE_SIZE', 4)
+    def test_extract_archive_no_recursion(self):
+        os.makedirs('testing_extract/target')
+        # Only the files are listed, as tar --no-recursion writes them
+        with tarfile.open('testing_extract/files.tar', 'w') as tar:
+            for name, data in [
+                ('storage/newdir/sub/g', b'g'),
+                ('storage/other/large', b'larger')
+            ]:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+
+            info = tarfile.TarInfo('storage/links/g')
+            info.type = tarfile.SYMTYPE
+            info.linkname = '../newdir/sub/g'
+            tar.addfile(info)
+            info = tarfile.TarInfo('storage/hard/g')
+            info.type = tarfile.LNKTYPE
+            info.linkname = 'storage/newdir/sub/g'
+            tar.addfile(info)
+
+        extract.extract_archive(
+            'testing_extract/files.tar',
+            'testing_extract/target',
+            sync=False
+        )
+
+        for path, data in [
+            ('newdir/sub/g', b'g'),
+            ('other/large', b'larger'),
+            ('links/g', b'g'),
+            ('hard/g', b'g')
+        ]:
+            with open(f'testing_extract/target/storage/{path}', 'rb') as f:
+                self.assertEqual(f.read(), data)
+
+    def test_extract_archive_unsafe_member(self):
+        os.makedirs('testing_extract/target')
+        info = tarfile.TarInfo('../escaped.txt')
+        info.size = 4
+        with tarfile.open('testing_extract/unsafe.tar', 'w') as tar:
+            tar.addfile(info, io.BytesIO(b'test'))
+
+        with self.assertRaises(exceptions.NotValidTarfile):
+            extract.extract_archive(
+                'testing_extract/unsafe.tar',
+                'testing_extract/target',
+                sync=False
+            )
+
+        if os.path.exists('testing_extract/escaped.txt'):
+            assert False, 'Member was extracted outside of the target'
+
+    def test_extract_archive_truncated(self):
+        archive = self.setup_archive()
+        with open(archive, 'rb') as f:
+            data = f.read()
+
+        with open(archive, 'wb') as f:
+            f.write(data[:len(data) // 2])
+
+        os.makedirs('testing_extract/target')
+        with self.assertRaises((EOFError, tarfile.ReadError)):
+            extract.extract_archive(
+                archive,
+                'testing_extract/target',
+                sync=False
+            )
+
+    def test_prefetch_reader(self):
+        os.makedirs('testing_extract')
+        data = os.urandom(10000)
+        with gzip.open('testing_extract/data.gz', 'wb') as f:
+            f.write(data)
+
+        reader = extract.PrefetchReader(
+            'testing_extract/data.gz',
+            block_size=1000,
+            blocks=2
+        )
+        try:
+            self.assertEqual(reader.read(1500), data[:1500])
+            self.assertEqual(reader.read(), data[1500:])
+            self.assertEqual(reader.read(10), b'')
+        finally:
+            reader.close()
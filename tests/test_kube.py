@@ -0,0 +1,178 @@
+
+from unittest import TestCase
+
+
+from accord import exceptions
+from accord import kube
+
+
+import subprocess
+import logging
+import json
+import mock
+import sys
+
+
+def pod(name, phase='Running', deleting=False):
+    metadata = {'name': name}
+    if deleting:
+        metadata['deletionTimestamp'] = '2020-01-01T00:00:00Z'
+
+    return {'kind': 'Pod', 'metadata': metadata, 'status': {'phase': phase}}
+
+
+def event(event_type, pod_object):
+    return {'type': event_type, 'object': pod_object}
+
+
+def fake_watch(*events):
+    # Stand in for kubectl by printing the events the way a watch does
+    output = ''.join(json.dumps(e, indent=4) + '\n' for e in events)
+    return subprocess.Popen(
+        [sys.executable, '-c', f'import sys; sys.stdout.write({output!r})'],
+        stdout=subprocess.PIPE
+    )
+
+
+class TestKube(TestCase):
+    def setUp(self):
+        logging.disable(logging.ERROR)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_client_cache(self):
+        kubectl = mock.Mock(
+            return_value=json.dumps({'items': [pod('postgres-1')]})
+        )
+        client = kube.KubeClient(kubectl)
+
+        self.assertEqual(client.get('pods', 'postgres-1'), pod('postgres-1'))
+        self.assertIsNone(client.get('pods', 'missing'))
+        self.assertEqual(kubectl.call_count, 1)
+        kubectl.assert_called_with(
+            'get', 'pods', '--namespace', 'default', '-o', 'json'
+        )
+
+        client.objects('pods', 'kube-system')
+        self.assertEqual(kubectl.call_count, 2)
+
+        client.run('delete', '--all', 'pods')
+        client.objects('pods')
+        self.assertEqual(kubectl.call_count, 4)
+
+    def test_client_invalidate_kind(self):
+        kubectl = mock.Mock(return_value=json.dumps({'items': []}))
+        client = kube.KubeClient(kubectl)
+        client.objects('pods')
+        client.objects('secrets')
+        client.invalidate('pods')
+
+        self.assertEqual(list(client.cache), [('secrets', 'default')])
+
+    def test_decode_objects_partial(self):
+        text = json.dumps({'a': 1}) + '\n' + json.dumps({'b': 2})
+        objects, remaining = kube.decode_objects(text[:-3])
+
+        self.assertEqual(objects, [{'a': 1}])
+        objects, remaining = kube.decode_objects(remaining + text[-3:])
+        self.assertEqual(objects, [{'b': 2}])
+        self.assertEqual(remaining, '')
+
+    def test_apply_event(self):
+        pods = {}
+        kube.apply_event(pods, event('ADDED', pod('postgres-1')))
+        kube.apply_event(pods, pod('app-1'))
+        self.assertEqual(sorted(pods), ['app-1', 'postgres-1'])
+
+        kube.apply_event(pods, event('DELETED', pod('postgres-1')))
+        kube.apply_event(pods, {'kind': 'Status'})
+        self.assertEqual(sorted(pods), ['app-1'])
+
+    def test_conditions(self):
+        running = {'postgres-1': pod('postgres-1')}
+        pending = {'postgres-1': pod('postgres-1', 'Pending')}
+        deleting = {'postgres-1': pod('postgres-1', deleting=True)}
+
+        self.assertTrue(kube.postgres_running(running))
+        self.assertFalse(kube.postgres_running(pending))
+        self.assertFalse(kube.postgres_running(deleting))
+        self.assertFalse(kube.postgres_stopped(deleting))
+        self.assertTrue(kube.postgres_stopped({'app-1': pod('app-1')}))
+        self.assertTrue(kube.all_pods_running(running))
+        self.assertFalse(kube.all_pods_running(deleting))
+        self.assertFalse(kube.all_pods_running({}))
+        self.assertTrue(kube.sessions_stopped(running))
+        self.assertFalse(
+            kube.sessions_stopped({'anaconda-session-1': pod('session')})
+        )
+
+    @mock.patch('accord.kube.list_pods')
+    @mock.patch('accord.kube.open_watch')
+    def test_wait_for_pods_initial_list(self, open_watch, list_pods):
+        open_watch.side_effect = lambda namespace: fake_watch()
+        list_pods.return_value = {'postgres-1': pod('postgres-1')}
+        kube.wait_for_pods(kube.postgres_running, timeout=5)
+
+        self.assertEqual(open_watch.call_count, 1)
+
+    @mock.patch('accord.kube.list_pods')
+    @mock.patch('accord.kube.open_watch')
+    def test_wait_for_pods_watch(self, open_watch, list_pods):
+        open_watch.side_effect = lambda namespace: fake_watch(
+            event('MODIFIED', pod('postgres-1', 'Pending')),
+            event('MODIFIED', pod('postgres-1'))
+        )
+        list_pods.return_value = {'postgres-1': pod('postgres-1', 'Pending')}
+        kube.wait_for_pods(kube.postgres_running, timeout=5)
+
+        self.assertEqual(open_watch.call_count, 1)
+
+    @mock.patch('accord.kube.list_pods')
+    @mock.patch('accord.kube.open_watch')
+    def test_wait_for_pods_watch_objects(self, open_watch, list_pods):
+        # Without event types a deleted pod is listed again to see it is gone
+        open_watch.side_effect = lambda namespace: fake_watch(
+            pod('app-1'),
+            pod('postgres-1', deleting=True)
+        )
+        list_pods.side_effect = [
+            {'postgres-1': pod('postgres-1')},
+            {'app-1': pod('app-1')}
+        ]
+        kube.wait_for_pods(kube.postgres_stopped, timeout=5)
+
+        self.assertEqual(open_watch.call_count, 1)
+        self.assertEqual(list_pods.call_count, 2)
+
+    @mock.patch('accord.kube.time.sleep')
+    @mock.patch('accord.kube.list_pods')
+    @mock.patch('accord.kube.open_watch')
+    def test_wait_for_pods_reconnect(self, open_watch, list_pods, sleep):
+        open_watch.side_effect = lambda namespace: fake_watch()
+        list_pods.side_effect = [
+            {'postgres-1': pod('postgres-1')},
+            {}
+        ]
+        kube.wait_for_pods(kube.postgres_stopped, timeout=5)
+
+        self.assertEqual(open_watch.call_count, 2)
+        sleep.assert_called_once_with(kube.INITIAL_BACKOFF)
+
+    @mock.patch('accord.kube.time.sleep')
+    @mock.patch('accord.kube.list_pods')
+    @mock.patch('accord.kube.open_watch')
+    def test_wait_for_pods_timeout(self, open_watch, list_pods, sleep):
+        open_watch.side_effect = lambda namespace: fake_watch()
+        list_pods.return_value = {'postgres-1': pod('postgres-1')}
+        with mock.patch(
+            'accord.kube.time.monotonic',
+            side_effect=[0, 1, 2, 3, 10, 11]
+        ):
+            with self.assertRaises(exceptions.PodWaitTimeout):
+                kube.wait_for_pods(kube.postgres_stopped, timeout=5)
+
+        self.assertEqual(
+            [c[0][0] for c in sleep.call_args_list],
+            [1]
+        )
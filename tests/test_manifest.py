@@ -0,0 +1,106 @@
+
+from unittest import TestCase
+
+
+from accord import manifest
+
+
+import shutil
+import mock
+import os
+
+
+class TestManifest(TestCase):
+    def tearDown(self):
+        shutil.rmtree('testing_manifest', ignore_errors=True)
+
+    def setup_storage(self):
+        os.makedirs('testing_manifest/storage/git', exist_ok=True)
+        os.makedirs('testing_manifest/storage/pgdata', exist_ok=True)
+        with open('testing_manifest/storage/git/test.txt', 'w') as f:
+            f.write('testing')
+
+        with open('testing_manifest/storage/pgdata/test.sql', 'w') as f:
+            f.write('select 1;')
+
+        os.symlink('test.txt', 'testing_manifest/storage/git/link')
+
+    def test_scan(self):
+        self.setup_storage()
+        entries = list(manifest.scan('testing_manifest'))
+        paths = [entry[0] for entry in entries]
+
+        self.assertEqual(paths, ['storage/git/link', 'storage/git/test.txt'])
+        self.assertEqual(entries[1][1], 7)
+        self.assertEqual(
+            entries[1][4],
+            manifest.hash_file('testing_manifest/storage/git/test.txt')
+        )
+
+    def test_scan_reuses_hash(self):
+        self.setup_storage()
+        previous = {
+            entry[0]: entry for entry in manifest.scan('testing_manifest')
+        }
+        with mock.patch('accord.manifest.hash_file') as hash_file:
+            entries = list(manifest.scan('testing_manifest', previous))
+
+        hash_file.assert_not_called()
+        self.assertEqual(entries, list(previous.values()))
+
+    def test_update_manifest(self):
+        self.setup_storage()
+        manifest_path = 'testing_manifest/base.manifest.json.gz'
+        changed, deleted = manifest.update_manifest(
+            manifest_path,
+            'testing_manifest',
+            {}
+        )
+        self.assertEqual(
+            changed,
+            ['storage/git/link', 'storage/git/test.txt']
+        )
+        self.assertEqual(deleted, [])
+
+        os.remove('testing_manifest/storage/git/link')
+        with open('testing_manifest/storage/git/new.txt', 'w') as f:
+            f.write('new')
+
+        changed, deleted = manifest.update_manifest(
+            'testing_manifest/incr.manifest.json.gz',
+            'testing_manifest',
+            manifest.read_manifest(manifest_path)
+        )
+        self.assertEqual(changed, ['storage/git/new.txt'])
+        self.assertEqual(deleted, ['storage/git/link'])
+
+    def test_chain(self):
+        os.makedirs('testing_manifest', exist_ok=True)
+        self.assertEqual(manifest.load_chain('testing_manifest'), [])
+
+        chain = [
+            {
+                'type': 'full',
+                'archive': 'storage_backup.tar.gz',
+                'manifest': 'storage_backup.manifest.json.gz'
+            },
+            {
+                'type': 'incremental',
+                'archive': 'storage_incremental_1.tar.gz',
+                'manifest': 'storage_incremental_1.manifest.json.gz',
+                'deleted': 'storage_incremental_1.deleted.json'
+            }
+        ]
+        for link in chain:
+            for key in ['archive', 'manifest', 'deleted']:
+                if key in link:
+                    open(f'testing_manifest/{link[key]}', 'a').close()
+
+        manifest.save_chain('testing_manifest', chain)
+        self.assertEqual(manifest.load_chain('testing_manifest'), chain)
+
+        manifest.reset_chain('testing_manifest')
+        self.assertEqual(
+            sorted(os.listdir('testing_manifest')),
+            ['storage_backup.tar.gz']
+        )
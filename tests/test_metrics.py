@@ -0,0 +1,90 @@
+from unittest import TestCase
+
+
+from accord import metrics
+
+
+from concurrent import futures
+import subprocess
+import logging
+import shutil
+import json
+import os
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        logging.disable(logging.ERROR)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        shutil.rmtree('testing_metrics', ignore_errors=True)
+
+    def test_stage_counters(self):
+        run = metrics.RunMetrics('backup')
+        run.add(files=1)
+        with run.stage('storage') as stage:
+            run.add(bytes_read=10, bytes_written=4, files=2)
+            run.add(subprocesses=1)
+
+        self.assertEqual(stage.status, 'success')
+        self.assertEqual(stage.exit_code, 0)
+        self.assertEqual(
+            (stage.bytes_read, stage.bytes_written, stage.files),
+            (10, 4, 2)
+        )
+        self.assertIsNone(run.current())
+
+    def test_stage_failure_exit_code(self):
+        run = metrics.RunMetrics('restore')
+        with self.assertRaises(subprocess.CalledProcessError):
+            with run.stage('restore-postgres'):
+                raise subprocess.CalledProcessError(3, 'psql')
+
+        with self.assertRaises(ValueError):
+            with run.stage('restore-secrets'):
+                raise ValueError('failed')
+
+        self.assertEqual(run.stages['restore-postgres'].status, 'failed')
+        self.assertEqual(run.stages['restore-postgres'].exit_code, 3)
+        self.assertEqual(run.stages['restore-secrets'].exit_code, 1)
+
+    def test_bind(self):
+        run = metrics.RunMetrics('backup')
+        with run.stage('postgres') as stage:
+            with futures.ThreadPoolExecutor(max_workers=4) as pool:
+                list(pool.map(
+                    run.bind(lambda _: run.add(subprocesses=1)),
+                    range(8)
+                ))
+
+        self.assertEqual(stage.subprocesses, 8)
+
+    def test_write_report_and_textfile(self):
+        os.makedirs('testing_metrics')
+        run = metrics.RunMetrics('backup')
+        with run.stage('postgres'):
+            run.add(bytes_written=100, files=1)
+
+        run.finish()
+        run.write_report('testing_metrics/report.json')
+        run.write_textfile('testing_metrics/accord.prom')
+
+        with open('testing_metrics/report.json') as f:
+            report = json.load(f)
+
+        self.assertEqual(report['status'], 'success')
+        self.assertEqual(report['totals']['bytes_written'], 100)
+        self.assertEqual(report['stages'][0]['name'], 'postgres')
+        with open('testing_metrics/accord.prom') as f:
+            textfile = f.read()
+
+        self.assertIn(
+            'accord_stage_bytes_written{action="backup",stage="postgres"} 100',
+            textfile
+        )
+        self.assertIn('accord_run_success{action="backup"} 1', textfile)
+        self.assertEqual(
+            sorted(os.listdir('testing_metrics')),
+            ['accord.prom', 'report.json']
+        )
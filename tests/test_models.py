@@ -13,6 +13,7 @@ import tarfile
 import shutil
 import mock
 import glob
+import io
 import os
 
 
@@ -39,34 +40,52 @@ class TestModels(TestCase):
                                   sync_node=None, sync_user='root',
                                   start_deployments=False,
                                   directory='/opt/anaconda_backup',
-                                  archive=False):
+                                  archive=False, compression='gzip',
+                                  stream_sync=False, incremental=False,
+                                  chunk_store=False, jobs=1,
+                                  postgres_mode='file', sync_jobs=1):
         class MockArgs(object):
             def __init__(self):
                 self.action = 'backup'
+                self.compression = compression
                 self.directory = directory
                 self.no_config = False
                 self.override = False
                 self.repos_only = repos_only
                 self.archive = archive
+                self.postgres_mode = postgres_mode
                 self.start_deployments = start_deployments
                 self.sync = sync
                 self.sync_node = sync_node
                 self.sync_user = sync_user
+                self.stream_sync = stream_sync
+                self.incremental = incremental
+                self.chunk_store = chunk_store
+                self.jobs = jobs
+                self.postgres_jobs = 4
+                self.sync_jobs = sync_jobs
 
         return MockArgs()
 
     def setup_args_restore_default(self, override=False, repos_only=False,
                                    no_config=False, start_deployments=False,
                                    directory='/opt/anaconda_backup',
-                                   restore_file=None):
+                                   restore_file=None, compression='gzip',
+                                   chunk_store=False, jobs=1,
+                                   no_verify=False):
         class MockArgs(object):
             def __init__(self):
                 self.action = 'restore'
+                self.compression = compression
                 self.directory = directory
                 self.no_config = no_config
                 self.override = override
                 self.repos_only = repos_only
                 self.restore_file = restore_file
+                self.no_verify = no_verify
+                self.chunk_store = chunk_store
+                self.jobs = jobs
+                self.postgres_jobs = 4
                 self.start_deployments = start_deployments
 
         return MockArgs()
@@ -304,10 +323,7 @@ class TestModels(TestCase):
     @mock.patch('sh.Command')
     def test_grabbing_postgres_docker_container(self, Command):
         mock_response = mock.Mock()
-        mock_response.side_effect = [
-            model_returns.GET_PODS,
-            model_returns.DESCRIBE_POD
-        ]
+        mock_response.side_effect = [model_returns.GET_PODS]
         with mock.patch('accord.models.Accord.setup_backup_directory'):
             with mock.patch('accord.models.Accord.remove_signal_restore_file'):
                 test_class = models.Accord(self.setup_args_backup_default())
@@ -374,6 +390,25 @@ class TestModels(TestCase):
             'Returned value is not expected value'
         )
 
+    @mock.patch('sh.Command')
+    def test_open_psql_session(self, Command):
+        test_class = models.Accord(
+            self.setup_args_restore_default(override=True)
+        )
+        test_class.docker_cont_id = 'test_container'
+        with mock.patch('accord.psql.PsqlSession') as session:
+            test_class.open_psql_session('anaconda_deploy')
+
+        self.assertEqual(
+            session.call_args[0][0],
+            [
+                'gravity', 'exec', 'docker', 'exec', '-i', 'test_container',
+                '/bin/bash', '-c',
+                "su - postgres -c 'psql -U postgres -X -q -A -t -v "
+                "ON_ERROR_STOP=1 -d anaconda_deploy'"
+            ]
+        )
+
     @mock.patch('sh.Command')
     def test_container_command_exception(self, Command):
         test_class = models.Accord(
@@ -387,8 +422,8 @@ class TestModels(TestCase):
             'accord.models.subprocess.run',
             side_effect=mock_response
         ):
-            with mock.patch('accord.models.sys.exit'):
-                test_class.run_command_on_container(container, command)
+            with self.assertRaises(SystemExit):
+                test_class.run_command_on_container(container, command, True)
 
     @mock.patch('sh.Command')
     def test_container_command_success_return(self, Command):
@@ -418,8 +453,11 @@ class TestModels(TestCase):
         container = 'test_container'
         command = 'ls'
         try:
-            with mock.patch('accord.models.subprocess.run'):
-                test_class.run_command_on_container(
+            with mock.patch(
+                'accord.models.output.run_counted',
+                return_value=(0, None)
+            ) as run:
+                return_code = test_class.run_command_on_container(
                     container,
                     command,
                     False
@@ -427,6 +465,50 @@ class TestModels(TestCase):
         except Exception:
             assert False, "Exception occurred"
 
+        self.assertEqual(
+            run.call_args[0][0],
+            [
+                'gravity', 'exec', 'docker', 'exec', '-i', 'test_container',
+                '/bin/bash', '-c', 'ls'
+            ]
+        )
+        self.assertEqual(return_code, 0)
+
+    @mock.patch('sh.Command')
+    def test_stream_command_on_container(self, Command):
+        test_class = models.Accord(
+            self.setup_args_restore_default(override=True)
+        )
+        out = io.BytesIO()
+        with mock.patch('accord.models.subprocess.Popen') as popen:
+            popen.return_value.stdout = io.BytesIO(b'Success')
+            popen.return_value.wait.return_value = 0
+            results = test_class.stream_command_on_container(
+                'test_container',
+                'ls',
+                out
+            )
+
+        self.assertEqual(results, 0)
+        self.assertEqual(out.getvalue(), b'Success')
+
+    @mock.patch('sh.Command')
+    def test_stream_into_container(self, Command):
+        test_class = models.Accord(
+            self.setup_args_restore_default(override=True)
+        )
+        with mock.patch('accord.models.subprocess.Popen') as popen:
+            popen.return_value.wait.return_value = 0
+            results = test_class.stream_into_container(
+                'test_container',
+                'cat',
+                io.BytesIO(b'Success')
+            )
+
+        self.assertEqual(results, 0)
+        popen.return_value.stdin.write.assert_called_once_with(b'Success')
+        popen.return_value.stdin.close.assert_called_once_with()
+
     @mock.patch('sh.Command')
     def test_su_command_exception(self, Command):
         test_class = models.Accord(
@@ -525,6 +607,29 @@ class TestModels(TestCase):
 
             assert success, 'File not found in archive'
 
+    @mock.patch('sh.Command')
+    def test_create_tar_archive_chunk_store(self, Command):
+        self.setup_testing_dir()
+        with mock.patch('accord.models.Accord.setup_backup_directory'):
+            with mock.patch('accord.models.Accord.remove_signal_restore_file'):
+                test_class = models.Accord(
+                    self.setup_args_backup_default(chunk_store=True)
+                )
+
+        test_class.backup_directory = 'testing_tar'
+        test_class.create_tar_archive()
+
+        self.assertEqual(glob.glob('testing_tar/*.tar.gz'), [])
+        snapshots = glob.glob('testing_tar/snapshots/ae5_backup_*.json.gz')
+        self.assertEqual(len(snapshots), 1, 'Did not find archive snapshot')
+
+        os.remove('testing_tar/test.txt')
+        test_class.action = 'restore'
+        test_class.restore_file = snapshots[0]
+        test_class.extract_tar_archive()
+        if not os.path.isfile('testing_tar/test.txt'):
+            assert False, 'Did not restore the archive snapshot'
+
     @mock.patch('sh.Command')
     def test_create_tar_archive_failure(self, Command):
         self.setup_testing_dir()
@@ -560,6 +665,71 @@ class TestModels(TestCase):
         else:
             assert False, 'Did not extract the archive as expected'
 
+    @mock.patch('sh.Command')
+    def test_create_tar_archive_skips_archives(self, Command):
+        self.setup_testing_dir()
+        open('testing_tar/ae5_backup_old.tar.gz', 'a').close()
+        open('testing_tar/ae5_backup_old.tar.gz.checksums.json', 'a').close()
+        with mock.patch('accord.models.Accord.setup_backup_directory'):
+            with mock.patch('accord.models.Accord.remove_signal_restore_file'):
+                test_class = models.Accord(self.setup_args_backup_default())
+
+        test_class.backup_directory = 'testing_tar'
+        test_class.create_tar_archive()
+
+        archive = [
+            a for a in glob.glob('testing_tar/*.tar.gz')
+            if not a.endswith('_old.tar.gz')
+        ][0]
+        with tarfile.open(archive) as tar:
+            names = [os.path.basename(name) for name in tar.getnames()]
+
+        self.assertIn('test.txt', names)
+        self.assertNotIn('ae5_backup_old.tar.gz', names)
+        self.assertNotIn('ae5_backup_old.tar.gz.checksums.json', names)
+
+    @mock.patch('sh.Command')
+    def test_create_tar_archive_checksums(self, Command):
+        self.setup_testing_dir()
+        with mock.patch('accord.models.Accord.setup_backup_directory'):
+            with mock.patch('accord.models.Accord.remove_signal_restore_file'):
+                test_class = models.Accord(self.setup_args_backup_default())
+
+        test_class.backup_directory = 'testing_tar'
+        test_class.create_tar_archive()
+
+        archive = glob.glob('testing_tar/*.tar.gz')[0]
+        self.assertTrue(os.path.isfile(f'{archive}.checksums.json'))
+        with open(archive, 'r+b') as f:
+            f.seek(-20, os.SEEK_END)
+            f.write(b'\0' * 10)
+
+        test_class = models.Accord(
+            self.setup_args_restore_default(
+                override=True,
+                restore_file=archive,
+                directory='testing_tar'
+            )
+        )
+        with mock.patch('accord.models.extract.extract_archive') as extract:
+            with self.assertRaises(exceptions.ChecksumMismatch):
+                test_class.extract_tar_archive('.')
+
+        extract.assert_not_called()
+
+    @mock.patch('sh.Command')
+    def test_verify_backup_required(self, Command):
+        self.setup_testing_dir()
+        test_class = models.Accord(
+            self.setup_args_restore_default(
+                override=True,
+                directory='testing_tar'
+            )
+        )
+        test_class.verify_backup()
+        with self.assertRaises(exceptions.ChecksumMismatch):
+            test_class.verify_backup(required=True)
+
     @mock.patch('sh.Command')
     def test_extract_tar_archive_failure(self, Command):
         self.setup_temp_restore_file('test.tar.gz')
@@ -0,0 +1,46 @@
+from unittest import TestCase
+
+
+from accord import output
+
+
+import logging
+import sys
+
+
+class TestOutput(TestCase):
+    def setUp(self):
+        logging.disable(logging.ERROR)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_counter_keeps_tail(self):
+        counter = output.OutputCounter('tar', 'files', tail=3)
+        for i in range(1000):
+            counter(f'storage/git/{i}\n')
+
+        counter(b'storage/git/last\n')
+        self.assertEqual(counter.lines, 1001)
+        self.assertEqual(
+            list(counter.tail),
+            ['storage/git/998', 'storage/git/999', 'storage/git/last']
+        )
+
+    def test_run_counted(self):
+        return_code, counter = output.run_counted(
+            [
+                sys.executable,
+                '-c',
+                'import sys\n'
+                'for i in range(5000): print(i)\n'
+                'sys.stderr.write("failed\\n")\n'
+                'sys.exit(3)'
+            ],
+            'test command'
+        )
+
+        self.assertEqual(return_code, 3)
+        self.assertEqual(counter.lines, 5000)
+        self.assertEqual(counter.tail[-1], '4999')
+        self.assertEqual(len(counter.tail), output.TAIL_LINES)
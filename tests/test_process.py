@@ -1,16 +1,26 @@
 
 from .fixtures import process_returns
+from .fixtures import model_returns
 from unittest import TestCase
 
 
 from accord import exceptions
+from accord import manifest
 from accord import process
+from accord import trace
+from accord import psql
 from accord import models
 
 
+import subprocess
 import logging
-import pathlib
+import tarfile
+import shutil
 import mock
+import yaml
+import json
+import gzip
+import sys
 import os
 import sh
 
@@ -24,54 +34,83 @@ class TestProcess(TestCase):
     def tearDown(self):
         self.time_patcher.stop()
         logging.disable(logging.NOTSET)
-        temp_files = ['restore', 'test_backup.sql', 'accord.log']
+        temp_files = [
+            'restore',
+            'test_backup.sql',
+            'accord.log',
+            'storage_backup.tar.gz',
+            'storage_backup.tar'
+        ]
         for tf in temp_files:
             if os.path.isfile(tf):
                 os.remove(tf)
 
+        shutil.rmtree('testing_storage', ignore_errors=True)
+
         if os.path.exists('anaconda_backup'):
             os.rmdir('anaconda_backup')
 
-        temp_secrets = ['secrets/test-secret.yaml', 'secrets/test-cm.yaml']
-        for ts in temp_secrets:
-            if os.path.isfile(ts):
-                os.remove(ts)
-
-        if os.path.exists('secrets'):
-            os.rmdir('secrets')
+        shutil.rmtree('secrets', ignore_errors=True)
 
     def setup_args_backup_default(self, repos_only=False, sync=False,
                                   sync_node=None, sync_user='root',
                                   start_deployments=False,
                                   directory='/opt/anaconda_backup',
-                                  archive=False):
+                                  archive=False, compression='gzip',
+                                  stream_sync=False, incremental=False,
+                                  chunk_store=False, jobs=1,
+                                  postgres_mode='file', sync_jobs=1,
+                                  metrics_textfile=None, report=None,
+                                  trace=None):
         class MockArgs(object):
             def __init__(self):
                 self.action = 'backup'
+                self.compression = compression
                 self.directory = directory
                 self.no_config = False
                 self.override = False
                 self.repos_only = repos_only
                 self.archive = archive
+                self.postgres_mode = postgres_mode
                 self.start_deployments = start_deployments
                 self.sync = sync
                 self.sync_node = sync_node
                 self.sync_user = sync_user
+                self.stream_sync = stream_sync
+                self.incremental = incremental
+                self.chunk_store = chunk_store
+                self.jobs = jobs
+                self.postgres_jobs = 4
+                self.sync_jobs = sync_jobs
+                self.metrics_textfile = metrics_textfile
+                self.report = report
+                self.trace = trace
 
         return MockArgs()
 
     def setup_args_restore_default(self, override=False, repos_only=False,
                                    no_config=False, start_deployments=False,
                                    directory='/opt/anaconda_backup',
-                                   restore_file=None):
+                                   restore_file=None, compression='gzip',
+                                   chunk_store=False, jobs=1,
+                                   no_verify=False, metrics_textfile=None,
+                                   report=None, trace=None):
         class MockArgs(object):
             def __init__(self):
                 self.action = 'restore'
+                self.compression = compression
                 self.directory = directory
                 self.no_config = no_config
                 self.override = override
                 self.repos_only = repos_only
                 self.restore_file = restore_file
+                self.no_verify = no_verify
+                self.metrics_textfile = metrics_textfile
+                self.report = report
+                self.trace = trace
+                self.chunk_store = chunk_store
+                self.jobs = jobs
+                self.postgres_jobs = 4
                 self.start_deployments = start_deployments
 
         return MockArgs()
@@ -79,19 +118,6 @@ class TestProcess(TestCase):
     def setup_temp_file(self, temp_path):
         open(temp_path, 'a').close()
 
-    def setup_secrets(self):
-        if not os.path.exists('secrets'):
-            pathlib.Path('secrets').mkdir(parents=True)
-
-        # Write things to temp files
-        with open('secrets/test-secret.yaml', 'w') as f:
-            for line in process_returns.SECRET_BACKUP_FILE:
-                f.write(f'{line}\n')
-
-        with open('secrets/test-cm.yaml', 'w') as f:
-            for line in process_returns.CM_BACKUP_FILE:
-                f.write(f'{line}\n')
-
     # Test main()
     @mock.patch('accord.models.pathlib')
     @mock.patch('sh.Command')
@@ -110,16 +136,68 @@ class TestProcess(TestCase):
                             'accord.process.backup_secrets_config_maps'
                         ):
                             with mock.patch(
-                                'accord.process.sanitize_secrets_config_maps'
+                                'accord.models.Accord.create_tar_archive'
                             ):
-                                with mock.patch(
-                                    'accord.models.Accord.create_tar_archive'
-                                ):
-                                    process.main()
+                                process.main()
 
         if not os.path.isfile('restore'):
             assert False, 'restore file was not added'
 
+    @mock.patch('sh.Command')
+    @mock.patch('accord.models.pathlib')
+    def test_main_backup_metrics(self, Command, mock_pathlib):
+        os.makedirs('testing_storage', exist_ok=True)
+        with mock.patch(
+            'accord.process.argparse.ArgumentParser.parse_args'
+        ) as args:
+            args.return_value = self.setup_args_backup_default(
+                repos_only=True,
+                directory='',
+                metrics_textfile='testing_storage/accord.prom',
+                report='testing_storage/report.json'
+            )
+            with mock.patch(
+                'accord.process.backup_repository_db',
+                side_effect=exceptions.NoPostgresBackup('missing')
+            ):
+                with self.assertRaises(exceptions.NoPostgresBackup):
+                    process.main()
+
+        with open('testing_storage/report.json') as f:
+            report = json.load(f)
+
+        self.assertEqual(report['status'], 'failed')
+        self.assertEqual(
+            [(s['name'], s['status']) for s in report['stages']],
+            [('repository-db', 'failed')]
+        )
+        with open('testing_storage/accord.prom') as f:
+            self.assertIn('accord_run_success{action="backup"} 0', f.read())
+
+    @mock.patch('sh.Command')
+    @mock.patch('accord.models.pathlib')
+    def test_main_backup_trace(self, Command, mock_pathlib):
+        os.makedirs('testing_storage', exist_ok=True)
+        with mock.patch(
+            'accord.process.argparse.ArgumentParser.parse_args'
+        ) as args:
+            args.return_value = self.setup_args_backup_default(
+                repos_only=True,
+                directory='',
+                trace='testing_storage/trace.json'
+            )
+            with mock.patch('accord.process.backup_repository_db'):
+                process.main()
+
+        self.assertIsNone(trace.tracer)
+        with open('testing_storage/trace.json') as f:
+            events = json.load(f)['traceEvents']
+
+        self.assertIn(
+            ('repository-db', 'stage'),
+            [(e['name'], e.get('cat')) for e in events]
+        )
+
     @mock.patch('sh.Command')
     @mock.patch('accord.models.pathlib')
     def test_main_backup_repos_only(self, Command, mock_pathlib):
@@ -158,6 +236,46 @@ class TestProcess(TestCase):
         if not os.path.isfile('restore'):
             assert False, 'restore file was not added'
 
+    @mock.patch('sh.Command')
+    def test_backup_stages(self, Command):
+        with mock.patch('accord.models.Accord.setup_backup_directory'):
+            with mock.patch('accord.models.Accord.remove_signal_restore_file'):
+                with mock.patch('accord.models.Accord.test_sync_to_backup'):
+                    test_class = models.Accord(
+                        self.setup_args_backup_default(
+                            archive=True,
+                            sync=True,
+                            sync_user='test',
+                            sync_node='1.2.3.4'
+                        )
+                    )
+
+        stages = {
+            stage.name: stage.depends
+            for stage in process.backup_stages(test_class)
+        }
+        self.assertEqual(stages['postgres'], [])
+        self.assertEqual(stages['storage'], [])
+        self.assertEqual(
+            stages['checksums'],
+            ['postgres', 'gravity', 'storage', 'secrets']
+        )
+        self.assertEqual(stages['signal'], ['checksums'])
+        self.assertEqual(stages['archive'], ['signal'])
+        self.assertEqual(stages['sync-files'], ['archive'])
+
+    @mock.patch('sh.Command')
+    def test_main_verify(self, Command):
+        with mock.patch(
+            'accord.process.argparse.ArgumentParser.parse_args'
+        ) as args:
+            args.return_value = self.setup_args_restore_default(override=True)
+            args.return_value.action = 'verify'
+            with mock.patch('accord.models.Accord.verify_backup') as verify:
+                process.main()
+
+        verify.assert_called_once_with(required=True)
+
     @mock.patch('sh.Command')
     def test_main_restore_no_config(self, Command):
         self.setup_temp_file('restore')
@@ -298,8 +416,34 @@ class TestProcess(TestCase):
         if os.path.isfile('restore'):
             assert False, 'restore file was not cleaned up'
 
+    def test_handle_arguments_sync(self):
+        with mock.patch(
+            'sys.argv',
+            [
+                'accord', '-a', 'backup', '--sync', '--sync-node', 'node',
+                '--sync-jobs', '4'
+            ]
+        ):
+            arguments = process.handle_arguments()
+
+        self.assertTrue(arguments.sync)
+        self.assertEqual(arguments.sync_jobs, 4)
+        self.assertFalse(arguments.stream_sync)
+
+    def test_handle_arguments_zstd_missing(self):
+        with mock.patch(
+            'sys.argv',
+            ['accord', '-a', 'backup', '--compression', 'zstd']
+        ):
+            with mock.patch('accord.compression.zstandard', None):
+                with mock.patch('sys.stderr'):
+                    with self.assertRaises(SystemExit):
+                        process.handle_arguments()
+
     @mock.patch('accord.process.argparse')
     def test_main_restore_exception(self, mock_args):
+        parser = mock_args.ArgumentParser.return_value
+        parser.parse_args.return_value.trace = None
         raise_exception = mock.Mock()
         raise_exception.side_effect = exceptions.RestoreSignal
         with mock.patch('accord.process.Accord', side_effect=raise_exception):
@@ -320,13 +464,71 @@ class TestProcess(TestCase):
                     )
 
         test_class.postgres_system_backup_path = 'test_backup.sql'
-        with mock.patch('accord.process.os.remove'):
-            with mock.patch('accord.models.Accord.run_command_on_container'):
-                process.backup_postgres_database(test_class)
+        with mock.patch('accord.models.Accord.get_postgres_docker_container'):
+            with mock.patch('accord.process.os.remove'):
+                with mock.patch(
+                    'accord.models.Accord.run_command_on_container'
+                ):
+                    process.backup_postgres_database(test_class)
 
         if not os.path.isfile('test_backup.sql'):
             assert False, 'Did not clean up original file'
 
+    @mock.patch('sh.Command')
+    def test_parallel_backup_removes_other_modes(self, Command):
+        with mock.patch('accord.models.Accord.setup_backup_directory'):
+            with mock.patch('accord.models.Accord.remove_signal_restore_file'):
+                test_class = models.Accord(
+                    self.setup_args_backup_default(postgres_mode='parallel')
+                )
+
+        os.makedirs('testing_storage/backup', exist_ok=True)
+        for name in [
+            'full_postgres_backup.sql',
+            'full_postgres_backup.sql.gz',
+            'full_postgres_backup.sql.zst'
+        ]:
+            self.setup_temp_file(f'testing_storage/backup/{name}')
+
+        test_class.backup_directory = 'testing_storage/backup'
+        test_class.postgres_system_parallel_backup_path = (
+            'testing_storage/pgdata/postgres_backup'
+        )
+        with mock.patch('accord.models.Accord.get_postgres_docker_container'):
+            with mock.patch(
+                'accord.models.Accord.run_command_on_container',
+                return_value=b''
+            ):
+                with mock.patch(
+                    'accord.models.Accord.stream_command_on_container',
+                    return_value=0
+                ):
+                    process.parallel_backup_postgres_database(test_class)
+
+        self.assertEqual(
+            os.listdir('testing_storage/backup'),
+            ['postgres_backup']
+        )
+
+    @mock.patch('sh.Command')
+    @mock.patch('sh.mv', create=True)
+    def test_backup_postgres_database_removes_parallel(self, Command, mv):
+        with mock.patch('accord.models.Accord.setup_backup_directory'):
+            with mock.patch('accord.models.Accord.remove_signal_restore_file'):
+                test_class = models.Accord(self.setup_args_backup_default())
+
+        os.makedirs('testing_storage/backup/postgres_backup')
+        self.setup_temp_file('testing_storage/pgdata.sql')
+        test_class.backup_directory = 'testing_storage/backup'
+        test_class.postgres_system_backup_path = 'testing_storage/pgdata.sql'
+        with mock.patch('accord.models.Accord.get_postgres_docker_container'):
+            with mock.patch('accord.models.Accord.run_command_on_container'):
+                with self.assertRaises(exceptions.NoPostgresBackup):
+                    process.backup_postgres_database(test_class)
+
+        if os.path.exists('testing_storage/backup/postgres_backup'):
+            assert False, 'Did not remove the parallel backup'
+
     @mock.patch('sh.Command')
     @mock.patch('sh.mv', create=True)
     def test_backup_postgres_database_exception(self, Command, mv):
@@ -340,19 +542,200 @@ class TestProcess(TestCase):
                     )
 
         test_class.postgres_system_backup_path = 'test_backup.sql'
-        with mock.patch('accord.models.Accord.run_command_on_container'):
-            try:
-                process.backup_postgres_database(test_class)
-                assert False, 'Exception should have been thrown'
-            except exceptions.NoPostgresBackup:
-                pass
-            except Exception:
-                assert False, 'Exception thrown that was not expected'
+        with mock.patch('accord.models.Accord.get_postgres_docker_container'):
+            with mock.patch('accord.models.Accord.run_command_on_container'):
+                try:
+                    process.backup_postgres_database(test_class)
+                    assert False, 'Exception should have been thrown'
+                except exceptions.NoPostgresBackup:
+                    pass
+                except Exception:
+                    assert False, 'Exception thrown that was not expected'
 
         if os.path.isfile('test_backup.sql'):
             assert False, 'Did not clean up original file'
 
-    # Postgres - Restore
+    @mock.patch('sh.Command')
+    def test_stream_postgres_database(self, Command):
+        with mock.patch('accord.models.Accord.setup_backup_directory'):
+            with mock.patch('accord.models.Accord.remove_signal_restore_file'):
+                test_class = models.Accord(
+                    self.setup_args_backup_default(postgres_mode='stream')
+                )
+
+        def stream(container, command, out):
+            out.write(b'select 1;')
+            return 0
+
+        os.makedirs('testing_storage', exist_ok=True)
+        test_class.backup_directory = 'testing_storage'
+        with mock.patch('accord.models.Accord.get_postgres_docker_container'):
+            with mock.patch(
+                'accord.models.Accord.stream_command_on_container',
+                side_effect=stream
+            ):
+                process.stream_postgres_database(test_class)
+
+        with gzip.open('testing_storage/full_postgres_backup.sql.gz') as f:
+            self.assertEqual(f.read(), b'select 1;')
+
+    @mock.patch('sh.Command')
+    def test_stream_postgres_database_failure(self, Command):
+        with mock.patch('accord.models.Accord.setup_backup_directory'):
+            with mock.patch('accord.models.Accord.remove_signal_restore_file'):
+                test_class = models.Accord(
+                    self.setup_args_backup_default(postgres_mode='stream')
+                )
+
+        os.makedirs('testing_storage', exist_ok=True)
+        test_class.backup_directory = 'testing_storage'
+        with mock.patch('accord.models.Accord.get_postgres_docker_container'):
+            with mock.patch(
+                'accord.models.Accord.stream_command_on_container',
+                return_value=1
+            ):
+                with self.assertRaises(exceptions.NoPostgresBackup):
+                    process.stream_postgres_database(test_class)
+
+        if os.path.isfile('testing_storage/full_postgres_backup.sql.gz'):
+            assert False, 'Partial dump was not cleaned up'
+
+    @mock.patch('sh.Command')
+    def test_stream_postgres_database_exception(self, Command):
+        with mock.patch('accord.models.Accord.setup_backup_directory'):
+            with mock.patch('accord.models.Accord.remove_signal_restore_file'):
+                test_class = models.Accord(
+                    self.setup_args_backup_default(postgres_mode='stream')
+                )
+
+        os.makedirs('testing_storage', exist_ok=True)
+        self.setup_temp_file('testing_storage/full_postgres_backup.sql')
+        test_class.backup_directory = 'testing_storage'
+        with mock.patch('accord.models.Accord.get_postgres_docker_container'):
+            with mock.patch(
+                'accord.models.Accord.stream_command_on_container',
+                side_effect=OSError('broken pipe')
+            ):
+                with self.assertRaises(OSError):
+                    process.stream_postgres_database(test_class)
+
+        # The stale plain dump would be restored before the streamed one
+        self.assertEqual(os.listdir('testing_storage'), [])
+
+    @mock.patch('sh.Command')
+    def test_parallel_backup_postgres_database(self, Command):
+        with mock.patch('accord.models.Accord.setup_backup_directory'):
+            with mock.patch('accord.models.Accord.remove_signal_restore_file'):
+                test_class = models.Accord(
+                    self.setup_args_backup_default(postgres_mode='parallel')
+                )
+
+        os.makedirs('testing_storage/pgdata', exist_ok=True)
+        test_class.backup_directory = 'testing_storage/backup'
+        test_class.postgres_system_parallel_backup_path = (
+            'testing_storage/pgdata/postgres_backup'
+        )
+        commands = []
+
+        def run_command(container, command, return_value=False):
+            commands.append(command)
+            if 'select datname' in command:
+                return b'anaconda_deploy\nanaconda_workspace\n\n'
+
+            if 'pg_dump ' in command:
+                database = command.split(' ')[-1].strip("'")
+                dump_path = (
+                    f'testing_storage/pgdata/postgres_backup/{database}'
+                )
+                os.makedirs(dump_path)
+                self.setup_temp_file(f'{dump_path}/toc.dat')
+
+        def stream(container, command, out):
+            out.write(b'create role test;')
+            return 0
+
+        with mock.patch('accord.models.Accord.get_postgres_docker_container'):
+            with mock.patch(
+                'accord.models.Accord.run_command_on_container',
+                side_effect=run_command
+            ):
+                with mock.patch(
+                    'accord.models.Accord.stream_command_on_container',
+                    side_effect=stream
+                ):
+                    process.parallel_backup_postgres_database(test_class)
+
+        self.assertEqual(
+            sorted(os.listdir('testing_storage/backup/postgres_backup')),
+            ['anaconda_deploy', 'anaconda_workspace', 'globals.sql']
+        )
+        self.assertIn(
+            "pg_dump -U postgres -Fd -j 2 -f /var/lib/postgresql/data/"
+            "postgres_backup/anaconda_deploy anaconda_deploy",
+            ' '.join(commands)
+        )
+        if os.path.exists('testing_storage/pgdata/postgres_backup'):
+            assert False, 'Did not clean up the dumps in the data volume'
+
+    @mock.patch('sh.Command')
+    def test_parallel_backup_postgres_database_missing(self, Command):
+        with mock.patch('accord.models.Accord.setup_backup_directory'):
+            with mock.patch('accord.models.Accord.remove_signal_restore_file'):
+                test_class = models.Accord(
+                    self.setup_args_backup_default(postgres_mode='parallel')
+                )
+
+        test_class.backup_directory = 'testing_storage/backup'
+        test_class.postgres_system_parallel_backup_path = (
+            'testing_storage/pgdata/postgres_backup'
+        )
+        with mock.patch('accord.models.Accord.get_postgres_docker_container'):
+            with mock.patch(
+                'accord.models.Accord.run_command_on_container',
+                return_value=b'anaconda_deploy\n'
+            ):
+                with mock.patch(
+                    'accord.models.Accord.stream_command_on_container',
+                    return_value=0
+                ):
+                    with self.assertRaises(exceptions.NoPostgresBackup):
+                        process.parallel_backup_postgres_database(test_class)
+
+    def test_postgres_parallelism(self):
+        test_class = mock.Mock()
+        test_class.postgres_jobs = 8
+        self.assertEqual(
+            process.postgres_parallelism(test_class, ['a', 'b', 'c']),
+            (3, 2)
+        )
+        self.assertEqual(process.postgres_parallelism(test_class, []), (1, 8))
+
+    @mock.patch('sh.Command')
+    def test_restore_database_stream(self, Command):
+        os.makedirs('testing_storage', exist_ok=True)
+        dump_path = 'testing_storage/full_postgres_backup.sql.gz'
+        with gzip.open(dump_path, 'wb') as f:
+            f.write(b'select 1;')
+
+        test_class = models.Accord(
+            self.setup_args_restore_default(override=True)
+        )
+        test_class.backup_directory = 'testing_storage'
+        restored = []
+
+        def stream(container, command, source):
+            restored.append(source.read())
+            return 0
+
+        with mock.patch('accord.models.Accord.get_postgres_docker_container'):
+            with mock.patch(
+                'accord.models.Accord.stream_into_container',
+                side_effect=stream
+            ):
+                process.restore_postgres_database(test_class)
+
+        self.assertEqual(restored, [b'select 1;'])
+
     @mock.patch('sh.Command')
     @mock.patch('sh.mv', create=True)
     @mock.patch('sh.chown', create=True)
@@ -363,13 +746,105 @@ class TestProcess(TestCase):
         )
 
         test_class.postgres_system_repo_backup_path = 'test_backup.sql'
-        with mock.patch('accord.process.os.remove'):
-            with mock.patch('accord.models.Accord.run_command_on_container'):
-                process.restore_postgres_database(test_class)
+        with mock.patch('accord.models.Accord.get_postgres_docker_container'):
+            with mock.patch('accord.process.os.remove'):
+                with mock.patch(
+                    'accord.models.Accord.run_command_on_container'
+                ):
+                    process.restore_postgres_database(test_class)
 
         if not os.path.isfile('test_backup.sql'):
             assert False, 'Did not cleanup the original file'
 
+    @mock.patch('sh.chown', create=True)
+    @mock.patch('sh.Command')
+    def test_restore_database_parallel(self, Command, chown):
+        os.makedirs('testing_storage/backup/postgres_backup/anaconda_deploy')
+        os.makedirs('testing_storage/pgdata')
+        with open('testing_storage/backup/postgres_backup/globals.sql', 'w'):
+            pass
+
+        test_class = models.Accord(
+            self.setup_args_restore_default(override=True)
+        )
+        test_class.backup_directory = 'testing_storage/backup'
+        test_class.postgres_system_parallel_backup_path = (
+            'testing_storage/pgdata/postgres_backup'
+        )
+        with mock.patch('accord.models.Accord.get_postgres_docker_container'):
+            with mock.patch(
+                'accord.models.Accord.run_command_on_container',
+                return_value=0
+            ) as run_command:
+                with mock.patch(
+                    'accord.models.Accord.stream_into_container',
+                    return_value=0
+                ) as stream:
+                    process.restore_postgres_database(test_class)
+
+        stream.assert_called_once()
+        self.assertIn(
+            'pg_restore -U postgres -j 4 --clean --if-exists --create '
+            '-d template1 /var/lib/postgresql/data/postgres_backup/'
+            'anaconda_deploy',
+            run_command.call_args[0][1]
+        )
+        if not os.path.isdir(
+            'testing_storage/pgdata/postgres_backup/anaconda_deploy'
+        ):
+            assert False, 'Did not move the dumps to the data volume'
+
+    @mock.patch('sh.chown', create=True)
+    @mock.patch('sh.Command')
+    def test_restore_database_parallel_failed(self, Command, chown):
+        os.makedirs('testing_storage/backup/postgres_backup/anaconda_deploy')
+        os.makedirs('testing_storage/pgdata')
+        with open('testing_storage/backup/postgres_backup/globals.sql', 'w'):
+            pass
+
+        test_class = models.Accord(
+            self.setup_args_restore_default(override=True)
+        )
+        test_class.backup_directory = 'testing_storage/backup'
+        test_class.postgres_system_parallel_backup_path = (
+            'testing_storage/pgdata/postgres_backup'
+        )
+        with mock.patch('accord.models.Accord.get_postgres_docker_container'):
+            with mock.patch(
+                'accord.models.Accord.run_command_on_container',
+                return_value=1
+            ):
+                with mock.patch(
+                    'accord.models.Accord.stream_into_container',
+                    return_value=0
+                ):
+                    with self.assertRaises(exceptions.NoPostgresBackup):
+                        process.restore_postgres_database(test_class)
+
+    @mock.patch('sh.chown', create=True)
+    @mock.patch('sh.Command')
+    def test_restore_database_parallel_globals_failed(self, Command, chown):
+        os.makedirs('testing_storage/backup/postgres_backup/anaconda_deploy')
+        with open('testing_storage/backup/postgres_backup/globals.sql', 'w'):
+            pass
+
+        test_class = models.Accord(
+            self.setup_args_restore_default(override=True)
+        )
+        test_class.backup_directory = 'testing_storage/backup'
+        with mock.patch('accord.models.Accord.get_postgres_docker_container'):
+            with mock.patch(
+                'accord.models.Accord.run_command_on_container'
+            ) as run_command:
+                with mock.patch(
+                    'accord.models.Accord.stream_into_container',
+                    return_value=1
+                ):
+                    with self.assertRaises(exceptions.NoPostgresBackup):
+                        process.restore_postgres_database(test_class)
+
+        run_command.assert_not_called()
+
     # Postgres - Repos
     @mock.patch('sh.Command')
     @mock.patch('sh.mv', create=True)
@@ -384,14 +859,15 @@ class TestProcess(TestCase):
                     )
 
         test_class.postgres_system_repo_backup_path = 'test_backup.sql'
-        with mock.patch('accord.models.Accord.run_command_on_container'):
-            try:
-                process.backup_repository_db(test_class)
-                assert False, 'Exception should have been thrown'
-            except exceptions.NoPostgresBackup:
-                pass
-            except Exception:
-                assert False, 'Exception thrown that was not expected'
+        with mock.patch('accord.models.Accord.get_postgres_docker_container'):
+            with mock.patch('accord.models.Accord.run_command_on_container'):
+                try:
+                    process.backup_repository_db(test_class)
+                    assert False, 'Exception should have been thrown'
+                except exceptions.NoPostgresBackup:
+                    pass
+                except Exception:
+                    assert False, 'Exception thrown that was not expected'
 
         if os.path.isfile('test_backup.sql'):
             assert False, 'Did not clean up original file'
@@ -409,50 +885,366 @@ class TestProcess(TestCase):
                     )
 
         test_class.postgres_system_repo_backup_path = 'test_backup.sql'
-        with mock.patch('accord.process.os.remove'):
-            with mock.patch('accord.models.Accord.run_command_on_container'):
-                process.backup_repository_db(test_class)
+        with mock.patch('accord.models.Accord.get_postgres_docker_container'):
+            with mock.patch('accord.process.os.remove'):
+                with mock.patch(
+                    'accord.models.Accord.run_command_on_container'
+                ):
+                    process.backup_repository_db(test_class)
 
         if not os.path.isfile('test_backup.sql'):
             assert False, 'Did not cleanup the original file'
 
-    # File - Backup
-    @mock.patch('sh.pushd', create=True)
-    @mock.patch('sh.tar', create=True)
-    @mock.patch('sh.mv', create=True)
-    @mock.patch('sh.cp', create=True)
     @mock.patch('sh.Command')
-    def test_file_backup(self, pushd, tar, mv, cp, Command):
-        test_class = None
-        self.setup_temp_file('test_backup.sql')
+    def test_parallel_backup_repository_db(self, Command):
         with mock.patch('accord.models.Accord.setup_backup_directory'):
             with mock.patch('accord.models.Accord.remove_signal_restore_file'):
-                with mock.patch('accord.models.Accord.test_sync_to_backup'):
-                    test_class = models.Accord(
-                        self.setup_args_backup_default()
+                test_class = models.Accord(
+                    self.setup_args_backup_default(
+                        repos_only=True,
+                        postgres_mode='parallel'
                     )
+                )
 
-        process.file_backup_restore(test_class, 'backup')
-
-    # File - Restore
-    @mock.patch('sh.pushd', create=True)
-    @mock.patch('sh.tar', create=True)
-    @mock.patch('sh.mv', create=True)
-    @mock.patch('sh.cp', create=True)
-    @mock.patch('sh.Command')
-    def test_file_restore(self, pushd, tar, mv, cp, Command):
-        self.setup_temp_file('test_backup.sql')
-        test_class = models.Accord(
-            self.setup_args_restore_default(override=True)
+        os.makedirs('testing_storage/backup', exist_ok=True)
+        test_class.backup_directory = 'testing_storage/backup'
+        test_class.postgres_system_repo_directory_path = (
+            'testing_storage/all_repositories'
         )
 
-        test_class.storage_backup_name = 'test_backup.sql'
-        process.file_backup_restore(test_class, 'restore')
+        def run_command(container, command):
+            os.makedirs('testing_storage/all_repositories')
+            self.setup_temp_file('testing_storage/all_repositories/toc.dat')
+
+        with mock.patch('accord.models.Accord.get_postgres_docker_container'):
+            with mock.patch(
+                'accord.models.Accord.run_command_on_container',
+                side_effect=run_command
+            ) as run:
+                process.parallel_backup_repository_db(test_class)
+
+        self.assertIn('pg_dump -U postgres -Fd -j 4', run.call_args[0][1])
+        if not os.path.isfile(
+            'testing_storage/backup/all_repositories/toc.dat'
+        ):
+            assert False, 'Did not move the backup to the backup directory'
+
+    @mock.patch('sh.Command')
+    def test_parallel_backup_repository_db_exception(self, Command):
+        with mock.patch('accord.models.Accord.setup_backup_directory'):
+            with mock.patch('accord.models.Accord.remove_signal_restore_file'):
+                test_class = models.Accord(
+                    self.setup_args_backup_default(
+                        repos_only=True,
+                        postgres_mode='parallel'
+                    )
+                )
+
+        test_class.backup_directory = 'testing_storage/backup'
+        test_class.postgres_system_repo_directory_path = (
+            'testing_storage/all_repositories'
+        )
+        with mock.patch('accord.models.Accord.get_postgres_docker_container'):
+            with mock.patch('accord.models.Accord.run_command_on_container'):
+                with self.assertRaises(exceptions.NoPostgresBackup):
+                    process.parallel_backup_repository_db(test_class)
+
+    # File - Backup
+    @mock.patch('sh.Command')
+    def test_file_backup(self, Command):
+        with mock.patch('accord.models.Accord.setup_backup_directory'):
+            with mock.patch('accord.models.Accord.remove_signal_restore_file'):
+                test_class = models.Accord(self.setup_args_backup_default())
+
+        test_class.backup_directory = '.'
+        with mock.patch('accord.process.stream_storage_backup') as stream:
+            process.file_backup_restore(test_class, 'backup')
+
+        self.assertEqual(
+            stream.call_args[0][1].fileobj.name,
+            './storage_backup.tar.gz'
+        )
+        if not os.path.isfile('storage_backup.tar.gz'):
+            assert False, 'Did not write the backup to the backup directory'
+
+    @mock.patch('sh.Command')
+    def test_file_backup_removes_other_archives(self, Command):
+        with mock.patch('accord.models.Accord.setup_backup_directory'):
+            with mock.patch('accord.models.Accord.remove_signal_restore_file'):
+                test_class = models.Accord(
+                    self.setup_args_backup_default(compression='none')
+                )
+
+        self.setup_temp_file('storage_backup.tar.gz')
+        test_class.backup_directory = '.'
+        with mock.patch('accord.process.stream_storage_backup'):
+            process.file_backup_restore(test_class, 'backup')
+
+        if os.path.isfile('storage_backup.tar.gz'):
+            assert False, 'Stale archive was left in the backup directory'
+        if not os.path.isfile('storage_backup.tar'):
+            assert False, 'Did not write the backup to the backup directory'
+
+    @mock.patch('sh.Command')
+    def test_file_backup_failure_cleanup(self, Command):
+        with mock.patch('accord.models.Accord.setup_backup_directory'):
+            with mock.patch('accord.models.Accord.remove_signal_restore_file'):
+                test_class = models.Accord(self.setup_args_backup_default())
+
+        test_class.backup_directory = '.'
+        with mock.patch(
+            'accord.process.stream_storage_backup',
+            side_effect=subprocess.CalledProcessError(2, 'tar')
+        ):
+            with self.assertRaises(subprocess.CalledProcessError):
+                process.file_backup_restore(test_class, 'backup')
+
+        if os.path.isfile('storage_backup.tar.gz'):
+            assert False, 'Partial backup was not cleaned up'
+
+    @mock.patch('sh.Command')
+    def test_file_backup_stream_sync(self, Command):
+        with mock.patch('accord.models.Accord.setup_backup_directory'):
+            with mock.patch('accord.models.Accord.remove_signal_restore_file'):
+                with mock.patch('accord.models.Accord.test_sync_to_backup'):
+                    test_class = models.Accord(
+                        self.setup_args_backup_default(
+                            sync=True,
+                            sync_user='test',
+                            sync_node='1.2.3.4',
+                            stream_sync=True
+                        )
+                    )
+
+        with mock.patch('accord.models.Accord.open_su_pipe') as su_pipe:
+            su_pipe.return_value.wait.return_value = 0
+            with mock.patch('accord.process.stream_storage_backup') as stream:
+                process.file_backup_restore(test_class, 'backup')
+
+        self.assertEqual(
+            stream.call_args[0][1].fileobj,
+            su_pipe.return_value.stdin
+        )
+        self.assertIn(
+            'storage_backup.tar.gz',
+            test_class.checksums.recorded()
+        )
+        self.assertIn(
+            "'sudo rm -f /opt/anaconda_backup/storage_backup.tar.zst "
+            "/opt/anaconda_backup/storage_backup.tar && "
+            "sudo tee /opt/anaconda_backup/storage_backup.tar.gz "
+            "> /dev/null'",
+            su_pipe.call_args[0][1]
+        )
 
-        if os.path.isfile('test_backup.sql'):
-            assert False, 'Did not cleanup the original file'
-
-    # Secrets
+    @mock.patch('sh.Command')
+    def test_file_backup_stream_sync_failure(self, Command):
+        with mock.patch('accord.models.Accord.setup_backup_directory'):
+            with mock.patch('accord.models.Accord.remove_signal_restore_file'):
+                with mock.patch('accord.models.Accord.test_sync_to_backup'):
+                    test_class = models.Accord(
+                        self.setup_args_backup_default(
+                            sync=True,
+                            sync_user='test',
+                            sync_node='1.2.3.4',
+                            stream_sync=True
+                        )
+                    )
+
+        with mock.patch('accord.models.Accord.open_su_pipe') as su_pipe:
+            su_pipe.return_value.wait.return_value = 255
+            with mock.patch('accord.process.stream_storage_backup'):
+                with self.assertRaises(exceptions.UnableToSync):
+                    process.file_backup_restore(test_class, 'backup')
+
+    @mock.patch('sh.Command')
+    def test_stream_storage_backup(self, Command):
+        with mock.patch('accord.models.Accord.setup_backup_directory'):
+            with mock.patch('accord.models.Accord.remove_signal_restore_file'):
+                test_class = models.Accord(
+                    self.setup_args_backup_default(
+                        compression='pigz-style-parallel'
+                    )
+                )
+
+        os.makedirs('testing_storage/storage/git', exist_ok=True)
+        os.makedirs('testing_storage/storage/pgdata', exist_ok=True)
+        self.setup_temp_file('testing_storage/storage/git/test.txt')
+        self.setup_temp_file('testing_storage/storage/pgdata/test.sql')
+        with open('storage_backup.tar.gz', 'wb') as f:
+            process.stream_storage_backup(test_class, f, 'testing_storage')
+
+        with tarfile.open('storage_backup.tar.gz') as tar:
+            names = tar.getnames()
+
+        self.assertIn('storage/git/test.txt', names)
+        self.assertNotIn('storage/pgdata/test.sql', names)
+
+    # File - Restore
+    @mock.patch('sh.Command')
+    def test_incremental_storage_backup(self, Command):
+        with mock.patch('accord.models.Accord.setup_backup_directory'):
+            with mock.patch('accord.models.Accord.remove_signal_restore_file'):
+                test_class = models.Accord(
+                    self.setup_args_backup_default(incremental=True)
+                )
+
+        os.makedirs('testing_storage/backup', exist_ok=True)
+        os.makedirs('testing_storage/storage/git', exist_ok=True)
+        with open('testing_storage/storage/git/first.txt', 'w') as f:
+            f.write('first')
+
+        with open('testing_storage/storage/git/second.txt', 'w') as f:
+            f.write('second')
+
+        test_class.backup_directory = 'testing_storage/backup'
+        process.incremental_storage_backup(test_class, 'testing_storage')
+
+        os.remove('testing_storage/storage/git/first.txt')
+        with open('testing_storage/storage/git/third.txt', 'w') as f:
+            f.write('third')
+
+        with mock.patch('accord.process.time.strftime') as strftime:
+            strftime.return_value = '20190101-000000'
+            process.incremental_storage_backup(test_class, 'testing_storage')
+
+        chain = manifest.load_chain('testing_storage/backup')
+        self.assertEqual(
+            [link['type'] for link in chain],
+            ['full', 'incremental']
+        )
+        self.assertEqual(
+            chain[1]['archive'],
+            'storage_incremental_20190101-000000.tar.gz'
+        )
+        with tarfile.open(
+            f'testing_storage/backup/{chain[1]["archive"]}'
+        ) as tar:
+            self.assertEqual(tar.getnames(), ['storage/git/third.txt'])
+
+        with open(f'testing_storage/backup/{chain[1]["deleted"]}') as f:
+            self.assertEqual(json.load(f), ['storage/git/first.txt'])
+
+    @mock.patch(
+        'accord.process.extract.extract_archive',
+        return_value=(1, 10)
+    )
+    @mock.patch('sh.Command')
+    def test_restore_storage_incrementals(self, Command, extract_archive):
+        test_class = models.Accord(
+            self.setup_args_restore_default(override=True)
+        )
+        os.makedirs('testing_storage/backup', exist_ok=True)
+        os.makedirs('testing_storage/storage/git', exist_ok=True)
+        self.setup_temp_file('testing_storage/storage/git/first.txt')
+        manifest.save_chain(
+            'testing_storage/backup',
+            [
+                {'type': 'full', 'archive': 'storage_backup.tar.gz'},
+                {
+                    'type': 'incremental',
+                    'archive': 'storage_incremental_1.tar.gz',
+                    'deleted': 'storage_incremental_1.deleted.json'
+                }
+            ]
+        )
+        with open(
+            'testing_storage/backup/storage_incremental_1.deleted.json', 'w'
+        ) as f:
+            json.dump(['storage/git/first.txt'], f)
+
+        test_class.backup_directory = 'testing_storage/backup'
+        process.restore_storage_incrementals(test_class, 'testing_storage')
+
+        extract_archive.assert_called_once_with(
+            'testing_storage/backup/storage_incremental_1.tar.gz',
+            'testing_storage',
+            sync=False
+        )
+        if os.path.isfile('testing_storage/storage/git/first.txt'):
+            assert False, 'Deleted file was not removed'
+
+    @mock.patch('sh.Command')
+    def test_file_backup_chunk_store(self, Command):
+        with mock.patch('accord.models.Accord.setup_backup_directory'):
+            with mock.patch('accord.models.Accord.remove_signal_restore_file'):
+                test_class = models.Accord(
+                    self.setup_args_backup_default(chunk_store=True)
+                )
+
+        os.makedirs('testing_storage/backup', exist_ok=True)
+        os.makedirs('testing_storage/storage/git', exist_ok=True)
+        with open('testing_storage/storage/git/test.txt', 'w') as f:
+            f.write('testing')
+
+        test_class.backup_directory = 'testing_storage/backup'
+        process.chunk_storage_backup(test_class, 'testing_storage')
+        shutil.rmtree('testing_storage/storage')
+
+        test_class.action = 'restore'
+        process.chunk_storage_restore(test_class, 'testing_storage')
+        with open('testing_storage/storage/git/test.txt', 'r') as f:
+            self.assertEqual(f.read(), 'testing')
+
+    @mock.patch('sh.Command')
+    def test_file_restore_chunk_store_missing(self, Command):
+        test_class = models.Accord(
+            self.setup_args_restore_default(override=True, chunk_store=True)
+        )
+        test_class.backup_directory = 'testing_storage'
+        with self.assertRaises(exceptions.NoStorageSnapshot):
+            process.file_backup_restore(test_class, 'restore')
+
+    @mock.patch('accord.process.os.sync')
+    @mock.patch(
+        'accord.process.extract.extract_archive',
+        return_value=(1, 10)
+    )
+    @mock.patch('sh.Command')
+    def test_file_restore(self, Command, extract_archive, sync):
+        test_class = models.Accord(
+            self.setup_args_restore_default(override=True)
+        )
+
+        test_class.backup_directory = 'testing_storage'
+        with mock.patch(
+            'accord.process.restore_storage_incrementals'
+        ) as incrementals:
+            process.file_backup_restore(test_class, 'restore')
+
+        extract_archive.assert_called_once_with(
+            'testing_storage/storage_backup.tar.gz',
+            '/opt/anaconda',
+            sync=False
+        )
+        incrementals.assert_called_once_with(test_class)
+        sync.assert_called_once_with()
+
+    @mock.patch('accord.process.os.sync')
+    @mock.patch(
+        'accord.process.extract.extract_archive',
+        return_value=(1, 10)
+    )
+    @mock.patch('sh.Command')
+    def test_file_restore_after_extract(self, Command, extract_archive, sync):
+        test_class = models.Accord(
+            self.setup_args_restore_default(override=True)
+        )
+
+        # The archive only shows up once the restore file is extracted
+        os.makedirs('testing_storage', exist_ok=True)
+        open('testing_storage/storage_backup.tar', 'a').close()
+        test_class.backup_directory = 'testing_storage'
+        with mock.patch('accord.process.restore_storage_incrementals'):
+            process.file_backup_restore(test_class, 'restore')
+
+        extract_archive.assert_called_once_with(
+            'testing_storage/storage_backup.tar',
+            '/opt/anaconda',
+            sync=False
+        )
+
+    # Secrets
     @mock.patch('sh.Command')
     def test_backup_secrets_cm(self, Command):
         test_class = None
@@ -466,9 +1258,15 @@ class TestProcess(TestCase):
         test_class.backup_directory = '.'
         test_class.secret_files = {'default': ['test-secret']}
         test_class.config_maps = {'default': ['test-cm']}
+        Command().side_effect = [
+            model_returns.kube_list(['test-secret', 'other'], kind='Secret'),
+            model_returns.kube_list(['test-cm'], kind='ConfigMap')
+        ]
         with mock.patch('accord.models.Accord.get_all_secrets'):
             process.backup_secrets_config_maps(test_class)
 
+        self.assertEqual(Command().call_count, 2)
+
         if not os.path.exists('secrets'):
             assert False, 'Did not automatically create the directory'
 
@@ -478,6 +1276,14 @@ class TestProcess(TestCase):
         if not os.path.exists('secrets/test-cm.yaml'):
             assert False, 'Did not create the secret'
 
+        with open('secrets/test-cm.yaml') as f:
+            data = yaml.safe_load(f)
+
+        self.assertEqual(data['kind'], 'ConfigMap')
+        self.assertEqual(data['metadata']['name'], 'test-cm')
+        if os.path.exists('secrets/other.yaml'):
+            assert False, 'Exported a secret that was not asked for'
+
     @mock.patch('sh.Command')
     def test_backup_secrets_cm_failure_secret(self, Command):
         test_class = None
@@ -492,11 +1298,10 @@ class TestProcess(TestCase):
         test_class.secret_files = {'default': ['test-secret']}
         test_class.config_maps = {'default': ['test-cm']}
 
-        Command().side_effect = sh.ErrorReturnCode_1(
-            'kubectl',
-            ''.encode('utf-8'),
-            ''.encode('utf-8')
-        )
+        Command().side_effect = [
+            model_returns.kube_list(['other'], kind='Secret'),
+            model_returns.kube_list(['test-cm'], kind='ConfigMap')
+        ]
         with mock.patch('accord.models.Accord.get_all_secrets'):
             try:
                 process.backup_secrets_config_maps(test_class)
@@ -508,8 +1313,8 @@ class TestProcess(TestCase):
         if not os.path.exists('secrets'):
             assert False, 'Did not automatically create the directory'
 
-        if not os.path.exists('secrets/test-secret.yaml'):
-            assert False, 'Did not create the secret'
+        if os.path.exists('secrets/test-secret.yaml'):
+            assert False, 'Created the secret when should not have'
 
         if os.path.exists('secrets/test-cm.yaml'):
             assert False, 'Created the secret when should not have'
@@ -525,14 +1330,13 @@ class TestProcess(TestCase):
                     )
 
         test_class.backup_directory = '.'
-        test_class.secret_files = {}
+        test_class.secret_files = {'default': ['test-secret']}
         test_class.config_maps = {'default': ['test-cm']}
 
-        Command().side_effect = sh.ErrorReturnCode_1(
-            'kubectl',
-            ''.encode('utf-8'),
-            ''.encode('utf-8')
-        )
+        Command().side_effect = [
+            model_returns.kube_list(['test-secret'], kind='Secret'),
+            model_returns.kube_list([], kind='ConfigMap')
+        ]
         with mock.patch('accord.models.Accord.get_all_secrets'):
             try:
                 process.backup_secrets_config_maps(test_class)
@@ -544,12 +1348,11 @@ class TestProcess(TestCase):
         if not os.path.exists('secrets'):
             assert False, 'Did not automatically create the directory'
 
-        if not os.path.exists('secrets/test-cm.yaml'):
-            assert False, 'Did not create the secret'
+        if os.path.exists('secrets/test-secret.yaml'):
+            assert False, 'Created the secret when should not have'
 
-    # Sanitize
     @mock.patch('sh.Command')
-    def test_sanitize_secret_cm(self, Command):
+    def test_backup_secrets_cm_sanitized(self, Command):
         test_class = None
         with mock.patch('accord.models.Accord.setup_backup_directory'):
             with mock.patch('accord.models.Accord.remove_signal_restore_file'):
@@ -558,26 +1361,32 @@ class TestProcess(TestCase):
                         self.setup_args_backup_default()
                     )
 
+        secret = process_returns.SECRET_OBJECT
+        cm = process_returns.CM_OBJECT
         test_class.backup_directory = '.'
-        test_class.secret_files = {'default': ['test-secret']}
-        test_class.config_maps = {'default': ['test-cm']}
-
-        self.setup_secrets()
-
+        test_class.secret_files = {'default': [secret['metadata']['name']]}
+        test_class.config_maps = {'default': [cm['metadata']['name']]}
+        Command().side_effect = [
+            json.dumps({'items': [secret]}),
+            json.dumps({'items': [cm]})
+        ]
         with mock.patch('accord.models.Accord.get_all_secrets'):
-            process.sanitize_secrets_config_maps(test_class)
+            process.backup_secrets_config_maps(test_class)
+
+        secret_path = f'secrets/{secret["metadata"]["name"]}.yaml'
+        cm_path = f'secrets/{cm["metadata"]["name"]}.yaml'
 
         if not os.path.exists('secrets'):
             assert False, 'Did not automatically create the directory'
 
-        if not os.path.exists('secrets/test-secret.yaml'):
+        if not os.path.exists(secret_path):
             assert False, 'Did not create the secret'
 
-        if not os.path.exists('secrets/test-cm.yaml'):
+        if not os.path.exists(cm_path):
             assert False, 'Did not create the secret'
 
         cm_diff = []
-        with open('secrets/test-cm.yaml', 'r') as results:
+        with open(cm_path, 'r') as results:
             for line in results:
                 if line not in process_returns.CM_EXPECTED:
                     cm_diff.append(line)
@@ -589,7 +1398,7 @@ class TestProcess(TestCase):
         )
 
         secret_diff = []
-        with open('secrets/test-secret.yaml', 'r') as results:
+        with open(secret_path, 'r') as results:
             for line in results:
                 if line not in process_returns.SECRECT_EXPECTED:
                     secret_diff.append(line)
@@ -615,9 +1424,36 @@ class TestProcess(TestCase):
                         )
                     )
 
-        with mock.patch('accord.process.Accord.run_su_command'):
+        with mock.patch('accord.process.subprocess.run') as run:
+            run.return_value.returncode = 0
             process.sync_files(test_class)
 
+        command = run.call_args[0][0]
+        self.assertIn('--rsync-path=sudo rsync', command)
+        self.assertIn('sudo -H -u test /bin/ssh -q', command)
+        self.assertEqual(
+            command[-1],
+            'test' + '@1.2.3.4:/opt/anaconda_backup'
+        )
+
+    @mock.patch('sh.Command')
+    def test_sync_files_exception(self, Command):
+        with mock.patch('accord.models.Accord.setup_backup_directory'):
+            with mock.patch('accord.models.Accord.remove_signal_restore_file'):
+                with mock.patch('accord.models.Accord.test_sync_to_backup'):
+                    test_class = models.Accord(
+                        self.setup_args_backup_default(
+                            sync_user='test',
+                            sync_node='1.2.3.4',
+                            sync=True
+                        )
+                    )
+
+        with mock.patch('accord.process.subprocess.run') as run:
+            run.return_value.returncode = 23
+            with self.assertRaises(exceptions.UnableToSync):
+                process.sync_files(test_class)
+
     # Sync - Repositories
     @mock.patch('sh.Command')
     @mock.patch('sh.chown', create=True)
@@ -642,6 +1478,50 @@ class TestProcess(TestCase):
         ):
             process.sync_repositories(test_class)
 
+    @mock.patch('sh.Command')
+    def test_sync_repositories_sharded(self, Command):
+        with mock.patch('accord.models.Accord.setup_backup_directory'):
+            with mock.patch('accord.models.Accord.remove_signal_restore_file'):
+                with mock.patch('accord.models.Accord.test_sync_to_backup'):
+                    test_class = models.Accord(
+                        self.setup_args_backup_default(
+                            sync_user='test',
+                            sync_node='1.2.3.4',
+                            sync=True,
+                            repos_only=True,
+                            sync_jobs=2
+                        )
+                    )
+
+        for channel in ['first', 'second']:
+            os.makedirs(f'testing_storage/{channel}')
+            self.setup_temp_file(f'testing_storage/{channel}/package')
+
+        test_class.repository = 'testing_storage'
+        lists = []
+
+        def run_su_command(user, command):
+            if '--files-from=' in command:
+                list_path = command.split('--files-from=')[1].split(' ')[0]
+                with open(list_path) as f:
+                    lists.append(f.read())
+
+            return 0
+
+        with mock.patch(
+            'accord.process.Accord.run_su_command',
+            side_effect=run_su_command
+        ) as run_su:
+            process.sync_repositories(test_class)
+
+        self.assertEqual(run_su.call_count, 2)
+        self.assertEqual(sorted(lists), ['first\n', 'second\n'])
+        for c in run_su.call_args_list:
+            self.assertIn(
+                "--rsync-path='sudo rsync' --chown=root:root",
+                c[0][1]
+            )
+
     # Scale pod
     @mock.patch('sh.Command')
     def test_scale_pod_invalid_count(self, Command):
@@ -657,65 +1537,45 @@ class TestProcess(TestCase):
             assert False, 'Invalid exception thrown'
 
     @mock.patch('sh.Command')
-    @mock.patch('sh.grep', create=True)
-    def test_scale_up_pod_success(self, Command, grep):
-        grep().side_effect = [
-            'kubectl',
-            sh.ErrorReturnCode_1(
-                'grep',
-                'out'.encode('utf-8'),
-                'error'.encode('utf-8')
-            ),
-            ''
-        ]
+    @mock.patch('accord.kube.wait_for_pods')
+    def test_scale_up_pod_success(self, wait_for_pods, Command):
         test_class = models.Accord(
             self.setup_args_restore_default(override=True)
         )
         process.scale_postgres_pod(test_class, 1)
 
+        self.assertEqual(
+            wait_for_pods.call_args[0][0],
+            process.kube.postgres_running
+        )
+
     @mock.patch('sh.Command')
-    @mock.patch('sh.grep', create=True)
-    def test_scale_down_pod_success(self, Command, grep):
-        Command().side_effect = [
-            '',
-            process_returns.RUNNING_PODS
-        ]
-        grep().side_effect = [
-            'NAME'.encode('utf-8'),
-            sh.ErrorReturnCode_1(
-                'grep',
-                'out'.encode('utf-8'),
-                'error'.encode('utf-8')
-            )
-        ]
+    @mock.patch('accord.kube.wait_for_pods')
+    def test_scale_down_pod_success(self, wait_for_pods, Command):
         test_class = models.Accord(
             self.setup_args_restore_default(override=True)
         )
         process.scale_postgres_pod(test_class, 0)
 
+        self.assertEqual(
+            wait_for_pods.call_args[0][0],
+            process.kube.postgres_stopped
+        )
+
     # Restart Pods
     @mock.patch('sh.Command')
-    @mock.patch('sh.grep', create=True)
-    def test_restart_pods(self, Command, grep):
-        Command().side_effect = [
-            '',
-            process_returns.RUNNING_PODS
-        ]
-        grep().side_effect = [
-            'kubectl',
-            'NAME'.encode('utf-8'),
-            sh.ErrorReturnCode_1(
-                'grep',
-                'out'.encode('utf-8'),
-                'error'.encode('utf-8')
-            )
-        ]
-        # grep().return_value = sh.ErrorReturnCode_1
+    @mock.patch('accord.kube.wait_for_pods')
+    def test_restart_pods(self, wait_for_pods, Command):
         test_class = models.Accord(
             self.setup_args_restore_default(override=True)
         )
         process.restart_pods(test_class)
 
+        self.assertEqual(
+            wait_for_pods.call_args[0][0],
+            process.kube.all_pods_running
+        )
+
     # Cleanup/Restore Files
     @mock.patch('sh.pushd', create=True)
     @mock.patch('sh.tar', create=True)
@@ -734,104 +1594,203 @@ class TestProcess(TestCase):
 
     # Cleanup - Sessions/Deployments
     @mock.patch('sh.Command')
-    @mock.patch('sh.grep', create=True)
-    @mock.patch('sh.awk', create=True)
-    def test_cleanup_sessions_none(self, Command, grep, awk):
-        awk().side_effect = [
-            sh.ErrorReturnCode_1(
-                'grep',
-                'out'.encode('utf-8'),
-                'error'.encode('utf-8')
-            )
-        ]
+    @mock.patch('accord.kube.wait_for_pods')
+    def test_cleanup_sessions_none(self, wait_for_pods, Command):
+        Command().return_value = model_returns.kube_list(
+            ['anaconda-enterprise-ap-auth']
+        )
+        test_class = models.Accord(
+            self.setup_args_restore_default(override=True)
+        )
+        process.cleanup_sessions_deployments(test_class)
+
+        self.assertEqual(Command().call_count, 1)
+        wait_for_pods.assert_not_called()
+
+    @mock.patch('sh.Command')
+    @mock.patch('accord.kube.wait_for_pods')
+    def test_cleanup_sessions_success(self, wait_for_pods, Command):
+        Command().return_value = model_returns.GET_DEPLOYMENTS
         test_class = models.Accord(
             self.setup_args_restore_default(override=True)
         )
         process.cleanup_sessions_deployments(test_class)
 
-    @mock.patch('sh.awk', create=True)
-    @mock.patch('sh.grep', create=True)
+        deletes = [
+            c[0] for c in Command().call_args_list if c[0][0] == 'delete'
+        ]
+        self.assertEqual(
+            deletes,
+            [
+                (
+                    'delete',
+                    'deployment',
+                    '--ignore-not-found',
+                    '--namespace',
+                    'default',
+                    'anaconda-app-0123456789abcdef',
+                    'anaconda-session-fedcba9876543210'
+                )
+            ]
+        )
+        self.assertEqual(
+            wait_for_pods.call_args[0][0],
+            process.kube.sessions_stopped
+        )
+
     @mock.patch('sh.Command')
-    def test_cleanup_sessions_success(self, Command, grep, awk):
-        mock_command = mock.Mock()
-        mock_command.return_value = ['deployment_to_grab']
-        mock_grep = mock.Mock()
-        mock_grep.return_value = mock_command.return_value
-        awk.return_value = mock_grep.return_value
+    @mock.patch('accord.kube.wait_for_pods')
+    def test_cleanup_sessions_batches(self, wait_for_pods, Command):
+        names = [f'anaconda-session-{i}' for i in range(450)]
+        Command().return_value = model_returns.kube_list(names)
         test_class = models.Accord(
             self.setup_args_restore_default(override=True)
         )
+        test_class.jobs = 2
         process.cleanup_sessions_deployments(test_class)
 
+        deleted = []
+        for c in Command().call_args_list:
+            if c[0][0] == 'delete':
+                deleted.extend(c[0][5:])
+
+        self.assertEqual(Command().call_count, 4)
+        self.assertEqual(sorted(deleted), sorted(names))
+        wait_for_pods.assert_called_once()
+
     # Cleanup - Database
     @mock.patch('sh.Command')
     def test_cleanup_postgres_db(self, Command):
-        mock_response = mock.Mock()
-        mock_response.side_effect = [
-            '',
-            process_returns.DEPLOYMENTS_POSTGRES,
-            ''
-        ]
+        session = psql.PsqlSession(
+            [sys.executable, '-c', process_returns.FAKE_PSQL]
+        )
+        os.makedirs('testing_storage')
         test_class = models.Accord(
             self.setup_args_restore_default(override=True)
         )
+        test_class.backup_directory = 'testing_storage'
         with mock.patch('accord.models.Accord.get_postgres_docker_container'):
             with mock.patch(
-                'accord.models.Accord.run_command_on_container',
-                side_effect=mock_response
+                'accord.models.Accord.open_psql_session',
+                return_value=session
             ):
                 process.cleanup_postgres_database(test_class)
 
         self.assertEqual(
             len(test_class.to_start),
-            1,
+            2,
             'Incorrect number of deployments'
         )
+        with open('testing_storage/deployments_to_start.jsonl') as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+        self.assertEqual(
+            session.errors,
+            [
+                'LOG:  delete from sessions;\n',
+                'LOG:  \\connect anaconda_deploy\n',
+                'LOG:  BEGIN;\n',
+                'LOG:  truncate deployments cascade;\n',
+                'LOG:  COMMIT;\n'
+            ]
+        )
 
     @mock.patch('sh.Command')
-    def test_restore_files(self, Command):
-        class temp_glob:
-            def __init__(self, path):
-                self.path = path
-                self.index = 0
-                self.paths = [
-                    'anaconda-enterprise-anaconda-platform.yml',
-                    'first.yaml',
-                    'second.yaml',
-                    'third.yaml'
-                ]
-
-            def __iter__(self):
-                return self
-
-            def __next__(self):
-                index = self.index
-                if index > 3:
-                    raise StopIteration()
-
-                self.index += 1
-                return self.paths[index]
+    def test_cleanup_postgres_db_exception(self, Command):
+        session = mock.MagicMock()
+        session.__enter__.return_value = session
+        session.query.side_effect = exceptions.PsqlCommandFailed('failed')
+        os.makedirs('testing_storage')
+        test_class = models.Accord(
+            self.setup_args_restore_default(override=True)
+        )
+        test_class.backup_directory = 'testing_storage'
+        with mock.patch('accord.models.Accord.get_postgres_docker_container'):
+            with mock.patch(
+                'accord.models.Accord.open_psql_session',
+                return_value=session
+            ):
+                with self.assertRaises(exceptions.UnableToCaptureDeployments):
+                    process.cleanup_postgres_database(test_class)
+
+        # The deployments must not be truncated without the capture
+        self.assertNotIn(
+            mock.call('truncate deployments cascade;'),
+            session.execute.call_args_list
+        )
+        self.assertEqual(os.listdir('testing_storage'), [])
 
+    @mock.patch('sh.Command')
+    def test_restore_files(self, Command):
+        restore_files = [
+            'secrets/anaconda-enterprise-anaconda-platform.yml.yaml',
+            'secrets/first.yaml',
+            'secrets/second.yaml',
+            'secrets/third.yaml'
+        ]
         Command().side_effect = [
-            'REPLACE ERROR: (NotFound)',
-            'File created',
             sh.ErrorReturnCode_1(
                 'kubectl',
-                ''.encode('utf-8'),
-                ''.encode('utf-8')
+                'secret/first replaced\n'.encode('utf-8'),
+                'Error from server (NotFound)'.encode('utf-8')
             ),
             sh.ErrorReturnCode_1(
                 'kubectl',
-                ''.encode('utf-8'),
-                ''.encode('utf-8')
-            ),
-            'file replaced'
+                'configmap "second" created\n'.encode('utf-8'),
+                'Error from server (Invalid)'.encode('utf-8')
+            )
         ]
         test_class = models.Accord(
             self.setup_args_restore_default(override=True, no_config=True)
         )
-        with mock.patch('accord.process.glob.glob', side_effect=temp_glob):
-            process.restoring_files(test_class)
+        with mock.patch(
+            'accord.process.glob.glob',
+            return_value=restore_files
+        ):
+            results = process.restoring_files(test_class)
+
+        self.assertEqual(
+            results,
+            {'first': 'replaced', 'second': 'created', 'third': 'failed'}
+        )
+        calls = [c[0] for c in Command().call_args_list]
+        self.assertEqual(
+            calls,
+            [
+                (
+                    'replace',
+                    '-f', 'secrets/first.yaml',
+                    '-f', 'secrets/second.yaml',
+                    '-f', 'secrets/third.yaml'
+                ),
+                (
+                    'create',
+                    '-f', 'secrets/second.yaml',
+                    '-f', 'secrets/third.yaml'
+                )
+            ]
+        )
+
+    @mock.patch('sh.Command')
+    def test_restore_files_batches(self, Command):
+        restore_files = [f'secrets/file-{i}.yaml' for i in range(120)]
+        Command().side_effect = lambda *args: '\n'.join(
+            f'secret/{process.restore_object_name(path)} replaced'
+            for path in args[2::2]
+        )
+        test_class = models.Accord(
+            self.setup_args_restore_default(override=True)
+        )
+        test_class.jobs = 3
+        with mock.patch(
+            'accord.process.glob.glob',
+            return_value=restore_files
+        ):
+            results = process.restoring_files(test_class)
+
+        self.assertEqual(Command().call_count, 3)
+        self.assertEqual(len(results), 120)
+        self.assertEqual(set(results.values()), {'replaced'})
 
     # Restore repository database
     @mock.patch('sh.chown', create=True)
@@ -844,3 +1803,50 @@ class TestProcess(TestCase):
         with mock.patch('accord.models.Accord.get_postgres_docker_container'):
             with mock.patch('accord.models.Accord.run_command_on_container'):
                 process.restore_repo_db(test_class)
+
+    @mock.patch('sh.chown', create=True)
+    @mock.patch('sh.Command')
+    def test_restore_repository_db_parallel(self, Command, chown):
+        os.makedirs('testing_storage/backup/all_repositories')
+        test_class = models.Accord(
+            self.setup_args_restore_default(override=True)
+        )
+        test_class.backup_directory = 'testing_storage/backup'
+        test_class.postgres_system_repo_directory_path = (
+            'testing_storage/all_repositories'
+        )
+        with mock.patch('accord.models.Accord.get_postgres_docker_container'):
+            with mock.patch(
+                'accord.models.Accord.run_command_on_container',
+                return_value=0
+            ) as run_command:
+                process.restore_repo_db(test_class)
+
+        commands = [c[0][1] for c in run_command.call_args_list]
+        self.assertEqual(len(commands), 1)
+        self.assertIn(
+            'pg_restore -U postgres --clean --if-exists --jobs=4 -d '
+            'anaconda_repository ',
+            commands[0]
+        )
+        if not os.path.isdir('testing_storage/all_repositories'):
+            assert False, 'Did not move the backup to the data volume'
+
+    @mock.patch('sh.chown', create=True)
+    @mock.patch('sh.Command')
+    def test_restore_repository_db_parallel_failed(self, Command, chown):
+        os.makedirs('testing_storage/backup/all_repositories')
+        test_class = models.Accord(
+            self.setup_args_restore_default(override=True)
+        )
+        test_class.backup_directory = 'testing_storage/backup'
+        test_class.postgres_system_repo_directory_path = (
+            'testing_storage/all_repositories'
+        )
+        with mock.patch('accord.models.Accord.get_postgres_docker_container'):
+            with mock.patch(
+                'accord.models.Accord.run_command_on_container',
+                return_value=1
+            ):
+                with self.assertRaises(exceptions.NoPostgresBackup):
+                    process.restore_repo_db(test_class)
@@ -0,0 +1,72 @@
+
+from .fixtures import process_returns
+from unittest import TestCase
+
+
+from accord import exceptions
+from accord import psql
+
+
+import logging
+import sys
+
+
+def fake_session():
+    return psql.PsqlSession([sys.executable, '-c', process_returns.FAKE_PSQL])
+
+
+class TestPsql(TestCase):
+    def setUp(self):
+        logging.disable(logging.ERROR)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_query_streams_rows(self):
+        with fake_session() as session:
+            rows = list(session.query('select 1;'))
+            session.execute('delete from sessions;')
+            again = list(session.query('select 1;'))
+
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows, again)
+        self.assertEqual(session.errors, ['LOG:  delete from sessions;\n'])
+
+    def test_transaction_commit(self):
+        with fake_session() as session:
+            with session.transaction():
+                session.execute('truncate deployments cascade;')
+
+        self.assertEqual(
+            session.errors,
+            [
+                'LOG:  BEGIN;\n',
+                'LOG:  truncate deployments cascade;\n',
+                'LOG:  COMMIT;\n'
+            ]
+        )
+
+    def test_transaction_rollback(self):
+        with fake_session() as session:
+            with self.assertRaises(ValueError):
+                with session.transaction():
+                    list(session.query('select 1;'))
+                    raise ValueError('stop')
+
+        self.assertEqual(
+            session.errors,
+            ['LOG:  BEGIN;\n', 'LOG:  ROLLBACK;\n']
+        )
+
+    def test_statement_failure(self):
+        with fake_session() as session:
+            with self.assertRaises(exceptions.PsqlCommandFailed) as error:
+                with session.transaction():
+                    session.execute('fail;')
+
+            # psql has exited so nothing else can be run
+            with self.assertRaises(exceptions.PsqlCommandFailed):
+                session.execute('select 1;')
+
+        self.assertIn('syntax error', str(error.exception))
+        self.assertEqual(session.process.returncode, 3)
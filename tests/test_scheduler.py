@@ -0,0 +1,121 @@
+
+from unittest import TestCase
+
+
+from accord import exceptions
+from accord import scheduler
+from accord import metrics
+
+
+import threading
+import logging
+import time
+
+
+class TestScheduler(TestCase):
+    def setUp(self):
+        logging.disable(logging.ERROR)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_run_stages_order(self):
+        order = []
+        stages = [
+            scheduler.Stage('first', lambda: order.append('first')),
+            scheduler.Stage(
+                'third',
+                lambda: order.append('third'),
+                depends=['first', 'second']
+            ),
+            scheduler.Stage('second', lambda: order.append('second'))
+        ]
+        scheduler.run_stages(stages, jobs=1)
+
+        self.assertEqual(order, ['first', 'second', 'third'])
+
+    def test_run_stages_parallel(self):
+        barrier = threading.Barrier(2, timeout=5)
+        stages = [
+            scheduler.Stage('first', barrier.wait),
+            scheduler.Stage('second', barrier.wait)
+        ]
+        # Both stages have to be running at once to get past the barrier
+        scheduler.run_stages(stages, jobs=2)
+
+    def test_run_stages_jobs_cap(self):
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        def stage():
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+
+            time.sleep(0.01)
+            with lock:
+                running.pop()
+
+        stages = [scheduler.Stage(str(i), stage) for i in range(6)]
+        scheduler.run_stages(stages, jobs=2)
+
+        self.assertEqual(len(peak), 6)
+        self.assertLessEqual(max(peak), 2)
+
+    def test_run_stages_failure(self):
+        order = []
+
+        def failure():
+            raise exceptions.NoPostgresBackup('failed')
+
+        stages = [
+            scheduler.Stage('first', failure),
+            scheduler.Stage(
+                'second',
+                lambda: order.append('second'),
+                depends=['first']
+            )
+        ]
+        with self.assertRaises(exceptions.NoPostgresBackup):
+            scheduler.run_stages(stages, jobs=2)
+
+        self.assertEqual(order, [])
+
+    def test_validate_unknown_dependency(self):
+        stages = [scheduler.Stage('first', None, depends=['missing'])]
+        with self.assertRaises(exceptions.InvalidStageGraph):
+            scheduler.validate_stages(stages)
+
+    def test_validate_cycle(self):
+        stages = [
+            scheduler.Stage('first', None, depends=['second']),
+            scheduler.Stage('second', None, depends=['first'])
+        ]
+        with self.assertRaises(exceptions.InvalidStageGraph):
+            scheduler.validate_stages(stages)
+
+    def test_validate_duplicate(self):
+        stages = [
+            scheduler.Stage('first', None),
+            scheduler.Stage('first', None)
+        ]
+        with self.assertRaises(exceptions.InvalidStageGraph):
+            scheduler.validate_stages(stages)
+
+    def test_run_stages_metrics(self):
+        run = metrics.RunMetrics('backup')
+
+        def fail():
+            raise ValueError('failed')
+
+        stages = [
+            scheduler.Stage('first', lambda: run.add(files=3)),
+            scheduler.Stage('second', fail, depends=['first'])
+        ]
+        with self.assertRaises(ValueError):
+            scheduler.run_stages(stages, jobs=2, metrics=run)
+
+        self.assertEqual(run.stages['first'].status, 'success')
+        self.assertEqual(run.stages['first'].files, 3)
+        self.assertEqual(run.stages['second'].status, 'failed')
@@ -0,0 +1,131 @@
+
+from unittest import TestCase
+
+
+from accord import exceptions
+from accord import sync
+
+
+import logging
+import shutil
+import mock
+import os
+
+
+class TestSync(TestCase):
+    def setUp(self):
+        logging.disable(logging.ERROR)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        shutil.rmtree('testing_sync', ignore_errors=True)
+
+    def setup_repository(self):
+        # One large channel with many packages and a few small ones
+        for channel, packages, size in [
+            ('large', 8, 256 * 1024),
+            ('small-1', 1, 1024),
+            ('small-2', 1, 1024)
+        ]:
+            for i in range(packages):
+                path = f'testing_sync/repo/{channel}/linux-64'
+                os.makedirs(path, exist_ok=True)
+                with open(f'{path}/package-{i}.tar.bz2', 'wb') as f:
+                    f.write(b'\0' * size)
+
+        with open('testing_sync/repo/index.json', 'w') as f:
+            f.write('{}')
+
+    def test_plan_shards_balanced(self):
+        self.setup_repository()
+        shards = sync.plan_shards('testing_sync/repo', 4)
+
+        self.assertEqual(len(shards), 4)
+        paths = [path for shard in shards for path in shard]
+        self.assertEqual(len(paths), len(set(paths)))
+
+        # Every file has to be covered by exactly one shard
+        covered = []
+        for path in paths:
+            full_path = f'testing_sync/repo/{path}'
+            if os.path.isdir(full_path):
+                for dirpath, _, filenames in os.walk(full_path):
+                    covered.extend(f'{dirpath}/{f}' for f in filenames)
+            else:
+                covered.append(full_path)
+
+        expected = []
+        for dirpath, _, filenames in os.walk('testing_sync/repo'):
+            expected.extend(f'{dirpath}/{f}' for f in filenames)
+
+        self.assertEqual(
+            sorted(os.path.normpath(c) for c in covered),
+            sorted(os.path.normpath(e) for e in expected)
+        )
+
+        # The large channel is split across the shards
+        weights = [
+            sum(
+                sync.tree_weight(f'testing_sync/repo/{path}')[0]
+                for path in shard
+            )
+            for shard in shards
+        ]
+        self.assertLessEqual(max(weights), 3 * 256 * 1024)
+
+    def test_plan_shards_single(self):
+        self.setup_repository()
+        shards = sync.plan_shards('testing_sync/repo', 1)
+
+        self.assertEqual(len(shards), 1)
+        self.assertEqual(
+            sorted(shards[0]),
+            ['index.json', 'large', 'small-1', 'small-2']
+        )
+
+    def test_plan_shards_walks_once(self):
+        self.setup_repository()
+        directories = sum(1 for _ in os.walk('testing_sync/repo'))
+        with mock.patch(
+            'accord.sync.os.scandir',
+            wraps=os.scandir
+        ) as scandir:
+            sync.plan_shards('testing_sync/repo', 4)
+
+        self.assertEqual(scandir.call_count, directories)
+
+    def test_write_shard_lists(self):
+        list_directory, list_paths = sync.write_shard_lists([['a', 'b/c']])
+        try:
+            with open(list_paths[0]) as f:
+                self.assertEqual(f.read(), 'a\nb/c\n')
+        finally:
+            shutil.rmtree(list_directory)
+
+    @mock.patch('accord.sync.time.sleep')
+    def test_run_shards_retry(self, sleep):
+        results = {'first': [1, 0], 'second': [0]}
+        calls = []
+
+        def run_shard(shard):
+            calls.append(shard)
+            return results[shard].pop(0)
+
+        sync.run_shards(run_shard, ['first', 'second'], 2)
+
+        self.assertEqual(sorted(calls), ['first', 'first', 'second'])
+        sleep.assert_called_once_with(sync.RETRY_DELAY)
+
+    @mock.patch('accord.sync.time.sleep')
+    def test_run_shards_failure(self, sleep):
+        calls = []
+
+        def run_shard(shard):
+            calls.append(shard)
+            return 0 if shard == 'good' else 23
+
+        with self.assertRaises(exceptions.UnableToSync):
+            sync.run_shards(run_shard, ['good', 'bad'], 2)
+
+        self.assertEqual(calls.count('bad'), sync.SYNC_RETRIES)
+        self.assertEqual(calls.count('good'), 1)
@@ -0,0 +1,124 @@
+from unittest import TestCase
+
+
+from accord import trace
+
+
+from concurrent import futures
+import subprocess
+import logging
+import shutil
+import json
+import os
+
+
+class TestTrace(TestCase):
+    def setUp(self):
+        logging.disable(logging.ERROR)
+        os.makedirs('testing_trace', exist_ok=True)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        trace.stop()
+        shutil.rmtree('testing_trace', ignore_errors=True)
+
+    def spans(self, tracer):
+        return [e for e in tracer.events if e['ph'] == 'X']
+
+    def test_span_without_tracer(self):
+        with trace.span('nothing'):
+            pass
+
+        self.assertIsNone(trace.tracer)
+
+    def test_span_records_event(self):
+        tracer = trace.start()
+        with trace.span('extract-archive', 'stage', files=3):
+            pass
+
+        span = self.spans(tracer)[0]
+        self.assertEqual(span['name'], 'extract-archive')
+        self.assertEqual(span['cat'], 'stage')
+        self.assertEqual(span['args'], {'files': 3})
+        self.assertEqual(span['pid'], os.getpid())
+        self.assertGreaterEqual(span['dur'], 0)
+
+    def test_span_records_error(self):
+        tracer = trace.start()
+        with self.assertRaises(ValueError):
+            with trace.span('failing'):
+                raise ValueError('broken')
+
+        self.assertEqual(self.spans(tracer)[0]['args'], {'error': 'broken'})
+
+    def test_traced_function(self):
+        @trace.traced
+        def scale_postgres_pod(count):
+            return count
+
+        self.assertEqual(scale_postgres_pod(1), 1)
+        tracer = trace.start()
+        self.assertEqual(scale_postgres_pod(0), 0)
+        self.assertEqual(
+            [s['name'] for s in self.spans(tracer)],
+            ['scale_postgres_pod']
+        )
+
+    def test_threads_have_their_own_track(self):
+        tracer = trace.start()
+
+        def work(number):
+            with trace.span(f'shard {number}'):
+                pass
+
+        with futures.ThreadPoolExecutor(max_workers=2) as pool:
+            list(pool.map(work, range(4)))
+
+        threads = [e for e in tracer.events if e['ph'] == 'M']
+        self.assertEqual(
+            {e['tid'] for e in threads},
+            {e['tid'] for e in self.spans(tracer)}
+        )
+        self.assertEqual(len(threads), len({e['tid'] for e in threads}))
+
+    def test_command_span(self):
+        original_run = subprocess.run
+        tracer = trace.start()
+        with trace.command_span(['/usr/bin/rsync', '-aq', 'src/'], shard=1):
+            subprocess.run(['true'])
+
+        trace.stop()
+        self.assertIs(subprocess.run, original_run)
+        self.assertEqual(
+            [(s['name'], s['cat'], s['args']) for s in self.spans(tracer)],
+            [
+                (
+                    'rsync',
+                    'command',
+                    {'command': '/usr/bin/rsync -aq src/', 'shard': 1}
+                )
+            ]
+        )
+
+    def test_write(self):
+        trace.start()
+        with trace.span('backup'):
+            pass
+
+        trace.stop('testing_trace/trace.json')
+        self.assertIsNone(trace.tracer)
+        with open('testing_trace/trace.json') as f:
+            written = json.load(f)
+
+        self.assertEqual(
+            [e['name'] for e in written['traceEvents']],
+            ['thread_name', 'backup']
+        )
+        self.assertEqual(os.listdir('testing_trace'), ['trace.json'])
+
+    def test_command_line_is_shortened(self):
+        self.assertEqual(
+            trace.command_line(['rsync', 'a' * 300]),
+            ('rsync ' + 'a' * 300)[:trace.MAX_COMMAND_LENGTH]
+        )
+        self.assertEqual(trace.command_name('/usr/bin/kubectl get'), 'kubectl')